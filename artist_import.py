@@ -0,0 +1,176 @@
+import asyncio
+import csv
+import io
+import os
+import zipfile
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from rendering import split_message
+
+# Categorie ammesse, nella forma salvata dal wizard di /artisti
+CATEGORIES = ("giovani promesse", "sogno nel cassetto")
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+REQUIRED_COLUMNS = ("nome", "età", "canzone", "categoria")
+# Limite per foto dopo la decompressione (difesa da archivi malformati)
+MAX_PHOTO_BYTES = 20 * 1024 * 1024
+
+
+class LineupError(ValueError):
+    """Archivio o CSV non utilizzabile nel suo insieme."""
+
+
+@dataclass
+class ImportRow:
+    line: int
+    nome: str
+    eta: Optional[int]
+    canzone: str
+    categoria: str
+    foto: str
+    errors: List[str] = field(default_factory=list)
+    url: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def artist(self) -> dict:
+        return {"nome": self.nome, "età": self.eta, "foto": self.url, "canzone": self.canzone, "categoria": self.categoria}
+
+
+def _photo_key(name: str) -> str:
+    return os.path.basename(name).strip().lower()
+
+
+def read_archive(data: bytes) -> Tuple[Optional[bytes], Dict[str, bytes]]:
+    """Legge lo ZIP: restituisce il CSV contenuto (se presente) e le foto per
+    nome di file in minuscolo, senza cartelle."""
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise LineupError("Il file non è un archivio ZIP valido.")
+    csv_data = None
+    photos: Dict[str, bytes] = {}
+    with archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or "__MACOSX" in name or _photo_key(name).startswith("."):
+                continue
+            extension = os.path.splitext(name)[1].lower()
+            if extension == ".csv":
+                if csv_data is not None:
+                    raise LineupError("L'archivio contiene più di un file CSV.")
+                csv_data = archive.read(info)
+            elif extension in PHOTO_EXTENSIONS:
+                if info.file_size > MAX_PHOTO_BYTES:
+                    raise LineupError(f"La foto {os.path.basename(name)} supera i {MAX_PHOTO_BYTES // (1024 * 1024)} MB.")
+                key = _photo_key(name)
+                if key in photos:
+                    raise LineupError(f"Due foto con lo stesso nome nell'archivio: {os.path.basename(name)}")
+                photos[key] = archive.read(info)
+    return csv_data, photos
+
+
+def _find_photo(value: str, nome: str, photos: Dict[str, bytes]) -> Optional[str]:
+    # Colonna "foto" col nome del file, altrimenti un file chiamato come l'artista
+    if value:
+        key = _photo_key(value)
+        return key if key in photos else None
+    for extension in PHOTO_EXTENSIONS:
+        key = f"{nome.lower()}{extension}"
+        if key in photos:
+            return key
+    return None
+
+
+def parse_rows(csv_data: bytes, photos: Dict[str, bytes], existing_names: Iterable[str] = ()) -> List[ImportRow]:
+    """Valida tutte le righe del CSV (nome, età, canzone, categoria e
+    facoltativamente foto) prima di qualsiasi upload."""
+    try:
+        text = csv_data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise LineupError("Il CSV deve essere codificato in UTF-8.")
+    try:
+        # Excel in italiano esporta con ';'
+        dialect = csv.Sniffer().sniff(text.split("\n", 1)[0], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(io.StringIO(text), dialect)
+    header = next(reader, None)
+    if not header:
+        raise LineupError("Il CSV è vuoto.")
+    columns = [name.strip().lower() for name in header]
+    columns = ["età" if name == "eta" else name for name in columns]
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        raise LineupError(f"Colonne mancanti nel CSV: {', '.join(missing)}")
+
+    seen = {name.strip().lower() for name in existing_names}
+    rows: List[ImportRow] = []
+    for line, values in enumerate(reader, start=2):
+        if not any(value.strip() for value in values):
+            continue
+        record = {name: value.strip() for name, value in zip(columns, values)}
+        row = ImportRow(
+            line=line,
+            nome=record.get("nome", ""),
+            eta=None,
+            canzone=record.get("canzone", ""),
+            categoria=record.get("categoria", "").lower(),
+            foto="",
+        )
+        if not row.nome:
+            row.errors.append("nome mancante")
+        elif row.nome.lower() in seen:
+            row.errors.append("artista già presente")
+        seen.add(row.nome.lower())
+        try:
+            row.eta = int(record.get("età", ""))
+        except ValueError:
+            row.errors.append("l'età deve essere un numero intero")
+        if not row.canzone:
+            row.errors.append("canzone mancante")
+        if row.categoria not in CATEGORIES:
+            row.errors.append(f"categoria non valida ({' / '.join(CATEGORIES)})")
+        photo = _find_photo(record.get("foto", ""), row.nome, photos)
+        if photo is None:
+            row.errors.append("foto non trovata nell'archivio")
+        else:
+            row.foto = photo
+        rows.append(row)
+    if not rows:
+        raise LineupError("Il CSV non contiene artisti.")
+    return rows
+
+
+async def upload_photos(
+    rows: List[ImportRow],
+    photos: Dict[str, bytes],
+    ingest: Callable[[bytes], Awaitable[str]],
+    concurrency: int,
+) -> None:
+    """Carica in parallelo (al massimo `concurrency` alla volta) le foto delle
+    righe valide; un upload fallito segna solo la sua riga."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def upload(row: ImportRow) -> None:
+        async with semaphore:
+            try:
+                row.url = await ingest(photos[row.foto])
+            except Exception as e:
+                row.errors.append(f"caricamento della foto fallito: {e}")
+
+    await asyncio.gather(*(upload(row) for row in rows if row.ok))
+
+
+def report(rows: List[ImportRow], header: str) -> List[str]:
+    """Esito riga per riga, diviso in messaggi entro il limite di Telegram."""
+    lines = [header]
+    for row in rows:
+        if row.ok:
+            lines.append(f"✅ Riga {row.line}: {row.nome}")
+        else:
+            lines.append(f"❌ Riga {row.line}: {row.nome or '?'} — {'; '.join(row.errors)}")
+    # Testo semplice, senza MarkdownV2
+    return split_message("\n".join(lines), markdown=False)
@@ -0,0 +1,110 @@
+import importlib
+import json
+import logging
+import os
+import re
+import tempfile
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_KEY = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def _sort_key(artist_key: str):
+    # artist2 prima di artist10
+    match = re.search(r"(\d+)$", artist_key)
+    return (artist_key[:match.start()], int(match.group(1))) if match else (artist_key, -1)
+
+
+class ArtistStore:
+    """Catalogo degli artisti su disco: un file JSON per artista in `directory`.
+
+    Ogni scrittura riguarda solo l'artista modificato ed è atomica (file
+    temporaneo nella stessa cartella, fsync e rename): un crash lascia il
+    vecchio record o il nuovo, mai un file troncato. È la copia locale del
+    nodo "artists" del backend e viene aggiornata dallo stesso flush.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, artist_key: str) -> str:
+        if not _KEY.match(artist_key):
+            raise ValueError(f"Chiave artista non valida: {artist_key!r}")
+        return os.path.join(self.directory, f"{artist_key}.json")
+
+    def load(self) -> Dict[str, dict]:
+        if not os.path.isdir(self.directory):
+            return {}
+        artists = {}
+        for name in os.listdir(self.directory):
+            artist_key, extension = os.path.splitext(name)
+            if extension != ".json" or not _KEY.match(artist_key):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    artists[artist_key] = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Record dell'artista {artist_key} illeggibile, ignorato: {e}")
+        return {key: artists[key] for key in sorted(artists, key=_sort_key)}
+
+    def put(self, artist_key: str, artist: dict) -> None:
+        path = self._path(artist_key)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{artist_key}.", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(artist, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def delete(self, artist_key: str) -> None:
+        try:
+            os.unlink(self._path(artist_key))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def changes(paths: Iterable[str], artists: Dict[str, dict]) -> Tuple[bool, Dict[str, Optional[dict]]]:
+        """Dai percorsi di un flush del writer: (catalogo intero?, {chiave: copia
+        del record attuale, None se rimosso}). Va chiamata nel thread dell'event
+        loop, prima di passare il risultato ad `apply` in un altro thread."""
+        paths = list(paths)
+        if "artists" in paths:
+            return True, {key: dict(artist) for key, artist in artists.items()}
+        records: Dict[str, Optional[dict]] = {}
+        for path in paths:
+            head, _, rest = path.partition("/")
+            if head == "artists" and rest:
+                # anche 'artists/<chiave>/<campo>' riscrive il record completo
+                artist_key = rest.split("/", 1)[0]
+                artist = artists.get(artist_key)
+                records[artist_key] = dict(artist) if artist is not None else None
+        return False, records
+
+    def apply(self, replace: bool, records: Dict[str, Optional[dict]]) -> None:
+        for artist_key, artist in records.items():
+            if artist is None:
+                self.delete(artist_key)
+            else:
+                self.put(artist_key, artist)
+        if replace:
+            for artist_key in set(self.load()) - set(records):
+                self.delete(artist_key)
+
+
+def load_legacy_profiles(module: str = "profili") -> Optional[Dict[str, dict]]:
+    """Catalogo iniziale da profili.py, letto solo se non ci sono altri dati."""
+    try:
+        return dict(importlib.import_module(module).artists)
+    except (ImportError, AttributeError) as e:
+        logger.warning(f"Catalogo iniziale {module}.py non disponibile: {e}")
+        return None
@@ -0,0 +1,97 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from rendering import escape
+
+SCORES = range(1, 11)
+# Callback compatti, senza testo libero da interpretare:
+#   bp<n>:<voto>            voto popolare per artist<n>
+#   bt<n>:<ambito>:<voto>   voto tecnico (in bozza) per un ambito di artist<n>
+#   bc<n>                   conferma della scheda tecnica di artist<n>
+#   bn                      intestazione di un ambito, nessuna azione
+CALLBACK_PATTERN = r"^b(p\d{1,6}:\d{1,2}|t\d{1,6}:\d:\d{1,2}|c\d{1,6}|n)$"
+_CALLBACK = re.compile(r"^b(?:p(?P<popular>\d{1,6}):(?P<vote>\d{1,2})|t(?P<technical>\d{1,6}):(?P<ambito>\d):(?P<score>\d{1,2})|c(?P<confirm>\d{1,6})|n)$")
+_ARTIST_KEY = re.compile(r"^artist(\d{1,6})$")
+
+
+@dataclass(frozen=True)
+class BallotAction:
+    kind: str  # "popolare", "tecnica", "conferma" o "nessuna"
+    artist_key: str = ""
+    ambito: int = 0
+    score: int = 0
+
+
+def parse_callback(data: str, ambiti_count: int) -> Optional[BallotAction]:
+    """Azione di un bottone della scheda, None se i dati non sono validi."""
+    match = _CALLBACK.match(data or "")
+    if match is None:
+        return None
+    if match.group("popular"):
+        value = int(match.group("vote"))
+        return BallotAction("popolare", f"artist{int(match.group('popular'))}", 0, value) if value in SCORES else None
+    if match.group("technical"):
+        ambito, value = int(match.group("ambito")), int(match.group("score"))
+        if ambito >= ambiti_count or value not in SCORES:
+            return None
+        return BallotAction("tecnica", f"artist{int(match.group('technical'))}", ambito, value)
+    if match.group("confirm"):
+        return BallotAction("conferma", f"artist{int(match.group('confirm'))}")
+    return BallotAction("nessuna")
+
+
+def artist_number(artist_key: str) -> Optional[int]:
+    """Numero dell'artista usato nei callback; None per chiavi fuori schema (solo voto via messaggio)."""
+    match = _ARTIST_KEY.match(artist_key)
+    return int(match.group(1)) if match else None
+
+
+def _score_rows(prefix: str, selected: Optional[float] = None) -> List[List[InlineKeyboardButton]]:
+    buttons = [
+        InlineKeyboardButton(f"✅{value}" if selected == value else str(value), callback_data=f"{prefix}:{value}")
+        for value in SCORES
+    ]
+    return [buttons[:5], buttons[5:]]
+
+
+def popular_keyboard(artist_key: str) -> Optional[InlineKeyboardMarkup]:
+    number = artist_number(artist_key)
+    if number is None:
+        return None
+    return InlineKeyboardMarkup(_score_rows(f"bp{number}"))
+
+
+def technical_keyboard(artist_key: str, ambiti: Sequence[str], draft: Sequence[Optional[float]] = ()) -> Optional[InlineKeyboardMarkup]:
+    """Per ogni ambito un'intestazione con la scelta attuale e i voti 1-10, in fondo la conferma."""
+    number = artist_number(artist_key)
+    if number is None:
+        return None
+    draft = list(draft) or [None] * len(ambiti)
+    rows: List[List[InlineKeyboardButton]] = []
+    for index, ambito in enumerate(ambiti):
+        current = draft[index]
+        rows.append([InlineKeyboardButton(f"🔽 {ambito}: {current if current is not None else '—'}", callback_data="bn")])
+        rows.extend(_score_rows(f"bt{number}:{index}", current))
+    rows.append([InlineKeyboardButton("📨 Conferma il voto", callback_data=f"bc{number}")])
+    return InlineKeyboardMarkup(rows)
+
+
+@lru_cache(maxsize=1024)
+def ballot_keyboard(artist_key: str, jury_type: str, ambiti: Tuple[str, ...]) -> Optional[InlineKeyboardMarkup]:
+    """Tastiera iniziale allegata al profilo dell'artista, uguale per tutti i giudici della giuria."""
+    if jury_type == "tecnica":
+        return technical_keyboard(artist_key, ambiti)
+    return popular_keyboard(artist_key)
+
+
+def tally(ambiti: Sequence[str], draft: Sequence[Optional[float]]) -> str:
+    """Riepilogo in MarkdownV2 della scheda tecnica in compilazione."""
+    lines = [
+        f"{'✅' if value is not None else '▫️'} {escape(ambito)}\\: *{escape(str(value)) if value is not None else '—'}*"
+        for ambito, value in zip(ambiti, draft)
+    ]
+    return "\n\n" + "\n".join(lines)
@@ -0,0 +1,228 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import httpx
+from telegram.error import NetworkError, TelegramError
+from telegram.request import BaseRequest, RequestData
+
+from metrics import Counter, InstrumentedRequest
+
+logger = logging.getLogger(__name__)
+
+# Priorità degli invii: i critici (profili, risultati, risposte ai giudici) non
+# vengono mai scartati, le notifiche sì quando la Bot API è in difficoltà
+CRITICAL = "critical"
+NOTIFICATION = "notification"
+_priority: ContextVar[str] = ContextVar("bot_send_priority", default=CRITICAL)
+# Chat dell'update in elaborazione: i messaggi inviati a quella chat sono risposte
+_reply_chat: ContextVar[Optional[int]] = ContextVar("bot_reply_chat", default=None)
+# Ritentativi gestiti dal chiamante (Broadcaster): un solo tentativo, 429 compresi
+_caller_retries: ContextVar[bool] = ContextVar("bot_caller_retries", default=False)
+
+# Metodi ripetibili dopo un errore di rete o un 5xx senza effetti doppi
+IDEMPOTENT_PREFIXES = ("get", "edit", "delete", "set", "answerCallbackQuery")
+# Errori httpx che garantiscono che la richiesta non è partita: ripetibili per ogni metodo
+_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+@contextmanager
+def send_priority(priority: str) -> Iterator[None]:
+    """Le chiamate alla Bot API fatte nel blocco hanno la priorità indicata."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@contextmanager
+def replying_to(chat_id: Optional[int]) -> Iterator[None]:
+    """Gli invii a `chat_id` fatti nel blocco contano come risposte a quella chat."""
+    token = _reply_chat.set(chat_id)
+    try:
+        yield
+    finally:
+        _reply_chat.reset(token)
+
+
+@contextmanager
+def caller_retries() -> Iterator[None]:
+    """Nel blocco ogni chiamata alla Bot API fa un solo tentativo: errori e
+    RetryAfter arrivano al chiamante, che ritenta con il proprio controllo di flusso."""
+    token = _caller_retries.set(True)
+    try:
+        yield
+    finally:
+        _caller_retries.reset(token)
+
+
+class SendShed(TelegramError):
+    """Invio scartato: circuito verso la Bot API aperto o troppe risposte alla stessa chat."""
+
+
+class CircuitBreaker:
+    """Si apre dopo `failure_threshold` errori consecutivi (rete, 5xx, 429): per
+    `reset_timeout` secondi gli invii non critici vengono scartati subito, quelli
+    critici continuano e fanno da sonda. Passato il timeout passa un invio non
+    critico di prova; il primo successo richiude il circuito."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self, priority: str) -> bool:
+        if priority == CRITICAL or self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Prova: un solo invio, poi il circuito resta aperto fino all'esito
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("Bot API di nuovo raggiungibile: circuito chiuso, notifiche riattivate")
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold and self.opened_at is None:
+            self.opened_at = time.monotonic()
+            logger.warning(f"Bot API in difficoltà ({self.failures} errori consecutivi): notifiche sospese per {self.reset_timeout:.0f}s")
+
+
+def _retry_after(payload: bytes) -> Optional[float]:
+    try:
+        return float(json.loads(payload)["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class ResilientRequest(InstrumentedRequest):
+    """Client HTTP condiviso dall'Application per tutte le chiamate alla Bot API.
+
+    - pool di connessioni keep-alive dimensionato per il fan-out dei profili e
+      timeout di lettura per metodo (upload e download più lunghi);
+    - i 429 degli invii critici vengono ritentati qui dopo il retry_after
+      (con jitter, se non supera `max_retry_after`); gli errori di rete e i 5xx
+      solo per i metodi idempotenti o se la richiesta non è partita; dentro
+      `caller_retries` (i broadcast) nessun ritentativo: li fa il chiamante;
+    - gli invii non critici (NOTIFICATION) non vengono ritentati e, a circuito
+      aperto, sono scartati con SendShed prima di occupare una connessione;
+    - le risposte alla chat dell'update in elaborazione passano da `reply_gate`
+      e, se la chat ha esaurito la sua quota, sono scartate con SendShed.
+    """
+
+    def __init__(
+        self,
+        latency,
+        errors: Counter,
+        retries: Counter,
+        shed: Counter,
+        breaker: CircuitBreaker,
+        max_attempts: int = 4,
+        max_retry_after: float = 30.0,
+        method_read_timeouts: Optional[Dict[str, float]] = None,
+        keepalive_expiry: float = 30.0,
+        connection_pool_size: int = 256,
+        reply_gate: Optional[Callable[[int], bool]] = None,
+        **kwargs,
+    ):
+        limits = httpx.Limits(
+            max_connections=connection_pool_size,
+            max_keepalive_connections=connection_pool_size,
+            keepalive_expiry=keepalive_expiry,
+        )
+        super().__init__(
+            latency, errors, connection_pool_size=connection_pool_size, httpx_kwargs={"limits": limits}, **kwargs
+        )
+        self.retries = retries
+        self.shed = shed
+        self.breaker = breaker
+        self.max_attempts = max_attempts
+        self.max_retry_after = max_retry_after
+        self.method_read_timeouts = method_read_timeouts or {}
+        self.reply_gate = reply_gate
+
+    @staticmethod
+    def _retryable(api_method: str, error: Exception) -> bool:
+        return api_method.startswith(IDEMPOTENT_PREFIXES) or isinstance(error.__cause__, _NOT_SENT)
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        priority = _priority.get()
+        if not self.breaker.allow(priority):
+            self.shed.inc(method=api_method, reason="circuito")
+            raise SendShed(f"{api_method} scartato: Bot API in difficoltà")
+        reply_chat = _reply_chat.get()
+        if (
+            reply_chat is not None and self.reply_gate is not None and api_method.startswith("send")
+            and request_data is not None and request_data.parameters.get("chat_id") == reply_chat
+            and not self.reply_gate(reply_chat)
+        ):
+            self.shed.inc(method=api_method, reason="risposte")
+            raise SendShed(f"{api_method} scartato: troppe risposte alla chat {reply_chat}")
+        if read_timeout is BaseRequest.DEFAULT_NONE and api_method in self.method_read_timeouts:
+            read_timeout = self.method_read_timeouts[api_method]
+
+        single = priority != CRITICAL or _caller_retries.get()
+        attempt = 0
+        while True:
+            attempt += 1
+            last = single or attempt >= self.max_attempts
+            try:
+                code, payload = await super().do_request(
+                    url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout
+                )
+            except NetworkError as e:
+                self.breaker.record_failure()
+                if last or not self._retryable(api_method, e):
+                    raise
+                reason = type(e).__name__
+                delay = min(2 ** attempt, 10) * random.uniform(0.5, 1.0)
+            else:
+                if code == 429:
+                    self.breaker.record_failure()
+                    wait = _retry_after(payload)
+                    if last or wait is None or wait > self.max_retry_after:
+                        # RetryAfter arriva al chiamante (es. il Broadcaster mette in pausa il bucket)
+                        return code, payload
+                    reason = "429"
+                    delay = wait + random.uniform(0, 1)
+                elif code >= 500:
+                    self.breaker.record_failure()
+                    if last or not api_method.startswith(IDEMPOTENT_PREFIXES):
+                        return code, payload
+                    reason = str(code)
+                    delay = min(2 ** attempt, 10) * random.uniform(0.5, 1.0)
+                else:
+                    # Anche un 400/403 dimostra che la Bot API risponde
+                    self.breaker.record_success()
+                    return code, payload
+            self.retries.inc(method=api_method, reason=reason)
+            logger.warning(f"Bot API {api_method}: {reason}, tentativo {attempt}/{self.max_attempts}, nuovo invio tra {delay:.1f}s")
+            await asyncio.sleep(delay)
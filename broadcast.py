@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Iterable, Optional
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from bot_client import caller_retries, replying_to
+
+logger = logging.getLogger(__name__)
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Secondi di attesa richiesti da Telegram (int o timedelta a seconda della versione)."""
+    value = error.retry_after
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+class TokenBucket:
+    """Token bucket asincrono: `rate` token al secondo, burst massimo `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self) -> None:
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        # Usato dopo un RetryAfter: nessun token disponibile per `seconds`
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+@dataclass
+class Delivery:
+    chat_id: int
+    status: str = "pending"
+    attempts: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class BroadcastReport:
+    label: str
+    deliveries: Dict[int, Delivery] = field(default_factory=dict)
+    started: float = field(default_factory=time.monotonic)
+    duration: float = 0.0
+
+    @property
+    def sent(self) -> int:
+        return sum(1 for d in self.deliveries.values() if d.status == "sent")
+
+    @property
+    def failed(self) -> int:
+        return sum(1 for d in self.deliveries.values() if d.status == "failed")
+
+    @property
+    def retries(self) -> int:
+        return sum(d.retries for d in self.deliveries.values())
+
+    def summary(self) -> str:
+        slowest = max((d.elapsed for d in self.deliveries.values() if d.status == "sent"), default=0.0)
+        return (
+            f"{self.label}: consegnati {self.sent}/{len(self.deliveries)}, "
+            f"falliti {self.failed}, ritentativi {self.retries}, "
+            f"ultima consegna dopo {slowest:.1f}s (totale {self.duration:.1f}s)"
+        )
+
+
+class Broadcaster:
+    """Invia lo stesso contenuto a molte chat in parallelo, rispettando il
+    limite globale e quello per chat dei Bot API e gestendo i RetryAfter.
+    È l'unico livello di ritentativi per i suoi invii: il client HTTP fa un
+    solo tentativo, così un RetryAfter mette in pausa il bucket globale invece
+    di tenere occupato un posto del semaforo."""
+
+    def __init__(self, rate: float = 25, per_chat_rate: float = 1, concurrency: int = 20, max_attempts: int = 5):
+        self.bucket = TokenBucket(rate, rate)
+        self.per_chat_rate = per_chat_rate
+        self.max_attempts = max_attempts
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self.reports: Deque[BroadcastReport] = deque(maxlen=20)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                # I bucket pieni non hanno storia utile: si possono scartare
+                self._chat_buckets = {k: b for k, b in self._chat_buckets.items() if not b.full}
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, 3)
+        return bucket
+
+    async def throttle(self, chat_id: int) -> None:
+        """Attende che il limite per chat e quello globale consentano un invio a `chat_id`."""
+        await self._chat_bucket(chat_id).acquire()
+        await self.bucket.acquire()
+
+    async def deliver(self, chat_id: int, send: Callable[[int], Awaitable], delivery: Delivery, started: float) -> None:
+        async with self._semaphore:
+            while delivery.attempts < self.max_attempts:
+                await self.throttle(chat_id)
+                if delivery.attempts:
+                    delivery.retries += 1
+                delivery.attempts += 1
+                try:
+                    await send(chat_id)
+                    delivery.status = "sent"
+                    delivery.error = None
+                    break
+                except RetryAfter as e:
+                    wait = retry_after_seconds(e)
+                    logger.warning(f"RetryAfter {wait}s durante l'invio a {chat_id}")
+                    self.bucket.pause(wait)
+                    delivery.error = str(e)
+                except (BadRequest, Forbidden) as e:
+                    # Errori definitivi (chat bloccata, contenuto non valido): inutile ritentare
+                    delivery.error = str(e)
+                    break
+                except NetworkError as e:
+                    delivery.error = str(e)
+                    if delivery.attempts < self.max_attempts:
+                        await asyncio.sleep(min(2 ** delivery.attempts, 30) * random.uniform(0.5, 1.0))
+                except Exception as e:
+                    delivery.error = str(e)
+                    break
+            if delivery.status != "sent":
+                delivery.status = "failed"
+                logger.error(f"Invio a {chat_id} fallito dopo {delivery.attempts} tentativi: {delivery.error}")
+            delivery.elapsed = time.monotonic() - started
+
+    async def broadcast(self, chat_ids: Iterable[int], send: Callable[[int], Awaitable], label: str, quiet: bool = False) -> BroadcastReport:
+        """Invia a tutte le chat e restituisce il report di consegna per chat."""
+        report = BroadcastReport(label=label)
+        # Copia: gli insiemi di giudici/proprietari possono cambiare durante l'invio
+        for chat_id in list(chat_ids):
+            report.deliveries[chat_id] = Delivery(chat_id)
+        # Un broadcast non è mai una risposta, nemmeno quando parte dall'update di un destinatario
+        with replying_to(None), caller_retries():
+            await asyncio.gather(*(
+                self.deliver(chat_id, send, delivery, report.started)
+                for chat_id, delivery in report.deliveries.items()
+            ))
+        report.duration = time.monotonic() - report.started
+        self.reports.append(report)
+        if quiet:
+            logger.debug(report.summary())
+        else:
+            logger.info(report.summary())
+        return report
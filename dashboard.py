@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional
+
+from telegram import Bot
+from telegram.constants import ParseMode
+from telegram.error import BadRequest
+
+from bot_client import NOTIFICATION, send_priority
+from broadcast import Broadcaster
+
+logger = logging.getLogger(__name__)
+
+
+class LiveDashboard:
+    """Un messaggio per proprietario, modificato in place con lo stato della
+    votazione. Gli eventi che arrivano a raffica vengono raccolti in un'unica
+    modifica, al massimo una ogni `min_interval` secondi."""
+
+    def __init__(
+        self,
+        bot: Bot,
+        broadcaster: Broadcaster,
+        render: Callable[[List[str]], str],
+        owners: Callable[[], Iterable[int]],
+        min_interval: float = 3.0,
+        max_events: int = 5,
+    ):
+        self.bot = bot
+        self.broadcaster = broadcaster
+        self.render = render
+        self.owners = owners
+        self.min_interval = min_interval
+        self.events: Deque[str] = deque(maxlen=max_events)
+        self._message_ids: Dict[int, int] = {}
+        self._last_text: Dict[int, str] = {}
+        self._last_refresh = 0.0
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+    def push(self, event: Optional[str] = None) -> None:
+        """Registra un evento (già in MarkdownV2) e programma un aggiornamento."""
+        if event:
+            self.events.appendleft(event)
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    def reset(self) -> None:
+        """Al prossimo aggiornamento invia un nuovo messaggio invece di modificare il vecchio."""
+        self._message_ids.clear()
+        self._last_text.clear()
+        self.events.clear()
+
+    def forget_owner(self, owner_id: int) -> None:
+        self._message_ids.pop(owner_id, None)
+        self._last_text.pop(owner_id, None)
+
+    async def _refresh_loop(self) -> None:
+        while self._dirty:
+            wait = self._last_refresh + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._dirty = False
+            self._last_refresh = time.monotonic()
+            try:
+                # La dashboard si riallinea al refresh successivo: può essere sospesa
+                with send_priority(NOTIFICATION):
+                    await self._refresh()
+            except Exception as e:
+                logger.error(f"Errore nell'aggiornamento della dashboard: {e}")
+
+    async def _refresh(self) -> None:
+        text = self.render(list(self.events))
+
+        async def update_owner(owner_id: int):
+            if self._last_text.get(owner_id) == text:
+                return
+            message_id = self._message_ids.get(owner_id)
+            if message_id is not None:
+                try:
+                    await self.bot.edit_message_text(text, chat_id=owner_id, message_id=message_id, parse_mode=ParseMode.MARKDOWN_V2)
+                    self._last_text[owner_id] = text
+                    return
+                except BadRequest as e:
+                    if "not modified" in str(e).lower():
+                        self._last_text[owner_id] = text
+                        return
+                    # Messaggio cancellato o troppo vecchio: se ne invia uno nuovo
+                    logger.warning(f"Dashboard del proprietario {owner_id} non modificabile, nuovo messaggio: {e}")
+            message = await self.bot.send_message(chat_id=owner_id, text=text, parse_mode=ParseMode.MARKDOWN_V2)
+            self._message_ids[owner_id] = message.message_id
+            self._last_text[owner_id] = text
+
+        await self.broadcaster.broadcast(self.owners(), update_owner, "Dashboard", quiet=True)
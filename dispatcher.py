@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, TypeVar
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from bot_client import replying_to
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Elabora in parallelo gli update di chat diverse mantenendo l'ordine di
+    arrivo all'interno della stessa chat (un lock FIFO per chat). Durante
+    l'elaborazione gli invii alla chat dell'update contano come risposte.
+
+    Il lock della chat si prende prima di uno dei `max_concurrent_updates`
+    posti di elaborazione: gli update che aspettano il proprio turno non
+    occupano posti, così una raffica da una chat non ferma le altre. Il
+    semaforo della classe base (acquisito da PTB prima di tutto) conta solo gli
+    update estratti dalla coda, già limitati a `max_in_flight` dalla coda stessa.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_in_flight: int):
+        super().__init__(max(max_concurrent_updates, max_in_flight))
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self.processing = 0
+        # chat_id -> [lock, update in attesa o in elaborazione]
+        self._chats: Dict[Hashable, List[Any]] = {}
+
+    @staticmethod
+    def _chat_key(update: object) -> Optional[Hashable]:
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return ("user", update.effective_user.id)
+        return None
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._chats)
+
+    async def _run(self, coroutine: Awaitable[Any]) -> None:
+        async with self._slots:
+            self.processing += 1
+            try:
+                await coroutine
+            finally:
+                self.processing -= 1
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._chat_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                with replying_to(key if isinstance(key, int) else None):
+                    await self._run(coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chats[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+class StateTransactions:
+    """Unico punto di scrittura per lo stato condiviso in bot_data.
+
+    Ogni modifica è una funzione sincrona eseguita da `apply` sotto un lock:
+    controllo e scrittura (es. "ha già votato?" e registrazione del voto)
+    avvengono senza await in mezzo, quindi due update elaborati in parallelo
+    non possono perdere o duplicare un voto.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self.applied = 0
+
+    async def apply(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        async with self._lock:
+            self.applied += 1
+            return fn(*args, **kwargs)
@@ -0,0 +1,119 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import random
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Optional, Sequence
+
+from telegram import Bot, PhotoSize
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_image(data: bytes, max_side: int, quality: int, image_format: str) -> bytes:
+    """Ruota secondo l'orientamento EXIF, ridimensiona entro `max_side` pixel e
+    ricodifica senza metadati. Gira in un processo separato (CPU-bound)."""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode != "RGB" and not (image_format == "WEBP" and image.mode == "RGBA"):
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        options = {"quality": quality}
+        if image_format == "JPEG":
+            options.update(optimize=True, progressive=True)
+        else:
+            options["method"] = 4
+        # Nessun exif/icc_profile passato a save(): i metadati non vengono copiati
+        output = io.BytesIO()
+        image.save(output, image_format, **options)
+        return output.getvalue()
+
+
+class ImagePipeline:
+    """Foto ricevute da Telegram -> immagine normalizzata su Cloudinary.
+
+    Scarica la PhotoSize più grande in modo asincrono, la ridimensiona e
+    ricomprime con Pillow in un pool di processi e carica il risultato
+    con `upload` (coroutine che restituisce la risposta di Cloudinary),
+    ritentando con backoff se l'upload fallisce o scade. Tutti i tentativi
+    usano lo stesso public_id con overwrite: un upload scaduto ma ancora in
+    corso nel suo thread non lascia un asset duplicato.
+    """
+
+    def __init__(
+        self,
+        upload: Callable[..., Awaitable[dict]],
+        max_side: int = 1280,
+        quality: int = 85,
+        image_format: str = "JPEG",
+        workers: int = 1,
+        upload_attempts: int = 3,
+        download_timeout: float = 30,
+        upload_timeout: float = 60,
+    ):
+        self.upload = upload
+        self.max_side = max_side
+        self.quality = quality
+        self.image_format = image_format.upper()
+        self.workers = workers
+        self.upload_attempts = upload_attempts
+        self.download_timeout = download_timeout
+        self.upload_timeout = upload_timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # forkserver: i worker non ereditano thread e stato del processo del bot
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload([__name__])
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self._pool
+
+    async def download(self, bot: Bot, photos: Sequence[PhotoSize]) -> bytes:
+        largest = max(photos, key=lambda p: p.width * p.height)
+        file = await bot.get_file(largest.file_id, read_timeout=self.download_timeout)
+        return bytes(await file.download_as_bytearray(read_timeout=self.download_timeout))
+
+    async def normalize(self, data: bytes) -> bytes:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self._executor(), normalize_image, data, self.max_side, self.quality, self.image_format
+        )
+        logger.info(f"Immagine normalizzata: {len(data) // 1024} KB -> {len(result) // 1024} KB")
+        return result
+
+    async def upload_with_retry(self, data: bytes, folder: str) -> str:
+        public_id = uuid.uuid4().hex
+        for attempt in range(1, self.upload_attempts + 1):
+            try:
+                result = await self.upload(
+                    io.BytesIO(data), folder=folder, public_id=public_id, overwrite=True,
+                    resource_type="image", timeout=self.upload_timeout,
+                )
+                url = result.get("secure_url")
+                if not url:
+                    raise ValueError("Caricamento su Cloudinary fallito, nessun URL restituito.")
+                return url
+            except Exception as e:
+                if attempt == self.upload_attempts:
+                    raise
+                delay = min(2 ** attempt, 10) * random.uniform(0.5, 1)
+                logger.warning(f"Upload su Cloudinary fallito (tentativo {attempt}/{self.upload_attempts}): {e}. Nuovo tentativo tra {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def ingest(self, bot: Bot, photos: Sequence[PhotoSize], folder: str) -> str:
+        """Scarica, normalizza e carica la foto; restituisce l'URL sicuro su Cloudinary."""
+        data = await self.download(bot, photos)
+        return await self.ingest_data(data, folder)
+
+    async def ingest_data(self, data: bytes, folder: str) -> str:
+        """Come `ingest`, per un'immagine già in memoria (es. estratta da un archivio)."""
+        return await self.upload_with_retry(await self.normalize(data), folder)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
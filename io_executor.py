@@ -0,0 +1,81 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class IOExecutor:
+    """Esegue le chiamate bloccanti (Firebase, Cloudinary) in un thread pool
+    dedicato, con un limite di concorrenza e un timeout per ogni backend.
+
+    Gli handler fanno `await io.run("cloudinary", func, ...)` e l'event loop
+    del webhook non resta mai bloccato sull'I/O remoto.
+    """
+
+    def __init__(self, limits: Dict[str, int], timeouts: Dict[str, float], warn_interval: float = 30.0):
+        self.limits = dict(limits)
+        self.timeouts = dict(timeouts)
+        self.warn_interval = warn_interval
+        # Un worker per ogni slot: nessun backend resta senza thread liberi
+        self._pool = ThreadPoolExecutor(max_workers=sum(self.limits.values()), thread_name_prefix="io")
+        self._semaphores = {name: asyncio.Semaphore(limit) for name, limit in self.limits.items()}
+        self._active = {name: 0 for name in self.limits}
+        self._waiting = {name: 0 for name in self.limits}
+        self._timeouts_count = {name: 0 for name in self.limits}
+        self._last_warning = {name: float("-inf") for name in self.limits}
+
+    async def run(self, backend: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        semaphore = self._semaphores[backend]
+        # Un solo avviso per intervallo: sotto carico il pool resta saturo a lungo
+        now = time.monotonic()
+        if semaphore.locked() and now - self._last_warning[backend] >= self.warn_interval:
+            self._last_warning[backend] = now
+            logger.warning(f"Pool I/O '{backend}' saturo ({self.limits[backend]} chiamate attive, {self._waiting[backend] + 1} in attesa)")
+        self._waiting[backend] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[backend] -= 1
+        self._active[backend] += 1
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        try:
+            future = loop.run_in_executor(self._pool, call)
+        except RuntimeError:
+            # Pool già chiuso (spegnimento in corso)
+            self._active[backend] -= 1
+            semaphore.release()
+            raise
+        # Il posto si libera quando il thread ha davvero finito, anche dopo un
+        # timeout: una chiamata appesa continua a occupare il suo worker
+        future.add_done_callback(functools.partial(self._release, backend))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeouts[backend])
+        except asyncio.TimeoutError:
+            self._timeouts_count[backend] += 1
+            raise TimeoutError(f"Chiamata {backend} scaduta dopo {self.timeouts[backend]}s")
+
+    def _release(self, backend: str, future: asyncio.Future) -> None:
+        self._active[backend] -= 1
+        self._semaphores[backend].release()
+        if not future.cancelled():
+            # Esito di una chiamata scaduta: nessuno lo attende più
+            future.exception()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {
+                "limit": self.limits[name],
+                "active": self._active[name],
+                "waiting": self._waiting[name],
+                "timeouts": self._timeouts_count[name],
+            }
+            for name in self.limits
+        }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,633 @@
+"""Test di carico del webhook.
+
+Avvia l'app aiohttp reale di main.py con la Bot API di Telegram e il Realtime
+Database di Firebase sostituiti da due server stub locali (latenza ed errori
+configurabili), poi simula una serata: i giudici fanno /start e inseriscono la
+password, un giudice invia una raffica di messaggi (le altre chat devono
+essere servite senza aspettarla), il proprietario apre i turni, tutti votano e
+infine si chiudono le votazioni. Per ogni scenario riporta throughput e p50/p95/p99 del tempo tra
+la POST dell'update e la risposta del bot.
+
+Esempio:
+    python loadtest.py --popolare 200 --tecnica 20 --rounds 3 --api-latency-ms 40
+"""
+import argparse
+import asyncio
+import hashlib
+import importlib
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import ClientSession, web
+
+BOT_USER = {"id": 999999, "is_bot": True, "first_name": "Sakura", "username": "sakura_loadtest_bot"}
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Percentile nearest-rank di una lista (0 se vuota)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+@dataclass
+class Scenario:
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    timeouts: int = 0
+    duration: float = 0.0
+
+    def row(self) -> Dict[str, Any]:
+        done = len(self.latencies)
+        return {
+            "scenario": self.name,
+            "updates": done + self.timeouts,
+            "timeouts": self.timeouts,
+            "throughput": round(done / self.duration, 1) if self.duration else 0.0,
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(self.latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 1),
+            "max_ms": round(max(self.latencies, default=0.0) * 1000, 1),
+        }
+
+
+# --- stub della Bot API ------------------------------------------------------
+
+class BotApiStub:
+    """Risponde ai metodi della Bot API usati dal bot e notifica le risposte
+    dirette a ciascuna chat, così il driver può misurarne la latenza."""
+
+    CHAT_METHODS = {"sendMessage", "sendPhoto", "sendDocument", "editMessageText", "editMessageCaption"}
+
+    def __init__(self, latency: float, jitter: float, error_rate: float, retry_after: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self._message_id = 1000
+        self._file_id = 0
+        self._waiters: Dict[int, List[Tuple[Callable[[str, dict], bool], asyncio.Future]]] = {}
+
+    def expect(self, chat_id: int, match: Optional[Callable[[str, dict], bool]] = None) -> asyncio.Future:
+        """Future risolta (con il messaggio inviato) alla prima risposta a `chat_id` che soddisfa `match`."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append((match or (lambda method, message: True), future))
+        return future
+
+    def _deliver(self, chat_id: int, method: str, message: dict) -> None:
+        waiters = self._waiters.get(chat_id, [])
+        for entry in waiters:
+            match, future = entry
+            if future.done():
+                continue
+            if match(method, message):
+                future.set_result(message)
+                waiters.remove(entry)
+                return
+
+    def _message(self, method: str, params: Dict[str, Any]) -> dict:
+        self._message_id += 1
+        chat_id = int(params["chat_id"])
+        message = {
+            "message_id": int(params.get("message_id") or self._message_id),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        if "caption" in params:
+            message["caption"] = params["caption"]
+        if method == "sendPhoto":
+            self._file_id += 1
+            message["photo"] = [{"file_id": f"stub-photo-{self._file_id}", "file_unique_id": f"u{self._file_id}", "width": 800, "height": 800}]
+        if "reply_markup" in params:
+            message["reply_markup"] = json.loads(params["reply_markup"])
+        return message
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = {key: value for key, value in (await request.post()).items() if isinstance(value, str)}
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors[method] += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        if method == "getMe":
+            result: Any = BOT_USER
+        elif method == "getWebhookInfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        elif method in self.CHAT_METHODS:
+            result = self._message(method, params)
+            self._deliver(result["chat"]["id"], method, result)
+        else:
+            # setWebhook, answerCallbackQuery, deleteMessage, ...
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+
+# --- stub del Realtime Database ---------------------------------------------
+
+class FirebaseStub:
+    """Sottoinsieme dell'API REST del Realtime Database usato da firebase_admin
+    (GET anche con ETag, PATCH multi-path, PUT anche condizionale e stream SSE
+    degli eventi), con l'albero tenuto in memoria."""
+
+    def __init__(self, latency: float, error_rate: float, initial: dict):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.tree: dict = initial
+        self.reads = 0
+        self.writes = 0
+        self.write_bytes = 0
+        self.errors = 0
+        self.conflicts = 0
+        # Stream aperti: (chiavi del nodo ascoltato, coda degli eventi)
+        self._streams: List[Tuple[List[str], asyncio.Queue]] = []
+
+    @staticmethod
+    def _node(tree: dict, keys: List[str], create: bool) -> Optional[dict]:
+        for key in keys:
+            if not isinstance(tree.get(key), dict):
+                if not create:
+                    return None
+                tree[key] = {}
+            tree = tree[key]
+        return tree
+
+    def _set(self, keys: List[str], value: Any) -> None:
+        parent = self._node(self.tree, keys[:-1], create=value is not None)
+        if parent is None:
+            return
+        if value is None:
+            parent.pop(keys[-1], None)
+        else:
+            parent[keys[-1]] = value
+
+    def _get(self, keys: List[str]) -> Any:
+        node = self.tree
+        for key in keys:
+            node = node.get(key) if isinstance(node, dict) else None
+        return node
+
+    @staticmethod
+    def _etag(value: Any) -> str:
+        return hashlib.sha1(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+    def _notify(self, event_type: str, keys: List[str], data: Any) -> None:
+        for prefix, queue in self._streams:
+            if keys[:len(prefix)] == prefix:
+                queue.put_nowait((event_type, "/" + "/".join(keys[len(prefix):]), data))
+
+    def put(self, keys: List[str], value: Any) -> None:
+        """Scrittura diretta sull'albero, come da un'altra replica del bot."""
+        self._set(keys, value)
+        self._notify("put", keys, value)
+
+    async def _stream(self, request: web.Request, keys: List[str]) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        queue: asyncio.Queue = asyncio.Queue()
+        queue.put_nowait(("put", "/", self._get(keys)))
+        stream = (keys, queue)
+        self._streams.append(stream)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                event_type, path, data = event
+                payload = json.dumps({"path": path, "data": data})
+                await response.write(f"event: {event_type}\ndata: {payload}\n\n".encode())
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self._streams.remove(stream)
+        return response
+
+    async def _close_streams(self, app: web.Application) -> None:
+        for _, queue in self._streams:
+            queue.put_nowait(None)
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        await asyncio.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"error": "stub unavailable"}, status=503)
+
+        path = request.match_info["path"]
+        keys = [key for key in path[:-len(".json")].split("/") if key]
+        if request.method == "GET":
+            if request.headers.get("Accept") == "text/event-stream":
+                return await self._stream(request, keys)
+            self.reads += 1
+            node = self._get(keys)
+            if request.headers.get("X-Firebase-ETag") == "true":
+                return web.json_response(node, headers={"ETag": self._etag(node)})
+            return web.json_response(node)
+
+        body = await request.read()
+        self.writes += 1
+        self.write_bytes += len(body)
+        if request.method == "PUT":
+            current = self._get(keys)
+            expected = request.headers.get("if-match")
+            if expected is not None and expected != self._etag(current):
+                self.conflicts += 1
+                return web.json_response(current, status=412, headers={"ETag": self._etag(current)})
+            value = json.loads(body)
+            self.put(keys, value)
+            return web.json_response(value, headers={"ETag": self._etag(value)})
+        data = json.loads(body)
+        for sub_path, value in data.items():
+            self._set(keys + [key for key in sub_path.split("/") if key], value)
+        self._notify("patch", keys, data)
+        if request.query.get("print") == "silent":
+            return web.Response(status=204)
+        return web.json_response(json.loads(body))
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=32 * 1024 ** 2)
+        app.router.add_route("GET", "/{path:.*\\.json}", self.handle)
+        app.router.add_route("PATCH", "/{path:.*\\.json}", self.handle)
+        app.router.add_route("PUT", "/{path:.*\\.json}", self.handle)
+        app.on_shutdown.append(self._close_streams)
+        return app
+
+
+# --- driver -----------------------------------------------------------------
+
+class LoadDriver:
+    """Invia al webhook update sintetici e misura il tempo fino alla risposta."""
+
+    def __init__(self, session: ClientSession, webhook_url: str, api: BotApiStub, reply_timeout: float):
+        self.session = session
+        self.webhook_url = webhook_url
+        self.api = api
+        self.reply_timeout = reply_timeout
+        self._update_id = 0
+        self._message_id = 0
+        self.ack_latencies: List[float] = []
+        self.http_status: Counter = Counter()
+
+    def _user(self, chat_id: int) -> dict:
+        return {"id": chat_id, "is_bot": False, "first_name": f"Giudice{chat_id}"}
+
+    def text_update(self, chat_id: int, text: str) -> dict:
+        self._update_id += 1
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": f"Giudice{chat_id}"},
+            "from": self._user(chat_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": self._update_id, "message": message}
+
+    def callback_update(self, chat_id: int, data: str, message: dict) -> dict:
+        self._update_id += 1
+        return {
+            "update_id": self._update_id,
+            "callback_query": {
+                "id": str(self._update_id),
+                "from": self._user(chat_id),
+                "chat_instance": str(chat_id),
+                "data": data,
+                "message": message,
+            },
+        }
+
+    async def post(self, update: dict) -> None:
+        start = time.perf_counter()
+        async with self.session.post(self.webhook_url, json=update) as response:
+            await response.read()
+            self.http_status[response.status] += 1
+        self.ack_latencies.append(time.perf_counter() - start)
+
+    async def request(self, scenario: Scenario, chat_id: int, update: dict,
+                      match: Optional[Callable[[str, dict], bool]] = None) -> Optional[dict]:
+        """Invia un update e attende la risposta del bot a `chat_id`; registra la latenza."""
+        reply = self.api.expect(chat_id, match)
+        start = time.perf_counter()
+        await self.post(update)
+        return await self.wait(scenario, reply, start)
+
+    async def wait(self, scenario: Scenario, reply: asyncio.Future, start: float) -> Optional[dict]:
+        try:
+            message = await asyncio.wait_for(reply, self.reply_timeout)
+        except asyncio.TimeoutError:
+            scenario.timeouts += 1
+            return None
+        scenario.latencies.append(time.perf_counter() - start)
+        return message
+
+
+async def run_scenario(scenario: Scenario, jobs) -> list:
+    """Esegue in parallelo gli update di uno scenario; la durata si somma tra i turni."""
+    started = time.perf_counter()
+    results = await asyncio.gather(*jobs)
+    scenario.duration += time.perf_counter() - started
+    return results
+
+
+def text_contains(fragment: str, methods=("sendMessage",)) -> Callable[[str, dict], bool]:
+    return lambda method, message: method in methods and fragment in (message.get("text") or "")
+
+
+def seed_tree(artists: int) -> dict:
+    return {"bot_data": {
+        "artists": {
+            f"artist{i}": {
+                "nome": f"Artista {i}",
+                "età": 20 + i,
+                "canzone": f"Canzone {i}",
+                "categoria": "Giovani Promesse" if i % 2 else "Emergenti",
+                "foto": f"https://res.cloudinary.com/demo/image/upload/v1/artisti/artista{i}.jpg",
+            }
+            for i in range(1, artists + 1)
+        },
+    }}
+
+
+async def run(args) -> dict:
+    api = BotApiStub(args.api_latency_ms / 1000, args.api_jitter_ms / 1000, args.api_error_rate, args.api_retry_after)
+    firebase = FirebaseStub(args.firebase_latency_ms / 1000, args.firebase_error_rate, seed_tree(args.artists))
+
+    runners = []
+
+    async def serve(app: web.Application) -> int:
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        runners.append(runner)
+        return runner.addresses[0][1]
+
+    api_port = await serve(api.app())
+    firebase_port = await serve(firebase.app())
+
+    # main.py legge la configurazione all'import: l'ambiente va preparato prima
+    os.environ["TOKEN"] = args.token
+    os.environ["WEBHOOK_URL"] = "http://127.0.0.1"
+    os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{api_port}/bot"
+    os.environ["STORAGE_BACKEND"] = "firebase"
+    os.environ["FIREBASE_DATABASE_URL"] = f"http://127.0.0.1:{firebase_port}/?ns=loadtest"
+    os.environ.pop("GOOGLE_APPLICATION_CREDENTIALS", None)
+    # Catalogo artisti locale in una cartella temporanea, non in quella di lavoro
+    os.environ["ARTISTS_DIR"] = tempfile.mkdtemp(prefix="sakura-artisti-")
+    os.environ["SHARED_STATE"] = "1" if args.shared_state else "0"
+    # I giudici simulati votano molto più in fretta di quelli veri: la quota di
+    # risposte per chat non deve scartare le loro (il filtro in ingresso li esenta già)
+    os.environ.setdefault("REPLY_LIMIT", "1000")
+    # Configurato prima dell'import, così il basicConfig di main.py non ha effetto
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    import main as bot
+
+    async def start_bot():
+        bot_app = bot.create_web_app()
+        bot_runner = web.AppRunner(bot_app)
+        await bot_runner.setup()
+        bot_site = web.TCPSite(bot_runner, "127.0.0.1", 0)
+        await bot_site.start()
+        await bot_app["warm_up"]
+        return bot_runner, bot_runner.addresses[0][1]
+
+    bot_runner, bot_port = await start_bot()
+
+    owner = 1
+    popolare = [100000 + i for i in range(args.popolare)]
+    tecnica = [200000 + i for i in range(args.tecnica)]
+    judges = popolare + tecnica
+    scenarios: List[Scenario] = []
+    started = time.perf_counter()
+
+    async with ClientSession() as session:
+        driver = LoadDriver(session, f"http://127.0.0.1:{bot_port}{bot.WEBHOOK_PATH}", api, args.reply_timeout)
+
+        async def login(scenario: Scenario, chat_id: int, password: str) -> None:
+            await driver.request(scenario, chat_id, driver.text_update(chat_id, "/start"), lambda m, msg: m in ("sendMessage", "sendPhoto"))
+            await driver.request(scenario, chat_id, driver.text_update(chat_id, password))
+
+        owner_login = Scenario("login proprietario")
+        await run_scenario(owner_login, [login(owner_login, owner, bot.PASSWORD_OWNER)])
+        logins = Scenario("login giudici")
+        await run_scenario(logins, [login(logins, chat_id, bot.PASSWORD_POPOLARE) for chat_id in popolare]
+                           + [login(logins, chat_id, bot.PASSWORD_TECNICA) for chat_id in tecnica])
+        scenarios += [owner_login, logins]
+        if args.restart:
+            # Riavvio dopo i login: conversazioni e sessioni devono tornare dal backend,
+            # senza che giudici e proprietario reinseriscano la password
+            await bot_runner.cleanup()
+            bot = importlib.reload(bot)
+            bot_runner, bot_port = await start_bot()
+            driver.webhook_url = f"http://127.0.0.1:{bot_port}{bot.WEBHOOK_PATH}"
+
+        if args.flood and len(judges) > 1:
+            # Un giudice invia una raffica di messaggi mentre gli altri ne inviano uno:
+            # la raffica si smaltisce in ordine, ma non deve far aspettare le altre chat
+            flooder, others = judges[0], judges[1:]
+            flood = Scenario("raffica da una chat")
+            others_scenario = Scenario("altre chat")
+            invalid = text_contains("numero valido")
+            replies = [api.expect(flooder, invalid) for _ in range(args.flood)]
+            start = time.perf_counter()
+            for _ in range(args.flood):
+                await driver.post(driver.text_update(flooder, "x"))
+            await asyncio.gather(
+                run_scenario(flood, [driver.wait(flood, future, start) for future in replies]),
+                run_scenario(others_scenario, [
+                    driver.request(others_scenario, chat_id, driver.text_update(chat_id, "x"), invalid) for chat_id in others
+                ]),
+            )
+            scenarios += [flood, others_scenario]
+            flood_seconds = max(flood.latencies, default=0.0)
+            if others_scenario.timeouts or max(others_scenario.latencies, default=0.0) > flood_seconds / 2:
+                raise RuntimeError(
+                    f"Le altre chat hanno aspettato la raffica: max {max(others_scenario.latencies, default=0.0):.2f} s "
+                    f"su {flood_seconds:.2f} s di raffica ({others_scenario.timeouts} timeout)"
+                )
+
+        panel_scenario = Scenario("pannello /votazioni")
+        panel_message, = await run_scenario(panel_scenario, [
+            driver.request(panel_scenario, owner, driver.text_update(owner, "/votazioni"), text_contains("abbiano inizio"))
+        ])
+        scenarios.append(panel_scenario)
+        if panel_message is None:
+            raise RuntimeError("Il pannello /votazioni non è arrivato: impossibile aprire i turni")
+
+        open_round = Scenario("apertura turno")
+        fanout = Scenario("profilo ai giudici")
+        votes = Scenario("voti")
+        close_round = Scenario("chiusura turno")
+        artist_keys = list(firebase.tree["bot_data"]["artists"])
+        parallel = max(1, args.parallel)
+        for batch_start in range(0, args.rounds, parallel):
+            batch = [artist_keys[i % len(artist_keys)] for i in range(batch_start, min(batch_start + parallel, args.rounds))]
+            # Profilo ricevuto da ogni giudice per ogni artista: serve per i voti a bottoni
+            received: Dict[Tuple[int, str], dict] = {}
+            for artist_key in batch:
+                # Il profilo arriva ai giudici in background: si misura dalla POST del bottone del proprietario
+                profiles = [api.expect(chat_id) for chat_id in judges]
+                start = time.perf_counter()
+                _, messages = await asyncio.gather(
+                    run_scenario(open_round, [driver.request(
+                        open_round, owner, driver.callback_update(owner, artist_key, panel_message), text_contains("Votazioni aperte"),
+                    )]),
+                    run_scenario(fanout, [driver.wait(fanout, future, start) for future in profiles]),
+                )
+                received.update(((chat_id, artist_key), message) for chat_id, message in zip(judges, messages))
+
+            async def vote(chat_id: int, ballots: int) -> None:
+                for _ in range(ballots):
+                    await driver.request(votes, chat_id, driver.text_update(chat_id, str(random.randint(1, 10))))
+
+            async def vote_buttons(chat_id: int, technical: bool) -> None:
+                # Un tocco per la giuria popolare; per la tecnica un tocco per ambito e la conferma
+                for artist_key in batch:
+                    profile = received.get((chat_id, artist_key))
+                    if profile is None:
+                        continue
+                    number = artist_key[len("artist"):]
+                    taps = [f"bt{number}:{i}:{random.randint(1, 10)}" for i in range(len(bot.TECHNICAL_AMBITI))] + [f"bc{number}"] \
+                        if technical else [f"bp{number}:{random.randint(1, 10)}"]
+                    for data in taps:
+                        await driver.request(votes, chat_id, driver.callback_update(chat_id, data, profile))
+
+            # Con più turni aperti ogni giudice vota gli artisti uno dopo l'altro
+            if args.buttons:
+                await run_scenario(votes, [vote_buttons(chat_id, False) for chat_id in popolare]
+                                   + [vote_buttons(chat_id, True) for chat_id in tecnica])
+            else:
+                await run_scenario(votes, [vote(chat_id, len(batch)) for chat_id in popolare]
+                                   + [vote(chat_id, len(batch) * len(bot.TECHNICAL_AMBITI)) for chat_id in tecnica])
+            if parallel > 1:
+                await run_scenario(close_round, [driver.request(
+                    close_round, owner, driver.callback_update(owner, f"close_{artist_key}", panel_message),
+                    text_contains("Votazioni chiuse", methods=("editMessageText",)),
+                ) for artist_key in batch])
+        scenarios += [open_round, fanout, votes]
+        if args.shared_state:
+            # Voto scritto da un'altra replica: deve arrivare a questa tramite lo stream
+            foreign_judge = 300000
+            firebase.put(["bot_data", "votes_popolare", artist_keys[0], str(foreign_judge)], 7)
+            for _ in range(50):
+                if bot.vote_store.get_popular(artist_keys[0], foreign_judge) == 7:
+                    break
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("Il voto scritto da un'altra replica non è arrivato al bot")
+        if close_round.latencies:
+            scenarios.append(close_round)
+
+        stop = Scenario("chiusura votazioni")
+        await run_scenario(stop, [driver.request(
+            stop, owner, driver.callback_update(owner, "stop_voting", panel_message),
+            text_contains("Votazioni interrotte", methods=("editMessageText",)),
+        )])
+        scenarios.append(stop)
+
+        async with session.get(f"http://127.0.0.1:{bot_port}/queue") as response:
+            queue_stats = await response.json()
+        async with session.get(f"http://127.0.0.1:{bot_port}/io") as response:
+            io_stats = await response.json()
+
+    total = time.perf_counter() - started
+    # on_cleanup esegue l'ultimo flush del writer sul Firebase simulato
+    await bot_runner.cleanup()
+    for runner in runners:
+        await runner.cleanup()
+
+    return {
+        "scenarios": [scenario.row() for scenario in scenarios],
+        "webhook_ack": {
+            "count": len(driver.ack_latencies),
+            "p50_ms": round(percentile(driver.ack_latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(driver.ack_latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(driver.ack_latencies, 99) * 1000, 1),
+            "status": dict(driver.http_status),
+        },
+        "bot_api": {"calls": dict(api.calls), "errors": dict(api.errors)},
+        "firebase": {"reads": firebase.reads, "writes": firebase.writes, "write_bytes": firebase.write_bytes, "errors": firebase.errors,
+                     "conflicts": firebase.conflicts},
+        "queue": queue_stats,
+        "io": io_stats,
+        "total_seconds": round(total, 2),
+    }
+
+
+def print_report(report: dict) -> None:
+    header = f"{'scenario':<22}{'update':>8}{'timeout':>9}{'upd/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for row in report["scenarios"]:
+        print(
+            f"{row['scenario']:<22}{row['updates']:>8}{row['timeouts']:>9}{row['throughput']:>9}"
+            f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}"
+        )
+    ack = report["webhook_ack"]
+    print(f"\nRisposta HTTP del webhook: p50 {ack['p50_ms']} ms, p95 {ack['p95_ms']} ms, p99 {ack['p99_ms']} ms, stati {ack['status']}")
+    print(f"Bot API: {report['bot_api']['calls']} (errori simulati: {report['bot_api']['errors']})")
+    print(f"Firebase: {report['firebase']}")
+    print(f"Coda update: {report['queue']}")
+    print(f"Totale: {report['total_seconds']} s")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Test di carico del webhook con Bot API e Firebase simulati")
+    parser.add_argument("--popolare", type=int, default=100, help="giudici della giuria popolare")
+    parser.add_argument("--tecnica", type=int, default=10, help="giudici della giuria tecnica")
+    parser.add_argument("--artists", type=int, default=4, help="artisti nel catalogo iniziale")
+    parser.add_argument("--rounds", type=int, default=2, help="turni di votazione aperti dal proprietario")
+    parser.add_argument("--parallel", type=int, default=1, help="turni aperti contemporaneamente (poi chiusi uno per uno)")
+    parser.add_argument("--api-latency-ms", type=float, default=30, help="latenza media della Bot API simulata")
+    parser.add_argument("--api-jitter-ms", type=float, default=10, help="variazione casuale della latenza della Bot API")
+    parser.add_argument("--api-error-rate", type=float, default=0.0, help="frazione di chiamate Bot API che rispondono 429")
+    parser.add_argument("--api-retry-after", type=int, default=1, help="retry_after (s) dei 429 simulati")
+    parser.add_argument("--firebase-latency-ms", type=float, default=50, help="latenza di ogni richiesta a Firebase")
+    parser.add_argument("--firebase-error-rate", type=float, default=0.0, help="frazione di richieste Firebase che rispondono 503")
+    parser.add_argument("--buttons", action="store_true", help="voti con la scheda a bottoni invece che via messaggio")
+    parser.add_argument("--shared-state", action="store_true", help="modalità a più repliche (transazioni, voti condizionali, stream)")
+    parser.add_argument("--restart", action="store_true", help="riavvia il bot dopo i login dei giudici")
+    parser.add_argument("--flood", type=int, default=200, help="messaggi della raffica da una sola chat (0 per saltarla)")
+    parser.add_argument("--reply-timeout", type=float, default=30, help="attesa massima (s) della risposta a un update")
+    parser.add_argument("--token", default="123456:LOADTEST", help="token fittizio del bot")
+    parser.add_argument("--json", metavar="FILE", help="salva il report anche in JSON")
+    parser.add_argument("--verbose", action="store_true", help="mostra i log del bot")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
@@ -1,20 +1,40 @@
+import time
+_PROCESS_STARTED = time.perf_counter()
 import logging
 import json
 import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
-from telegram.ext import Application, CommandHandler, MessageHandler, ConversationHandler, CallbackQueryHandler, ContextTypes, filters
+from telegram.ext import Application, CommandHandler, MessageHandler, ConversationHandler, CallbackQueryHandler, TypeHandler, ContextTypes, filters
 from telegram.constants import ParseMode
-from telegram.helpers import escape_markdown
+from telegram.error import BadRequest
 from text import get_benvenuto_popolare_text, get_benvenuto_tecnica_text, get_benvenuto_prop_text, welcome_text
-from profili import artists
 import asyncio
 from dotenv import load_dotenv
 from aiohttp import web
-import cloudinary
-import cloudinary.uploader
-import firebase_admin
-from firebase_admin import credentials, db
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+from persistence import WriteBehindWriter, BotStatePersistence
+from io_executor import IOExecutor
+from broadcast import Broadcaster
+from media_cache import send_cached_photo, drop_cached_photo
+from scores import ScoreBoard
+from vote_store import VoteStore
+from artist_store import ArtistStore, load_legacy_profiles
+from shared_state import SharedState, member_ids, split_event
+from dashboard import LiveDashboard
+from update_queue import TimedUpdateQueue, UpdateIngress
+from dispatcher import PerChatUpdateProcessor, StateTransactions
+from sessions import SessionRegistry
+from storage import StorageBackend, create_storage
+from startup import StartupTimer
+from image_pipeline import ImagePipeline
+from artist_import import LineupError, ImportRow, read_archive, parse_rows, upload_photos, report
+from rendering import ArtistCards, escape, user_link, score, render_standings, split_message
+from results_export import ResultsExporter, results_snapshot
+from ballots import CALLBACK_PATTERN as BALLOT_PATTERN, ballot_keyboard, parse_callback, tally, technical_keyboard
+from metrics import MetricsRegistry, SIZE_BUCKETS, timed
+from bot_client import CircuitBreaker, ResilientRequest, SendShed, NOTIFICATION, send_priority
+from throttle import IngressThrottle
+_IMPORTS_DONE = time.perf_counter()
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -35,13 +55,62 @@ logger.info(f"WEBHOOK_URL: {WEBHOOK_URL}")
 logger.info(f"WEBHOOK_PATH: {WEBHOOK_PATH}")
 logger.info(f"FULL_WEBHOOK: {FULL_WEBHOOK}")
 
-# Cloudinary Configuration
-cloudinary.config(
-  cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME"),
-  api_key = os.getenv("CLOUDINARY_API_KEY"),
-  api_secret = os.getenv("CLOUDINARY_API_SECRET")
+# Cloudinary viene importato e configurato solo al primo upload/destroy
+_cloudinary_uploader = None
+
+def cloudinary_uploader():
+    global _cloudinary_uploader
+    if _cloudinary_uploader is None:
+        import cloudinary
+        import cloudinary.uploader
+        cloudinary.config(
+          cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME"),
+          api_key = os.getenv("CLOUDINARY_API_KEY"),
+          api_secret = os.getenv("CLOUDINARY_API_SECRET")
+        )
+        _cloudinary_uploader = cloudinary.uploader
+    return _cloudinary_uploader
+
+async def cloudinary_call(operation: str, *args, **kwargs):
+    """Esegue cloudinary.uploader.<operation> sul pool I/O misurandone la durata."""
+    with cloudinary_seconds.time(operation=operation):
+        return await io_executor.run("cloudinary", getattr(cloudinary_uploader(), operation), *args, **kwargs)
+
+# Foto caricate: lato massimo (px), qualità e formato dopo la normalizzazione, processi
+# dedicati al ridimensionamento e tentativi di upload
+image_pipeline = ImagePipeline(
+    upload=lambda data, **options: cloudinary_call("upload", data, **options),
+    max_side=int(os.getenv("IMAGE_MAX_SIDE", 1280)),
+    quality=int(os.getenv("IMAGE_QUALITY", 85)),
+    image_format=os.getenv("IMAGE_FORMAT", "JPEG"),
+    workers=int(os.getenv("IMAGE_WORKERS", 1)),
+    upload_attempts=int(os.getenv("IMAGE_UPLOAD_ATTEMPTS", 3)),
+    upload_timeout=float(os.getenv("CLOUDINARY_TIMEOUT", 60)),
 )
 
+# Import della scaletta: foto caricate in parallelo e dimensione massima dei documenti
+# scaricabili dalla Bot API
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", 4))
+MAX_DOCUMENT_BYTES = 20 * 1024 * 1024
+
+# Esportazione dei risultati (CSV/XLSX e grafici) generata in processi dedicati
+results_exporter = ResultsExporter(workers=int(os.getenv("EXPORT_WORKERS", 1)))
+
+def destroy_cloudinary_image_later(context: ContextTypes.DEFAULT_TYPE, url: str) -> None:
+    """Elimina in background un'immagine di Cloudinary non più referenziata."""
+    public_id = get_public_id_from_url(url)
+    if not public_id:
+        return
+
+    async def destroy():
+        try:
+            await cloudinary_call("destroy", public_id)
+            logger.info(f"Immagine {public_id} eliminata da Cloudinary.")
+        except Exception as e:
+            logger.error(f"Errore durante l'eliminazione dell'immagine {public_id} da Cloudinary: {e}")
+
+    context.application.create_task(destroy())
+
 # Stati della ConversationHandler
 # Stati principali
 MAIN_MENU = 0
@@ -67,14 +136,139 @@ PASSWORD_POPOLARE = "1234"
 PASSWORD_TECNICA = "5678"
 PASSWORD_OWNER = "9999"
 
+# Backend di persistenza: "firebase" (Realtime Database) oppure "sqlite" (file locale in WAL)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firebase")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "sakura.db")
+
+# Intervallo (ms) con cui il writer write-behind raggruppa le scritture sul backend
+PERSIST_FLUSH_MS = int(os.getenv("PERSIST_FLUSH_MS", 500))
+
+# Pool per le chiamate bloccanti: concorrenza massima e timeout (s) per backend
+io_executor = IOExecutor(
+    limits={
+        "storage": int(os.getenv("STORAGE_CONCURRENCY", 4)),
+        "cloudinary": int(os.getenv("CLOUDINARY_CONCURRENCY", 3)),
+    },
+    timeouts={
+        "storage": float(os.getenv("STORAGE_TIMEOUT", 15)),
+        "cloudinary": float(os.getenv("CLOUDINARY_TIMEOUT", 60)),
+    },
+)
+
+# Coda degli update ricevuti dal webhook: dimensione massima, attesa (s) quando è
+# piena prima di rispondere 503 e numero di update_id ricordati per scartare i duplicati
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+UPDATE_QUEUE_FULL_WAIT = float(os.getenv("UPDATE_QUEUE_FULL_WAIT", 1))
+UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", 10000))
+
+# Numero massimo di update elaborati in parallelo (sempre in ordine all'interno di una chat)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", 64))
+# Update estratti dalla coda e non ancora completati (in elaborazione o in attesa
+# del turno della propria chat): oltre restano in coda e vale il limite UPDATE_QUEUE_SIZE
+UPDATE_IN_FLIGHT = int(os.getenv("UPDATE_IN_FLIGHT", UPDATE_CONCURRENCY * 4))
+
+# Metriche esposte su /metrics (formato Prometheus)
+metrics = MetricsRegistry()
+handler_seconds = metrics.histogram("sakura_handler_seconds", "Durata degli handler del bot", ["handler", "outcome"])
+webhook_seconds = metrics.histogram("sakura_webhook_seconds", "Durata delle richieste al webhook", ["status"])
+storage_write_seconds = metrics.histogram("sakura_storage_write_seconds", "Durata dei salvataggi sul backend", ["backend", "outcome"])
+storage_write_bytes = metrics.histogram("sakura_storage_write_bytes", "Dimensione dei salvataggi sul backend", ["backend"], SIZE_BUCKETS)
+storage_load_seconds = metrics.histogram("sakura_storage_load_seconds", "Durata del caricamento dello stato", ["backend", "outcome"])
+storage_load_bytes = metrics.histogram("sakura_storage_load_bytes", "Dimensione dello stato caricato", ["backend"], SIZE_BUCKETS)
+bot_api_seconds = metrics.histogram("sakura_bot_api_seconds", "Durata delle chiamate alla Bot API", ["method"])
+bot_api_errors = metrics.counter("sakura_bot_api_errors_total", "Chiamate alla Bot API fallite", ["method", "reason"])
+bot_api_retries = metrics.counter("sakura_bot_api_retries_total", "Chiamate alla Bot API ritentate dal client", ["method", "reason"])
+bot_api_shed = metrics.counter("sakura_bot_api_shed_total", "Invii scartati dal client (circuito aperto o troppe risposte a una chat)", ["method", "reason"])
+cloudinary_seconds = metrics.histogram("sakura_cloudinary_seconds", "Durata di upload e cancellazioni su Cloudinary", ["operation", "outcome"])
+
+# Client della Bot API: connessioni keep-alive condivise, timeout (s), tentativi per
+# gli invii critici e circuito che sospende le notifiche quando la Bot API non risponde
+BOT_API_POOL_SIZE = int(os.getenv("BOT_API_POOL_SIZE", 256))
+BOT_API_KEEPALIVE = float(os.getenv("BOT_API_KEEPALIVE", 30))
+BOT_API_TIMEOUT = float(os.getenv("BOT_API_TIMEOUT", 10))
+BOT_API_MEDIA_TIMEOUT = float(os.getenv("BOT_API_MEDIA_TIMEOUT", 60))
+BOT_API_ATTEMPTS = int(os.getenv("BOT_API_ATTEMPTS", 4))
+BOT_API_MAX_RETRY_AFTER = float(os.getenv("BOT_API_MAX_RETRY_AFTER", 30))
+bot_api_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("BOT_API_BREAKER_FAILURES", 5)),
+    reset_timeout=float(os.getenv("BOT_API_BREAKER_RESET", 30)),
+)
+
+# Filtro degli update in ingresso, per chat: update al secondo e burst, attese crescenti
+# dopo LOGIN_FREE_ATTEMPTS password sbagliate, risposte massime ogni REPLY_WINDOW secondi
+ingress_throttle = IngressThrottle(
+    metrics.counter("sakura_ingress_dropped_total", "Update scartati prima della coda", ["reason"]),
+    rate=float(os.getenv("INGRESS_RATE", 1)),
+    burst=float(os.getenv("INGRESS_BURST", 20)),
+    free_attempts=int(os.getenv("LOGIN_FREE_ATTEMPTS", 3)),
+    cooldown=float(os.getenv("LOGIN_COOLDOWN", 10)),
+    max_cooldown=float(os.getenv("LOGIN_MAX_COOLDOWN", 900)),
+    reply_limit=int(os.getenv("REPLY_LIMIT", 30)),
+    reply_window=float(os.getenv("REPLY_WINDOW", 60)),
+    # Chi guida o vota la serata (es. /importa, voti rapidi) non deve perdere update
+    exempt=lambda chat_id: sessions.is_owner(chat_id) or sessions.logged_in(chat_id),
+)
+
+# Endpoint della Bot API (sovrascrivibile per puntare a un server locale, es. loadtest.py)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+
+# Intervallo minimo (s) tra due aggiornamenti della dashboard dei proprietari
+DASHBOARD_REFRESH_SECONDS = float(os.getenv("DASHBOARD_REFRESH_SECONDS", 3))
+
+# Motore di broadcast: limite globale (msg/s), limite per chat e invii paralleli
+broadcaster = Broadcaster(
+    rate=float(os.getenv("BROADCAST_RATE", 25)),
+    per_chat_rate=float(os.getenv("BROADCAST_PER_CHAT_RATE", 1)),
+    concurrency=int(os.getenv("BROADCAST_CONCURRENCY", 20)),
+)
+
 TECHNICAL_AMBITI = ["Intonazione", "Interpretazione", "Tecninca Musicale/Strumentale", "Presenza Scenica"]
 
-cred = credentials.Certificate(os.getenv("GOOGLE_APPLICATION_CREDENTIALS"))
+# Voti grezzi in forma compatta (caricati dal backend all'avvio)
+vote_store = VoteStore(TECHNICAL_AMBITI)
 
-firebase_admin.initialize_app(cred, {
-    'databaseURL': os.getenv("FIREBASE_DATABASE_URL")
+# Schede degli artisti già in MarkdownV2, con l'invito al voto per tipo di giuria
+artist_cards = ArtistCards({
+    "popolare": "\n\n_🔽 Tocca il tuo voto \\(1\\-10\\) qui sotto, oppure scrivilo in chat\\._",
+    "tecnica": (
+        "\n\n_🔽 Scegli un voto \\(1\\-10\\) per ogni categoria e premi *Conferma*, oppure scrivi i voti "
+        f"uno alla volta partendo da *{escape(TECHNICAL_AMBITI[0])}*\\._"
+    ),
 })
 
+# Copia locale del catalogo artisti, un file JSON per artista (aggiornata a ogni flush)
+artist_store = ArtistStore(os.getenv("ARTISTS_DIR", "artisti"))
+# True se all'avvio il catalogo non era sul backend e va scritto al primo flush
+artists_pending_sync = False
+
+# Medie per artista aggiornate a ogni voto (ricostruite da vote_store all'avvio)
+scoreboard = ScoreBoard(len(TECHNICAL_AMBITI))
+
+# Backend di persistenza, creato in on_startup
+storage: StorageBackend = None
+# Modalità a più repliche (solo Firebase): posti assegnati con transazioni, voti
+# scritti una sola volta e modifiche delle altre repliche ricevute in streaming
+SHARED_STATE = os.getenv("SHARED_STATE", "0") == "1"
+shared_state: Optional[SharedState] = None
+
+MAX_OWNERS = 3
+# Gruppi salvati come {id: true}, un percorso per membro
+MEMBER_KEYS = ("judges_popolare", "judges_tecnica", "owners_ids", "event_notifications")
+
+# Sessioni delle chat (ruolo, bozze delle schede, ultimo accesso). Quelle senza ruolo
+# scadono dopo SESSION_TTL secondi e non sono mai più di MAX_GUEST_SESSIONS; dopo
+# MAX_LOGIN_ATTEMPTS password sbagliate la conversazione si chiude e serve di nuovo /start
+SESSION_TTL = float(os.getenv("SESSION_TTL", 1800))
+MAX_GUEST_SESSIONS = int(os.getenv("MAX_GUEST_SESSIONS", 10000))
+MAX_LOGIN_ATTEMPTS = int(os.getenv("MAX_LOGIN_ATTEMPTS", 5))
+sessions = SessionRegistry(ttl=SESSION_TTL, max_guests=MAX_GUEST_SESSIONS)
+
+def sync_sessions(bot_data: dict) -> None:
+    """Ricostruisce i ruoli delle sessioni dai posti salvati in bot_data."""
+    sessions.sync_members(
+        bot_data.get("owners_ids", ()), bot_data.get("judges_popolare", ()), bot_data.get("judges_tecnica", ()),
+    )
+
 
 def get_public_id_from_url(url: str) -> str:
     """Extracts the public_id from a Cloudinary URL."""
@@ -87,73 +281,212 @@ def get_public_id_from_url(url: str) -> str:
     except (ValueError, IndexError):
         return None
 
-def sanitize_votes_tecnica(votes_tecnica: dict) -> dict:
-    clean = {}
-    for artist_key, users in votes_tecnica.items():
-        clean[artist_key] = {}
-        for user_id, aspects in users.items():
-            clean_aspects = {
-                ambito.replace('/', '_'): score
-                for ambito, score in aspects.items()
-            }
-            clean[artist_key][user_id] = clean_aspects
-    return clean
-
-def save_bot_data(bot_data: dict) -> None:
-    data_to_save = {
-        "max_judges_popolare": bot_data.get("max_judges_popolare"),
-        "max_judges_tecnica": bot_data.get("max_judges_tecnica"),
-        "home_picture_url": bot_data.get("home_picture_url"),
-        "votes_popolare": bot_data.get("votes_popolare", {}),
-        # sanifichiamo i nomi degli ambiti tecnici
-        "votes_tecnica": sanitize_votes_tecnica(bot_data.get("votes_tecnica", {})),
-        "judges_popolare": list(bot_data.get("judges_popolare", [])),
-        "judges_tecnica": list(bot_data.get("judges_tecnica", [])),
-        "judge_types": bot_data.get("judge_types", {}),
-        "password_popolare": PASSWORD_POPOLARE,
-        "password_tecnica": PASSWORD_TECNICA,
-        "password_owner": PASSWORD_OWNER,
-        "owners_ids": list(bot_data.get("owners_ids", []))
-    }
+STATE_KEYS = [
+    "max_judges_popolare", "max_judges_tecnica", "home_picture_url", "home_picture_file_id",
+    "votes_popolare", "votes_tecnica", "judges_popolare", "judges_tecnica",
+    "judge_types", "password_popolare", "password_tecnica", "password_owner", "owners_ids",
+    "event_notifications", "open_rounds",
+]
+
+# Tutte le modifiche a voti, giudici e proprietari passano da qui
+state_tx = StateTransactions()
+
+# Writer write-behind, creato in on_startup
+state_writer: WriteBehindWriter = None
+# Stati della conversazione e user_data salvati insieme a bot_data, creata in on_startup
+state_persistence: BotStatePersistence = None
+CONVERSATION_NAME = "principale"
+# Dashboard live dei proprietari, creata in on_startup
+dashboard: LiveDashboard = None
+
+def serialize_state_key(bot_data: dict, key: str):
+    """Restituisce il valore da salvare sul backend per una chiave di primo livello."""
+    if key == "password_popolare":
+        return PASSWORD_POPOLARE
+    if key == "password_tecnica":
+        return PASSWORD_TECNICA
+    if key == "password_owner":
+        return PASSWORD_OWNER
+    if key in MEMBER_KEYS:
+        return {str(chat_id): True for chat_id in bot_data.get(key, set())}
+    if key == "open_rounds":
+        return {artist_key: voting_round.opened_at for artist_key, voting_round in scoreboard.rounds.items()}
+    if key == "judge_types":
+        return {str(chat_id): jury_type for chat_id, jury_type in bot_data.get(key, {}).items()}
+    return bot_data.get(key)
+
+def _lookup(node, key: str):
+    if not isinstance(node, dict):
+        return None
+    if key in node:
+        return node[key]
+    # gli id dei giudici sono int in memoria ma stringhe nei percorsi
     try:
-        ref = db.reference('bot_data')
-        ref.set(data_to_save)
-    except Exception as e:
-        logger.error(f"Errore nel salvataggio dei dati su Firebase: {e}")
+        return node.get(int(key))
+    except ValueError:
+        return None
 
-def load_bot_data() -> dict:
+def resolve_state_path(bot_data: dict, path: str):
+    """Legge da bot_data il valore corrente di un percorso 'chiave/sotto/chiave'."""
+    head, *rest = path.split("/")
+    if head in ("votes_popolare", "votes_tecnica"):
+        # i voti vivono in vote_store, che li codifica nella forma salvata
+        return vote_store.encode_path(head, rest)
+    if head in ("conversations", "user_data"):
+        return state_persistence.resolve([head] + rest)
+    if not rest:
+        return serialize_state_key(bot_data, head)
+    if head in MEMBER_KEYS:
+        return True if int(rest[0]) in bot_data.get(head, set()) else None
+    if head == "open_rounds":
+        voting_round = scoreboard.rounds.get(rest[0])
+        return voting_round.opened_at if voting_round else None
+    node = bot_data.get(head)
+    for key in rest:
+        node = _lookup(node, key)
+        if node is None:
+            return None
+    return node
+
+def set_nested(node: dict, keys: List[str], value) -> None:
+    """Imposta (None = cancella) il valore al percorso `keys` dentro `node`."""
+    for key in keys[:-1]:
+        if not isinstance(node.get(key), dict):
+            if value is None:
+                return
+            node[key] = {}
+        node = node[key]
+    if value is None:
+        node.pop(keys[-1], None)
+    else:
+        node[keys[-1]] = value
+
+def apply_remote_change(bot_data: dict, keys: List[str], value) -> None:
+    """Applica in memoria un put ricevuto dal backend. Arrivano anche le
+    scritture di questa replica, che non cambiano nulla."""
+    global PASSWORD_POPOLARE, PASSWORD_TECNICA, PASSWORD_OWNER
+    head, rest = keys[0], keys[1:]
+    if head in ("conversations", "user_data"):
+        # Stati delle conversazioni: contano solo per la replica che ha servito la chat
+        return
+    if head in ("votes_popolare", "votes_tecnica"):
+        changed = vote_store.replace_path(head, rest, value)
+        for artist_key in changed:
+            scoreboard.rebuild_artist(vote_store, artist_key)
+        if changed and dashboard is not None:
+            dashboard.push()
+    elif head in MEMBER_KEYS:
+        if not rest:
+            bot_data[head] = member_ids(value)
+        elif value:
+            bot_data.setdefault(head, set()).add(int(rest[0]))
+        else:
+            bot_data.setdefault(head, set()).discard(int(rest[0]))
+        if head != "event_notifications":
+            sync_sessions(bot_data)
+    elif head == "judge_types":
+        if not rest:
+            bot_data[head] = {int(chat_id): jury_type for chat_id, jury_type in (value or {}).items()}
+        else:
+            set_nested(bot_data.setdefault(head, {}), [int(rest[0])], value)
+    elif head == "open_rounds":
+        wanted = dict(stored_rounds(value)) if not rest else None
+        for artist_key in list(scoreboard.rounds):
+            if (wanted is not None and artist_key not in wanted) or (rest == [artist_key] and value is None):
+                scoreboard.close_round(artist_key)
+        for artist_key, opened_at in (wanted.items() if wanted is not None else [(rest[0], value)]):
+            if opened_at is not None and artist_key not in scoreboard.rounds:
+                reopen_round(bot_data, artist_key, opened_at)
+        if dashboard is not None:
+            dashboard.push()
+    elif head == "artists":
+        if not rest:
+            # Il catalogo non viene mai cancellato per intero: un nodo vuoto è solo da sincronizzare
+            if value:
+                bot_data["artists"] = dict(value)
+                artist_cards.invalidate()
+        else:
+            set_nested(bot_data.setdefault("artists", {}), rest, value)
+            artist_cards.invalidate(rest[0])
+    elif head in ("password_popolare", "password_tecnica", "password_owner"):
+        if isinstance(value, str):
+            if head == "password_popolare":
+                PASSWORD_POPOLARE = value
+            elif head == "password_tecnica":
+                PASSWORD_TECNICA = value
+            else:
+                PASSWORD_OWNER = value
+    else:
+        set_nested(bot_data, keys, value)
+
+def apply_remote_event(bot_data: dict, event_type: str, path: str, data) -> None:
+    for keys, value in split_event(event_type, path, data, STATE_KEYS + ["artists"]):
+        try:
+            apply_remote_change(bot_data, keys, value)
+        except Exception:
+            logger.exception(f"Modifica remota non applicabile su /{'/'.join(keys)}")
+
+def save_bot_data(bot_data: dict, *paths: str) -> None:
+    """Segna come modificati i percorsi indicati (tutto lo stato se omessi);
+    la scrittura sul backend avviene in blocco dal writer write-behind."""
+    if state_writer is None:
+        return
+    state_writer.mark_dirty(*(paths or STATE_KEYS))
+
+async def write_bot_data(payload: dict, bot_data: dict) -> None:
+    replace, records = ArtistStore.changes(payload, bot_data.get("artists", {}))
+    if replace or records:
+        # La copia locale si aggiorna anche se il backend non risponde
+        try:
+            await io_executor.run("storage", artist_store.apply, replace, records)
+        except Exception as e:
+            logger.error(f"Errore nell'aggiornamento del catalogo artisti locale: {e}")
+    storage_write_bytes.observe(len(json.dumps(payload, default=list)), backend=storage.name)
+    with storage_write_seconds.time(backend=storage.name):
+        await io_executor.run("storage", storage.update, payload)
+
+async def load_bot_data() -> dict:
     try:
-        ref = db.reference('bot_data')
-        data = ref.get()
+        with storage_load_seconds.time(backend=storage.name):
+            data = await io_executor.run("storage", storage.load)
         if not data:
             return {}
-        data["judges_popolare"] = set(data.get("judges_popolare", []))
-        data["judges_tecnica"] = set(data.get("judges_tecnica", []))
-        data["owners_ids"] = set(data.get("owners_ids", []))
+        storage_load_bytes.observe(len(json.dumps(data, default=list)), backend=storage.name)
+        for key in MEMBER_KEYS:
+            data[key] = member_ids(data.get(key))
+        # Firebase restituisce le chiavi come stringhe: in memoria gli id sono int
+        data["judge_types"] = {int(chat_id): jury_type for chat_id, jury_type in (data.get("judge_types") or {}).items()}
+        vote_store.load(data.pop("votes_popolare", None), data.pop("votes_tecnica", None))
         return data
     except Exception as e:
-        logger.error(f"Errore nel caricamento dei dati da Firebase: {e}")
+        logger.error(f"Errore nel caricamento dei dati dal backend {storage.name}: {e}")
         return {}
 
+@timed(handler_seconds, handler="start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Invia un messaggio di benvenuto leggendo l'URL dell'immagine da bot_data."""
-    if context.user_data.get("logged_in"):
+    session = sessions.touch(update.effective_chat.id)
+    if session.logged_in:
         await update.message.reply_text(
             "_⏸️ Sei già autenticato\\. Se desideri effettuare una nuova autenticazione, premi /logout\\._", 
             parse_mode=ParseMode.MARKDOWN_V2
         )
-        return MAIN_MENU
+        return MAIN_MENU if session.owner else VOTE
 
     home_pic_url = context.bot_data.get("home_picture_url")
     welcome_message_text = welcome_text(update)
 
     if home_pic_url:
         try:
-            # Prova a inviare la foto dall'URL salvato
-            await update.message.reply_photo(
-                photo=home_pic_url,
-                caption=welcome_message_text,
-                parse_mode=ParseMode.MARKDOWN_V2
+            # Prova a inviare la foto (file_id Telegram se già noto, altrimenti l'URL salvato)
+            await send_cached_photo(
+                lambda photo: update.message.reply_photo(
+                    photo=photo,
+                    caption=welcome_message_text,
+                    parse_mode=ParseMode.MARKDOWN_V2
+                ),
+                context.bot_data, "home_picture_url", "home_picture_file_id",
+                on_change=lambda: save_bot_data(context.bot_data, "home_picture_file_id"),
             )
         except Exception as e:
             # Se l'URL non è valido o c'è un errore, invia solo il testo
@@ -172,86 +505,209 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
     return PASSWORD
 
+def register_judge(bot_data: dict, jury_type: str, chat_id: int, enforce_limit: bool = True) -> bool:
+    """Registra il giudice se il limite della giuria lo consente."""
+    judges = bot_data.setdefault(f"judges_{jury_type}", set())
+    max_limit = bot_data.get(f"max_judges_{jury_type}")
+    if enforce_limit and chat_id not in judges and max_limit and len(judges) >= max_limit:
+        return False
+    judges.add(chat_id)
+    # Chi ha un posto in entrambe le giurie vota come giuria tecnica
+    sessions.set_jury(chat_id, "tecnica" if chat_id in bot_data.get("judges_tecnica", ()) else jury_type)
+    paths = [f"judges_{jury_type}/{chat_id}"]
+    if jury_type == "tecnica":
+        bot_data.setdefault("judge_types", {})[chat_id] = "tecnica"
+        paths.append(f"judge_types/{chat_id}")
+    save_bot_data(bot_data, *paths)
+    return True
+
+def register_owner(bot_data: dict, chat_id: int, enforce_limit: bool = True) -> bool:
+    owners_ids = bot_data.setdefault("owners_ids", set())
+    if enforce_limit and len(owners_ids) >= MAX_OWNERS and chat_id not in owners_ids:
+        return False
+    owners_ids.add(chat_id)
+    sessions.set_owner(chat_id, True)
+    save_bot_data(bot_data, f"owners_ids/{chat_id}")
+    return True
+
+def unregister_owner(bot_data: dict, chat_id: int) -> None:
+    owners_ids = bot_data.get("owners_ids", set())
+    owners_ids.discard(chat_id)
+    bot_data["owners_ids"] = owners_ids
+    sessions.set_owner(chat_id, False)
+    save_bot_data(bot_data, f"owners_ids/{chat_id}")
+
+async def claim_judge_seat(bot_data: dict, jury_type: str, chat_id: int) -> bool:
+    """Registra il giudice rispettando il limite della giuria; con più repliche
+    il limite è verificato da una transazione sul backend."""
+    if shared_state is None:
+        return await state_tx.apply(register_judge, bot_data, jury_type, chat_id)
+    limit = bot_data.get(f"max_judges_{jury_type}")
+    if not await io_executor.run("storage", shared_state.claim_seat, f"judges_{jury_type}", chat_id, limit):
+        return False
+    return await state_tx.apply(register_judge, bot_data, jury_type, chat_id, False)
+
+async def claim_owner_seat(bot_data: dict, chat_id: int) -> bool:
+    if shared_state is None:
+        return await state_tx.apply(register_owner, bot_data, chat_id)
+    if not await io_executor.run("storage", shared_state.claim_seat, "owners_ids", chat_id, MAX_OWNERS):
+        return False
+    return await state_tx.apply(register_owner, bot_data, chat_id, False)
+
+@timed(handler_seconds, handler="check_password")
 async def check_password(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     global PASSWORD_POPOLARE, PASSWORD_TECNICA, PASSWORD_OWNER
     user_password = update.message.text.strip()
+    chat_id = update.effective_chat.id
     
     if user_password == PASSWORD_POPOLARE:
-        context.user_data['jury_type'] = "popolare"
-        context.user_data["logged_in"] = True 
-        judges_popolare = context.bot_data.setdefault("judges_popolare", set())
-        max_limit = context.bot_data.get("max_judges_popolare")
-        if max_limit and len(judges_popolare) >= max_limit:
+        if not await claim_judge_seat(context.bot_data, "popolare", chat_id):
             await update.message.reply_text("_⚠️ È stato raggiunto il limite di componenti della giuria popolare\\!_", parse_mode=ParseMode.MARKDOWN_V2)
             return ConversationHandler.END
-        judges_popolare.add(update.effective_chat.id)
-        context.bot_data["judges_popolare"] = judges_popolare
-        context.bot_data.setdefault("votes_popolare", {})
+        login_session(chat_id)
         await update.message.reply_text(get_benvenuto_popolare_text(update), parse_mode=ParseMode.MARKDOWN_V2)
         await notify_owner(update, context, "popolare")
-        save_bot_data(context.bot_data)
         return VOTE
 
     elif user_password == PASSWORD_TECNICA:
-        context.user_data['jury_type'] = "tecnica"
-        context.user_data["logged_in"] = True
-        judges_tecnica = context.bot_data.setdefault("judges_tecnica", set())
-        max_limit = context.bot_data.get("max_judges_tecnica")
-        if max_limit and len(judges_tecnica) >= max_limit:
+        if not await claim_judge_seat(context.bot_data, "tecnica", chat_id):
             await update.message.reply_text("_⚠️ È stato raggiunto il limite di componenti della giuria tecnica\\!_", parse_mode=ParseMode.MARKDOWN_V2)
             return ConversationHandler.END
-        judges_tecnica.add(update.effective_chat.id)
-        context.bot_data["judges_tecnica"] = judges_tecnica
-        context.bot_data.setdefault("votes_tecnica", {})
-        judge_types = context.bot_data.setdefault("judge_types", {})
-        judge_types[update.effective_chat.id] = "tecnica"
+        login_session(chat_id)
         await update.message.reply_text(get_benvenuto_tecnica_text(update), parse_mode=ParseMode.MARKDOWN_V2)
         await notify_owner(update, context, "tecnica")
-        save_bot_data(context.bot_data)
         return VOTE
 
     elif user_password == PASSWORD_OWNER:
-        owners_ids = context.bot_data.setdefault("owners_ids", set())
-        if len(owners_ids) >= 3 and update.effective_chat.id not in owners_ids:
+        if not await claim_owner_seat(context.bot_data, chat_id):
             await update.message.reply_text("_⚠️ È stato raggiunto il limite di proprietari\\! Attendi che qualcuno effettui il logout\\._", parse_mode=ParseMode.MARKDOWN_V2)
             return ConversationHandler.END
-        
-        context.user_data['user_role'] = "owner"
-        context.user_data["logged_in"] = True
-        owners_ids.add(update.effective_chat.id)
-        context.bot_data["owners_ids"] = owners_ids
-        save_bot_data(context.bot_data)
+        login_session(chat_id)
         await update.message.reply_text(get_benvenuto_prop_text(update), parse_mode=ParseMode.MARKDOWN_V2)
         return MAIN_MENU
     else:
-        await update.message.reply_text("_⚠️ Password non valida\\! Riprova\\._", parse_mode=ParseMode.MARKDOWN_V2)
+        session = sessions.touch(chat_id)
+        session.failed_logins += 1
+        # Gli update della chat vengono scartati all'ingresso fino alla fine dell'attesa
+        cooldown = ingress_throttle.login_failed(chat_id, session.failed_logins)
+        retry = f" tra {int(cooldown)} secondi" if cooldown else ""
+        if session.failed_logins >= MAX_LOGIN_ATTEMPTS:
+            await update.message.reply_text(
+                f"_⛔ Troppi tentativi con una password errata\\. Usa /start per riprovare{retry}\\._", parse_mode=ParseMode.MARKDOWN_V2
+            )
+            return ConversationHandler.END
+        await update.message.reply_text(f"_⚠️ Password non valida\\! Riprova{retry}\\._", parse_mode=ParseMode.MARKDOWN_V2)
         return PASSWORD
 
+async def track_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_chat is not None:
+        sessions.touch(update.effective_chat.id)
+
+async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if isinstance(context.error, SendShed):
+        # Invio scartato di proposito (quota di risposte della chat o circuito aperto)
+        logger.debug(f"Invio scartato: {context.error}")
+        return
+    logger.error("Errore non gestito durante l'elaborazione di un update", exc_info=context.error)
+
+def forget_chat(bot_app: Application, chat_id: int) -> None:
+    """Sessione senza ruolo scaduta: si liberano anche i dati della chat tenuti da PTB."""
+    bot_app.drop_user_data(chat_id)
+    bot_app.drop_chat_data(chat_id)
+
+def login_session(chat_id: int) -> None:
+    session = sessions.touch(chat_id)
+    session.logged_in = True
+    session.failed_logins = 0
+
 async def notify_owner(update: Update, context: ContextTypes.DEFAULT_TYPE, jury_type: str) -> None:
     owners_ids = context.bot_data.get("owners_ids", set())
     if not owners_ids:
         return
         
-    user_name = update.effective_user.first_name
-    escape_username = escape_markdown(user_name, version=2)
-    user_id = update.effective_chat.id
-    clickable_name = f"[{escape_username}](tg://user?id={user_id})"
+    clickable_name = user_link(update.effective_chat.id, update.effective_user.first_name)
     text = f"_👤 Il giudice {clickable_name} si è registrato come giuria di tipo *{jury_type}*\\._"
-    
-    for owner_id in owners_ids:
-        try:
-            await context.bot.send_message(chat_id=owner_id, text=text, parse_mode=ParseMode.MARKDOWN_V2)
-        except Exception as e:
-            logger.error(f"Errore nell'invio della notifica al proprietario {owner_id}: {e}")
+    notify_owners(context, text, "notifica login")
+
+def notify_owners(context: ContextTypes.DEFAULT_TYPE, text: str, label: str) -> None:
+    """Aggiunge l'evento alla dashboard live; un messaggio separato arriva solo ai
+    proprietari che hanno attivato le notifiche per evento con /notifiche."""
+    dashboard.push(text)
+    owners_ids = context.bot_data.get("owners_ids", set()) & context.bot_data.get("event_notifications", set())
+    if not owners_ids:
+        return
+
+    async def send(chat_id: int):
+        with send_priority(NOTIFICATION):
+            await context.bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.MARKDOWN_V2)
+
+    context.application.create_task(broadcaster.broadcast(owners_ids, send, label))
+
+def render_dashboard(bot_data: dict, events: List[str]) -> str:
+    """Testo MarkdownV2 della dashboard: voti ricevuti, medie correnti e ultimi eventi."""
+    lines = ["*📊 Dashboard live*"]
+    artists = bot_data.get("artists", {})
+    for artist_key, voting_round in scoreboard.rounds.items():
+        if artist_key not in artists:
+            continue
+        current = scoreboard.artists.get(artist_key)
+        lines.append(f"\n🎤 Artista: *{artist_cards.name(artist_key, artists[artist_key])}*")
+        lines.append(f"🗳 Giudici che hanno votato: *{voting_round.received}/{voting_round.expected}*")
+        lines.append(f"👥 Media popolare: {score(current.avg_pop if current else 0)}")
+        lines.append(f"🗣 Media tecnica: {score(current.avg_tech if current else 0)}")
+    lines.append(
+        f"\n_Giudici registrati: {len(bot_data.get('judges_popolare', set()))} popolari, "
+        f"{len(bot_data.get('judges_tecnica', set()))} tecnici_"
+    )
+    if events:
+        lines.append("\n*Ultimi eventi:*")
+        lines.extend(events)
+    return "\n".join(lines)
+
+async def event_notifications_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Attiva/disattiva per il proprietario un messaggio separato per ogni login e voto."""
+    chat_id = update.effective_chat.id
+    if not sessions.is_owner(chat_id):
+        await update.message.reply_text("Non sei autorizzato ad eseguire questo comando.")
+        return MAIN_MENU
+
+    subscribers = context.bot_data.setdefault("event_notifications", set())
+    if chat_id in subscribers:
+        subscribers.discard(chat_id)
+        text = "_🔕 Notifiche per ogni evento disattivate: segui la dashboard live\\._"
+    else:
+        subscribers.add(chat_id)
+        text = "_🔔 Riceverai un messaggio per ogni login e voto, oltre alla dashboard live\\._"
+    save_bot_data(context.bot_data, f"event_notifications/{chat_id}")
+    await update.message.reply_text(text, parse_mode=ParseMode.MARKDOWN_V2)
+    return MAIN_MENU
 
 async def votazioni_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    owners_ids = context.bot_data.get("owners_ids", set())
-    if update.effective_chat.id not in owners_ids:
+    if not sessions.is_owner(update.effective_chat.id):
         await update.message.reply_text("Non sei autorizzato ad eseguire questo comando.")
         return MAIN_MENU
     await send_owner_buttons(update, context)
+    context.application.create_task(prewarm_artist_photos(context, update.effective_chat.id))
     return MAIN_MENU
 
+async def prewarm_artist_photos(context: ContextTypes.DEFAULT_TYPE, owner_chat_id: int) -> None:
+    """Ottiene il file_id Telegram delle foto non ancora in cache inviandole al
+    proprietario (e cancellandole subito), così i broadcast ai giudici non fanno
+    riscaricare l'immagine da Cloudinary."""
+    for key, artist in list(context.bot_data.get("artists", {}).items()):
+        if not artist.get("foto") or artist.get("foto_file_id"):
+            continue
+        try:
+            await broadcaster.throttle(owner_chat_id)
+            message = await send_cached_photo(
+                lambda photo: context.bot.send_photo(chat_id=owner_chat_id, photo=photo, disable_notification=True),
+                artist, "foto", "foto_file_id",
+                on_change=lambda key=key: save_bot_data(context.bot_data, f"artists/{key}/foto_file_id"),
+            )
+            await message.delete()
+        except Exception as e:
+            logger.error(f"Errore nel pre-caricamento della foto di {artist.get('nome')}: {e}")
+
 async def send_owner_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     artists_data = context.bot_data['artists']
     buttons = []
@@ -271,6 +727,7 @@ async def send_owner_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE)
         parse_mode=ParseMode.MARKDOWN_V2
     )
 
+@timed(handler_seconds, handler="owner_button_handler")
 async def owner_button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Gestisce i bottoni del proprietario nel pannello votazioni."""
     query = update.callback_query
@@ -283,49 +740,306 @@ async def owner_button_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.edit_message_text("*Votazioni interrotte e risultati calcolati\\.*", parse_mode=ParseMode.MARKDOWN_V2)
         return MAIN_MENU
 
+    if artist_key.startswith("close_"):
+        await close_voting_round(update, context, artist_key[len("close_"):])
+        return MAIN_MENU
+
     artists = context.bot_data.get("artists", {})
     if artist_key not in artists:
         await query.edit_message_text("Artista non trovato.")
         return MAIN_MENU
 
     artist = artists[artist_key]
+    judges = context.bot_data.get("judges_popolare", set()) | context.bot_data.get("judges_tecnica", set())
+    # Gli altri turni restano aperti: ogni giudice vota gli artisti nell'ordine di apertura
+    open_voting_round(context.bot_data, artist_key)
+    # Nuovo turno: la dashboard riparte con un nuovo messaggio sotto l'annuncio
+    dashboard.reset()
+    dashboard.push()
+
     await query.message.reply_text(
-        f"*▶️ Votazioni aperte per {escape_markdown(artist['nome'], version=2)}\\!*",
+        f"*▶️ Votazioni aperte per {artist_cards.name(artist_key, artist)}\\!*\n"
+        f"_Turni aperti\\: {len(scoreboard.rounds)}_",
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton(f"🔒 Chiudi votazioni per {artist['nome']}", callback_data=f"close_{artist_key}")
+        ]]),
         parse_mode=ParseMode.MARKDOWN_V2
     )
-    context.bot_data["current_selected_artist"] = artist_key
 
-    response_text = (
-        f"*Nome:* {escape_markdown(artist['nome'], version=2)}\n"
-        f"*Età:* {artist['età']}\n"
-        f"*Canzone:* {escape_markdown(artist['canzone'], version=2)}"
+    async def send_profile(judge_chat_id: int):
+        # Didascalia e scheda di voto già pronte in cache: nessun escape per destinatario
+        jury_type = sessions.jury_type(judge_chat_id) or "popolare"
+        caption = artist_cards.caption(artist_key, artist, jury_type)
+        keyboard = ballot_keyboard(artist_key, jury_type, tuple(TECHNICAL_AMBITI))
+        if artist.get('foto'):
+            await send_cached_photo(
+                lambda photo: context.bot.send_photo(
+                    chat_id=judge_chat_id, photo=photo, caption=caption, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN_V2
+                ),
+                artist, "foto", "foto_file_id",
+                on_change=lambda: save_bot_data(context.bot_data, f"artists/{artist_key}/foto_file_id"),
+            )
+        else:
+            await context.bot.send_message(chat_id=judge_chat_id, text=caption, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN_V2)
+
+    # L'invio ai giudici gira in background: il bottone del proprietario risponde subito
+    context.application.create_task(
+        broadcast_profile(context, query.message.chat_id, judges, send_profile, artist['nome'])
     )
-    
-    judges = context.bot_data.get("judges_popolare", set()) | context.bot_data.get("judges_tecnica", set())
-    judge_types = context.bot_data.get("judge_types", {})
+    return MAIN_MENU
+
+def judge_done(bot_data: dict, artist_key: str, judge_id: int) -> bool:
+    """True se il giudice ha già completato il voto per l'artista."""
+    if sessions.jury_type(judge_id) == "tecnica":
+        return next_ballot("tecnica", judge_id, [artist_key]) is None
+    return vote_store.get_popular(artist_key, judge_id) is not None
+
+def next_ballot(jury_type: str, judge_id: int, artist_keys=None) -> Optional[Tuple[str, int]]:
+    """Primo turno aperto (in ordine di apertura) che il giudice non ha ancora
+    completato, con l'indice dell'ambito da votare (0 per la giuria popolare)."""
+    for artist_key in (scoreboard.rounds if artist_keys is None else artist_keys):
+        if jury_type == "popolare":
+            if vote_store.get_popular(artist_key, judge_id) is None:
+                return artist_key, 0
+            continue
+        for ambito_index in range(len(TECHNICAL_AMBITI)):
+            if vote_store.get_technical(artist_key, judge_id, ambito_index) is None:
+                return artist_key, ambito_index
+    return None
+
+def ballot_prompt(bot_data: dict, jury_type: str, judge_id: int) -> str:
+    """Invito (MarkdownV2) al prossimo voto del giudice, vuoto se non ha altro da votare."""
+    ballot = next_ballot(jury_type, judge_id)
+    if ballot is None:
+        return ""
+    artist_key, ambito_index = ballot
+    nome = artist_cards.name(artist_key, bot_data["artists"][artist_key])
+    if jury_type == "tecnica":
+        return f"\n\n_🔽 Esprimi il tuo voto per la categoria *{escape(TECHNICAL_AMBITI[ambito_index])}* per *{nome}*\\._"
+    return f"\n\n_🔽 Inserisci il tuo voto \\(1\\-10\\) per *{nome}*\\._"
+
+def stored_rounds(value) -> List[Tuple[str, Optional[float]]]:
+    """Turni aperti salvati ({artista: istante di apertura}, o vecchia lista) in ordine di apertura."""
+    if isinstance(value, dict):
+        return sorted(value.items(), key=lambda item: item[1] or 0)
+    return [(artist_key, None) for artist_key in value or []]
+
+def reopen_round(bot_data: dict, artist_key: str, opened_at: Optional[float] = None) -> None:
+    """Apre in memoria il turno di un artista, calcolando chi ha già votato."""
+    if artist_key not in bot_data.get("artists", {}):
+        return
+    judges = bot_data.get("judges_popolare", set()) | bot_data.get("judges_tecnica", set())
+    done = {judge_id for judge_id in judges if judge_done(bot_data, artist_key, judge_id)}
+    scoreboard.open_round(artist_key, judges, done, opened_at)
 
-    for judge_chat_id in judges:
-        prompt = "\n\n_🔽 Inserisci il tuo voto (1-10) per questo artista\\:_"
-        if judge_types.get(judge_chat_id) == "tecnica":
-            context.user_data.setdefault(judge_chat_id, {})["ambito_index"] = 0
-            prompt = f"\n\n_🔽 Esprimi il tuo voto (1-10) per la categoria *{TECHNICAL_AMBITI[0]}*\\._"
+def open_voting_round(bot_data: dict, artist_key: str) -> None:
+    reopen_round(bot_data, artist_key)
+    save_bot_data(bot_data, f"open_rounds/{artist_key}")
 
-        try:
-            if artist.get('foto'):
-                await context.bot.send_photo(chat_id=judge_chat_id, photo=artist['foto'], caption=response_text + prompt, parse_mode=ParseMode.MARKDOWN_V2)
-            else:
-                await context.bot.send_message(chat_id=judge_chat_id, text=response_text + prompt, parse_mode=ParseMode.MARKDOWN_V2)
-        except Exception as e:
-            logger.error(f"Errore invio profilo al giudice {judge_chat_id}: {e}")
+async def close_voting_round(update: Update, context: ContextTypes.DEFAULT_TYPE, artist_key: str) -> None:
+    """Chiude un solo turno: i giudici non possono più votare quell'artista."""
+    query = update.callback_query
+    voting_round = scoreboard.close_round(artist_key)
+    artists = context.bot_data.get("artists", {})
+    if voting_round is None or artist_key not in artists:
+        await query.edit_message_text("Turno già chiuso.")
+        return
+    save_bot_data(context.bot_data, f"open_rounds/{artist_key}")
+    sessions.drop_round(artist_key)
+    nome = artist_cards.name(artist_key, artists[artist_key])
+    current = scoreboard.artists.get(artist_key)
+    await query.edit_message_text(
+        f"*🔒 Votazioni chiuse per {nome}*\n"
+        f"🗳 Giudici che hanno votato: *{voting_round.received}/{voting_round.expected}*\n"
+        f"👥 Media popolare: {score(current.avg_pop if current else 0)}\n"
+        f"🗣 Media tecnica: {score(current.avg_tech if current else 0)}",
+        parse_mode=ParseMode.MARKDOWN_V2
+    )
+    dashboard.push(f"🔒 Turno chiuso: *{nome}*")
 
-    return MAIN_MENU
+async def broadcast_profile(context: ContextTypes.DEFAULT_TYPE, owner_chat_id: int, judges, send_profile, artist_name: str) -> None:
+    report = await broadcaster.broadcast(judges, send_profile, f"Profilo {artist_name}")
+    try:
+        await context.bot.send_message(chat_id=owner_chat_id, text=f"📬 {report.summary()}")
+    except Exception as e:
+        logger.error(f"Errore nell'invio del report di consegna al proprietario {owner_chat_id}: {e}")
 
-async def vote_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    if "current_selected_artist" not in context.bot_data:
-        await update.message.reply_text("Nessun artista selezionato, attendi che il proprietario lo scelga.")
-        return VOTE
+def vote_path(jury_type: str, artist_key: str, user_id: int, ambito_index: int) -> str:
+    if jury_type == "popolare":
+        return f"votes_popolare/{artist_key}/{user_id}"
+    return vote_store.technical_path(artist_key, user_id, ambito_index)
+
+def ballot_path(jury_type: str, artist_key: str, user_id: int) -> str:
+    """Percorso della scheda completa di un giudice per un artista."""
+    return f"votes_{jury_type}/{artist_key}/{user_id}"
 
-    current_artist = context.bot_data["current_selected_artist"]
+def store_vote(jury_type: str, artist_key: str, user_id: int, ambito_index: int, vote_value: float) -> None:
+    # Con più repliche l'eco della scrittura può arrivare dallo stream prima di
+    # questa chiamata: in quel caso il voto è già nei totali
+    if jury_type == "popolare":
+        if vote_store.get_popular(artist_key, user_id) is None:
+            vote_store.set_popular(artist_key, user_id, vote_value)
+            scoreboard.record_popular(artist_key, user_id, vote_value)
+    elif vote_store.get_technical(artist_key, user_id, ambito_index) is None:
+        vote_store.set_technical(artist_key, user_id, ambito_index, vote_value)
+        scoreboard.record_technical(artist_key, user_id, vote_value)
+
+def record_vote(bot_data: dict, jury_type: str, artist_key: str, user_id: int, ambito_index: int, vote_value: float) -> None:
+    store_vote(jury_type, artist_key, user_id, ambito_index, vote_value)
+    # Con più repliche il voto è già stato scritto da write_once
+    if shared_state is None:
+        save_bot_data(bot_data, vote_path(jury_type, artist_key, user_id, ambito_index))
+
+def record_ballot(bot_data: dict, jury_type: str, artist_key: str, user_id: int, values: List[float]) -> None:
+    """Tutti i voti della scheda in memoria e un'unica scrittura sul backend."""
+    for ambito_index, vote_value in enumerate(values):
+        store_vote(jury_type, artist_key, user_id, ambito_index, vote_value)
+    if shared_state is None:
+        save_bot_data(bot_data, ballot_path(jury_type, artist_key, user_id))
+
+async def cast_ballot(bot_data: dict, jury_type: str, user_id: int, artist_key: str, values: List[float]) -> str:
+    """Registra in un colpo solo la scheda di un artista (il voto popolare o
+    tutti gli ambiti tecnici, tranne quelli già votati via messaggio); esito
+    "ok", "closed" o "already_voted" (scheda già completa)."""
+    if artist_key not in scoreboard.rounds:
+        return "closed"
+    if jury_type == "popolare":
+        if vote_store.get_popular(artist_key, user_id) is not None:
+            return "already_voted"
+        writes = [(ballot_path(jury_type, artist_key, user_id), values[0])]
+    else:
+        recorded = vote_store.technical_ballot(artist_key, user_id)
+        if len(recorded) == len(TECHNICAL_AMBITI):
+            return "already_voted"
+        if recorded:
+            # Scheda iniziata via messaggio: si completano solo gli ambiti mancanti
+            writes = [
+                (vote_path(jury_type, artist_key, user_id, ambito_index), value)
+                for ambito_index, (name, value) in enumerate(zip(TECHNICAL_AMBITI, values)) if name not in recorded
+            ]
+        else:
+            stored = {vote_store.stored_ambito(name): value for name, value in zip(TECHNICAL_AMBITI, values)}
+            writes = [(ballot_path(jury_type, artist_key, user_id), stored)]
+    if shared_state is not None:
+        for path, stored in writes:
+            written, current = await io_executor.run("storage", shared_state.write_once, path, stored)
+            if not written:
+                apply_remote_change(bot_data, path.split("/"), current)
+                return "already_voted"
+    await state_tx.apply(record_ballot, bot_data, jury_type, artist_key, user_id, values)
+    return "ok"
+
+def notify_vote(context: ContextTypes.DEFAULT_TYPE, user, artist_nome: str, detail: str) -> None:
+    if context.bot_data.get("owners_ids"):
+        clickable_name = user_link(user.id, user.first_name)
+        notify_owners(context, f"🔝 Il giudice {clickable_name} ha votato per l'artista {artist_nome}{detail}", "notifica voto")
+
+async def edit_ballot_message(query, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> None:
+    """Aggiorna il profilo su cui si vota: la didascalia se ha la foto, altrimenti il testo."""
+    try:
+        if getattr(query.message, "photo", None):
+            await query.edit_message_caption(caption=text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN_V2)
+        else:
+            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN_V2)
+    except BadRequest as e:
+        # Stesso voto premuto due volte: il messaggio non cambia
+        if "not modified" not in str(e).lower():
+            raise
+
+@timed(handler_seconds, handler="ballot_callback")
+async def ballot_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Bottoni della scheda sul profilo dell'artista: un tocco per la giuria
+    popolare, bozza per ambito e conferma per quella tecnica."""
+    query = update.callback_query
+    action = parse_callback(query.data, len(TECHNICAL_AMBITI))
+    if action is None or action.kind == "nessuna":
+        await query.answer()
+        return
+    user = update.effective_user
+    bot_data = context.bot_data
+    jury_type = sessions.jury_type(user.id)
+    # Le schede restano nella chat anche dopo /logout: senza accesso non si vota
+    if jury_type is None or not sessions.logged_in(user.id):
+        await query.answer("Effettua prima l'accesso come giudice con /start.", show_alert=True)
+        return
+    if (jury_type == "popolare") != (action.kind == "popolare"):
+        await query.answer("Questa scheda non è per la tua giuria.", show_alert=True)
+        return
+    artist_key = action.artist_key
+    artist = bot_data.get("artists", {}).get(artist_key)
+    if artist is None or artist_key not in scoreboard.rounds:
+        await query.answer("Le votazioni per questo artista sono chiuse.", show_alert=True)
+        return
+
+    card = artist_cards.card(artist_key, artist)
+    drafts = sessions.touch(user.id).drafts
+    if action.kind == "tecnica":
+        # Bozza: nessuna scrittura finché il giudice non conferma
+        draft = drafts.setdefault(artist_key, [None] * len(TECHNICAL_AMBITI))
+        draft[action.ambito] = action.score
+        await query.answer(f"{TECHNICAL_AMBITI[action.ambito]}: {action.score}")
+        await edit_ballot_message(query, card + tally(TECHNICAL_AMBITI, draft), technical_keyboard(artist_key, TECHNICAL_AMBITI, draft))
+        return
+    if action.kind == "conferma":
+        draft = drafts.get(artist_key) or [None] * len(TECHNICAL_AMBITI)
+        missing = [ambito for ambito, value in zip(TECHNICAL_AMBITI, draft) if value is None]
+        if missing:
+            await query.answer(f"Manca il voto per: {', '.join(missing)}", show_alert=True)
+            return
+        values = [float(value) for value in draft]
+    else:
+        values = [float(action.score)]
+
+    status = await cast_ballot(bot_data, jury_type, user.id, artist_key, values)
+    if status == "closed":
+        await query.answer("Le votazioni per questo artista sono chiuse.", show_alert=True)
+        return
+    drafts.pop(artist_key, None)
+    if status == "already_voted":
+        await query.answer("Hai già votato per questo artista.", show_alert=True)
+        await edit_ballot_message(query, card + "\n\n_✅ Voto già registrato\\._")
+        return
+
+    await query.answer("Voto registrato!")
+    artist_nome = artist_cards.name(artist_key, artist)
+    if jury_type == "tecnica":
+        # Gli ambiti già votati via messaggio tengono il loro voto
+        recorded = vote_store.technical_ballot(artist_key, user.id)
+        draft = [recorded.get(name, value) for name, value in zip(TECHNICAL_AMBITI, draft)]
+        average = score(sum(draft) / len(draft))
+        summary = tally(TECHNICAL_AMBITI, draft) + f"\n\n*🆒 Grazie per il tuo voto\\! La media dei voti è\\: {average}*"
+        detail = f"\\. Media dei voti\\: {average}"
+    else:
+        summary = f"\n\n*🆒 Grazie per il tuo voto\\: {action.score}*"
+        detail = f" con voto\\: {escape(str(values[0]))}\\."
+    await edit_ballot_message(query, card + summary)
+    notify_vote(context, user, artist_nome, detail)
+
+async def cast_vote(bot_data: dict, jury_type: str, user_id: int, vote_value: float) -> Tuple[str, Optional[str], int]:
+    """Registra il voto per il primo turno aperto (e, per la giuria tecnica, il
+    primo ambito) non ancora votato dal giudice; restituisce l'esito ("ok",
+    "no_round", "out_of_range"), l'artista e l'indice dell'ambito votato."""
+    while True:
+        ballot = next_ballot(jury_type, user_id)
+        if ballot is None:
+            return "no_round", None, 0
+        artist_key, ambito_index = ballot
+        if not 1 <= vote_value <= 10:
+            return "out_of_range", artist_key, ambito_index
+        if shared_state is None:
+            break
+        path = vote_path(jury_type, artist_key, user_id, ambito_index)
+        written, current = await io_executor.run("storage", shared_state.write_once, path, vote_value)
+        if written:
+            break
+        # Voto già scritto da un'altra replica (messaggio precedente dello stesso
+        # giudice): lo si recepisce e il voto passa alla scheda successiva
+        apply_remote_change(bot_data, path.split("/"), current)
+    await state_tx.apply(record_vote, bot_data, jury_type, artist_key, user_id, ambito_index, vote_value)
+    return "ok", artist_key, ambito_index
+
+@timed(handler_seconds, handler="vote_handler")
+async def vote_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
     vote_input_str = update.message.text.strip()
     try:
@@ -334,164 +1048,148 @@ async def vote_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         await update.message.reply_text("❌ Inserisci un numero valido per il voto.")
         return VOTE
 
-    jury_type = context.user_data.get('jury_type', 'popolare')
+    jury_type = sessions.jury_type(update.effective_chat.id) or "popolare"
 
     if jury_type == "popolare":
-        votes_dict = context.bot_data.setdefault("votes_popolare", {})
-        if current_artist not in votes_dict:
-            votes_dict[current_artist] = {}
-        if user_id in votes_dict[current_artist]:
-            await update.message.reply_text("🔚 Hai già votato per questo artista\\!")
+        status, current_artist, _ = await cast_vote(context.bot_data, jury_type, user_id, vote_value)
+        if status == "no_round":
+            await update.message.reply_text("Nessun artista da votare, attendi che il proprietario apra le votazioni.")
             return VOTE
-        
-        if not 1 <= vote_value <= 10:
-            await update.message.reply_text("#️⃣ Il voto deve essere compreso tra 1 e 10\\. Riprova\\.")
+        artist_nome = artist_cards.name(current_artist, context.bot_data['artists'][current_artist])
+        if status == "out_of_range":
+            await update.message.reply_text(
+                f"#️⃣ Il voto per *{artist_nome}* deve essere compreso tra 1 e 10\\. Riprova\\.",
+                parse_mode=ParseMode.MARKDOWN_V2
+            )
             return VOTE
 
-        votes_dict[current_artist][user_id] = vote_value
-        await update.message.reply_text("Grazie per il tuo voto!")
+        await update.message.reply_text(
+            f"Grazie per il tuo voto per *{artist_nome}*\\!" + ballot_prompt(context.bot_data, jury_type, user_id),
+            parse_mode=ParseMode.MARKDOWN_V2
+        )
         
-        owners_ids = context.bot_data.get("owners_ids", set())
-        if owners_ids:
-            user_name = update.effective_user.first_name
-            escape_username = escape_markdown(user_name, version=2)
-            clickable_name = f"[{escape_username}](tg://user?id={user_id})"
-            formatted_vote = escape_markdown(str(vote_value), version=2)
-            artist_nome = escape_markdown(context.bot_data['artists'][current_artist]['nome'], version=2)
-            notification_text = (
-                f"🔝 Il giudice {clickable_name} ha votato per l'artista {artist_nome} con voto\\: {formatted_vote}\\."
-            )
-            for owner_id in owners_ids:
-                try:
-                    await context.bot.send_message(chat_id=owner_id, text=notification_text, parse_mode=ParseMode.MARKDOWN_V2)
-                except Exception as e:
-                    logger.error(f"Errore nell'invio della notifica al proprietario {owner_id}: {e}")
-        save_bot_data(context.bot_data)
+        notify_vote(context, update.effective_user, artist_nome, f" con voto\\: {escape(str(vote_value))}\\.")
         return VOTE
 
     else: # Technical Jury
-        votes_dict = context.bot_data.setdefault("votes_tecnica", {})
-        if current_artist not in votes_dict:
-            votes_dict[current_artist] = {}
-        if user_id not in votes_dict[current_artist]:
-            votes_dict[current_artist][user_id] = {}
-
-        ambito_index = context.user_data.get("ambito_index", 0)
-        current_ambito = TECHNICAL_AMBITI[ambito_index]
+        status, current_artist, ambito_index = await cast_vote(context.bot_data, jury_type, user_id, vote_value)
+        if status == "no_round":
+            await update.message.reply_text("Nessun artista da votare, attendi che il proprietario apra le votazioni.")
+            return VOTE
+        current_ambito = escape(TECHNICAL_AMBITI[ambito_index])
+        artist_nome = artist_cards.name(current_artist, context.bot_data['artists'][current_artist])
 
-        if not 1 <= vote_value <= 10:
+        if status == "out_of_range":
             await update.message.reply_text(
-                f"#️⃣ Il voto per la categoria *{current_ambito}* deve essere compreso tra 1 e 10\\. Riprova\\.",
+                f"#️⃣ Il voto per la categoria *{current_ambito}* di *{artist_nome}* deve essere compreso tra 1 e 10\\. Riprova\\.",
                 parse_mode=ParseMode.MARKDOWN_V2
             )
             return VOTE
 
-        if current_ambito in votes_dict[current_artist][user_id]:
-            await update.message.reply_text("🔚 Hai già votato per questo artista in questo ambito\\!")
-            return VOTE
-
-        votes_dict[current_artist][user_id][current_ambito] = vote_value
-        ambito_index += 1
-        context.user_data["ambito_index"] = ambito_index
-
-        if ambito_index < len(TECHNICAL_AMBITI):
-            next_ambito = TECHNICAL_AMBITI[ambito_index]
+        if ambito_index + 1 < len(TECHNICAL_AMBITI):
             await update.message.reply_text(
-                f"_🔽 Esprimi il tuo voto per la categoria *{next_ambito}*\\._",
+                ballot_prompt(context.bot_data, jury_type, user_id).strip(),
                 parse_mode=ParseMode.MARKDOWN_V2
             )
         else:
-            user_votes = votes_dict[current_artist][user_id]
+            user_votes = vote_store.technical_ballot(current_artist, user_id)
             total = sum(user_votes.values())
             avg = total / len(TECHNICAL_AMBITI)
-            avg2 = escape_markdown(f"{avg:.2f}", version=2)
+            avg2 = score(avg)
             await update.message.reply_text(
-                f"*🆒 Grazie per il tuo voto\\! La media dei voti è\\: {avg2}*",
+                f"*🆒 Grazie per il tuo voto per {artist_nome}\\! La media dei voti è\\: {avg2}*"
+                + ballot_prompt(context.bot_data, jury_type, user_id),
                 parse_mode=ParseMode.MARKDOWN_V2
             )
             
-            owners_ids = context.bot_data.get("owners_ids", set())
-            if owners_ids:
-                user_name = update.effective_user.first_name
-                escape_username = escape_markdown(user_name, version=2)
-                clickable_name = f"[{escape_username}](tg://user?id={user_id})"
-                artist_nome = escape_markdown(context.bot_data['artists'][current_artist]['nome'], version=2)
-                notification_text = (
-                    f"🔝 Il giudice {clickable_name} ha votato per l'artista {artist_nome}\\. Media dei voti\\: {avg2}"
-                )
-                for owner_id in owners_ids:
-                    try:
-                        await context.bot.send_message(chat_id=owner_id, text=notification_text, parse_mode=ParseMode.MARKDOWN_V2)
-                    except Exception as e:
-                        logger.error(f"Errore nell'invio della notifica al proprietario {owner_id}: {e}")
-            context.user_data["ambito_index"] = 0 # Reset for next artist
-        
-        save_bot_data(context.bot_data)
+            notify_vote(context, update.effective_user, artist_nome, f"\\. Media dei voti\\: {avg2}")
         return VOTE
 
-async def stop_voting_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+def format_standings(context: ContextTypes.DEFAULT_TYPE, title: str) -> str:
+    """Costruisce il testo MarkdownV2 della classifica per categoria dai totali incrementali."""
     artists_data: Dict[str, dict] = context.bot_data.get("artists", {})
-    votes_popolare: Dict[str, Dict[int, int]] = context.bot_data.get("votes_popolare", {})
-    votes_tecnica: Dict[str, Dict[int, Dict[str, int]]] = context.bot_data.get("votes_tecnica", {})
+    return render_standings(title, scoreboard.standings(artists_data), artists_data, artist_cards)
 
-    ranking: Dict[str, List[Tuple[float, str, float, float]]] = {}
+@timed(handler_seconds, handler="stop_voting_handler")
+async def stop_voting_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Controllo di coerenza a fine serata: i totali incrementali devono coincidere col ricalcolo
+    if not scoreboard.verify(vote_store):
+        logger.warning("Totali incrementali non allineati ai voti grezzi: ricostruzione")
+        scoreboard.rebuild(vote_store)
+
+    message = format_standings(context, "*🏆 Risultati Votazioni:*")
+    # Fine serata: si chiudono tutti i turni ancora aperti
+    for artist_key in list(scoreboard.rounds):
+        scoreboard.close_round(artist_key)
+        sessions.drop_round(artist_key)
+    save_bot_data(context.bot_data, "open_rounds")
 
-    for artist_key, artist in artists_data.items():
-        categoria = artist.get("categoria", "Giovani Promesse")
+    owners_ids = context.bot_data.get("owners_ids", set())
+    for chunk in split_message(message):
+        async def send_results(owner_id: int, chunk=chunk):
+            await context.bot.send_message(chat_id=owner_id, text=chunk, parse_mode=ParseMode.MARKDOWN_V2)
 
-        pop_votes = votes_popolare.get(artist_key, {})
-        avg_pop = sum(pop_votes.values()) / len(pop_votes) if pop_votes else 0.0
+        await broadcaster.broadcast(owners_ids, send_results, "Risultati")
+    await send_results_export(context, owners_ids)
 
-        tech_votes = votes_tecnica.get(artist_key, {})
-        tech_list = [sum(aspects.values()) / len(aspects) for aspects in tech_votes.values() if aspects]
-        avg_tech = sum(tech_list) / len(tech_list) if tech_list else 0.0
+async def send_results_export(context: ContextTypes.DEFAULT_TYPE, chat_ids) -> None:
+    """Genera l'esportazione dei risultati nel pool di processi e la invia come documenti."""
+    artists = context.bot_data.get("artists", {})
+    snapshot = results_snapshot(artists, vote_store, scoreboard.standings(artists))
+    try:
+        files = await results_exporter.export(snapshot)
+    except Exception as e:
+        text = f"Esportazione dei risultati fallita: {e}"
+        logger.error(text)
 
-        overall_avg = (avg_pop + avg_tech) / 2
-        nome_esc = escape_markdown(artist.get("nome", ""), version=2)
+        async def send_failure(chat_id: int):
+            await context.bot.send_message(chat_id=chat_id, text=text)
 
-        ranking.setdefault(categoria, []).append((overall_avg, nome_esc, avg_pop, avg_tech))
+        await broadcaster.broadcast(chat_ids, send_failure, "Esportazione fallita")
+        return
+    for export_file in files:
+        async def send_file(chat_id: int, export_file=export_file):
+            await context.bot.send_document(
+                chat_id=chat_id, document=export_file.data, filename=export_file.filename, caption=export_file.caption,
+            )
 
-    for entries in ranking.values():
-        entries.sort(key=lambda x: x[0], reverse=True)
+        await broadcaster.broadcast(chat_ids, send_file, f"Esportazione {export_file.filename}")
 
-    parts = ["*🏆 Risultati Votazioni:*"]
-    for categoria, entries in ranking.items():
-        if not entries:
-            continue
-        cat_esc = escape_markdown(categoria, version=2)
-        parts.append(f"\n*Categoria: {cat_esc}*")
-        for overall, nome, pop_m, tech_m in entries:
-            overall_str = escape_markdown(f"{overall:.2f}", version=2)
-            pop_str = escape_markdown(f"{pop_m:.2f}", version=2)
-            tech_str = escape_markdown(f"{tech_m:.2f}", version=2)
-            parts.append(
-                f"*{nome}: {overall_str}*\n"
-                f"\\- Popolare: {pop_str}\n"
-                f"\\- Tecnica: {tech_str}\n"
-            )
-    message = "\n".join(parts)
+async def export_results_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Schede di voto (CSV/XLSX) e grafici della classifica per categoria, in qualsiasi momento."""
+    if not sessions.is_owner(update.effective_chat.id):
+        await update.message.reply_text("Non sei autorizzato ad eseguire questo comando.")
+        return
+    await update.message.reply_text("_⏳ Preparo l'esportazione dei risultati\\.\\.\\._", parse_mode=ParseMode.MARKDOWN_V2)
+    await send_results_export(context, [update.effective_chat.id])
 
-    for owner_id in context.bot_data.get("owners_ids", set()):
-        try:
-            await context.bot.send_message(chat_id=owner_id, text=message, parse_mode=ParseMode.MARKDOWN_V2)
-        except Exception as e:
-            logger.error(f"Errore nell'invio dei risultati al proprietario: {e}")
+async def standings_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Classifica parziale in qualsiasi momento della serata (solo proprietari)."""
+    if not sessions.is_owner(update.effective_chat.id):
+        await update.message.reply_text("Non sei autorizzato ad eseguire questo comando.")
+        return MAIN_MENU
+
+    message = format_standings(context, "*📊 Classifica provvisoria:*")
+    artists = context.bot_data.get("artists", {})
+    for artist_key, voting_round in scoreboard.rounds.items():
+        if artist_key in artists:
+            nome = artist_cards.name(artist_key, artists[artist_key])
+            message += f"\n_⏳ Giudici che devono ancora votare {nome}\\: {len(voting_round.pending)}_"
+    for chunk in split_message(message):
+        await update.message.reply_text(chunk, parse_mode=ParseMode.MARKDOWN_V2)
+    return MAIN_MENU
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.message.reply_text("Operazione annullata. Usa /start per riprovare.")
     return ConversationHandler.END
 
 async def logout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    if context.user_data.get("logged_in"):
-        context.user_data.pop("logged_in")
+    session = sessions.touch(update.effective_chat.id)
+    session.logged_in = False
     
-    if context.user_data.get("user_role") == "owner":
-        owners_ids = context.bot_data.get("owners_ids", set())
-        if update.effective_chat.id in owners_ids:
-            owners_ids.remove(update.effective_chat.id)
-            context.bot_data["owners_ids"] = owners_ids
-        context.user_data.pop("user_role", None)
-        save_bot_data(context.bot_data)
+    if session.owner:
+        await state_tx.apply(unregister_owner, context.bot_data, update.effective_chat.id)
+        dashboard.forget_owner(update.effective_chat.id)
     
     await update.message.reply_text("_🆓 Hai effettuato il logout\\. Usa /start per reinserire la password\\._", parse_mode=ParseMode.MARKDOWN_V2)
     return ConversationHandler.END
@@ -508,8 +1206,7 @@ def main_menu_keyboard():
     return InlineKeyboardMarkup(keyboard)
 
 async def set_limit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    owners_ids = context.bot_data.get("owners_ids", set())
-    if update.effective_chat.id not in owners_ids:
+    if not sessions.is_owner(update.effective_chat.id):
         await update.message.reply_text("Non sei autorizzato ad eseguire questo comando.")
         return MAIN_MENU
 
@@ -615,6 +1312,7 @@ async def set_value_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
             elif limit_type == "tecnica":
                 context.bot_data["max_judges_tecnica"] = new_limit
 
+            changed_key = f"max_judges_{limit_type}"
             message_text = f"_✅ Limite per la giuria {limit_type} impostato a {new_limit}\\._"
             keyboard = [[InlineKeyboardButton("🔙 Indietro", callback_data="back_to_limit_menu")]]
         except ValueError:
@@ -631,12 +1329,13 @@ async def set_value_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         elif pass_type == "owner":
             PASSWORD_OWNER = new_value
 
+        changed_key = f"password_{pass_type}"
         message_text = f"_✅ Nuova password per {pass_type} impostata correttamente\\._"
         keyboard = [[InlineKeyboardButton("🔙 Indietro", callback_data="back_to_password_menu")]]
 
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text(message_text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN_V2)
-    save_bot_data(context.bot_data)  
+    save_bot_data(context.bot_data, changed_key)
     return SET_VALUE
 
 async def set_home_picture_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -645,32 +1344,19 @@ async def set_home_picture_handler(update: Update, context: ContextTypes.DEFAULT
         await update.message.reply_text("Per favore, invia una foto valida.")
         return SET_HOME_PICTURE
 
-    
-    photo = update.message.photo[-1]
-    file = await context.bot.get_file(photo.file_id)
-
     try:
-        # Carica la nuova immagine su Cloudinary in una cartella dedicata
-        upload_result = cloudinary.uploader.upload(file.file_path, folder="home_pictures")
-        new_photo_url = upload_result.get("secure_url")
+        # Scarica, ridimensiona e carica la nuova immagine in una cartella dedicata
+        new_photo_url = await image_pipeline.ingest(context.bot, update.message.photo, "home_pictures")
 
-        if not new_photo_url:
-            raise ValueError("Caricamento su Cloudinary fallito, nessun URL restituito.")
-
-        # Se esiste una vecchia immagine, eliminala da Cloudinary
+        # Salva il nuovo URL e aggiorna il database; il file_id della vecchia foto non vale più
         old_photo_url = context.bot_data.get("home_picture_url")
-        if old_photo_url:
-            public_id = get_public_id_from_url(old_photo_url)
-            if public_id:
-                try:
-                    cloudinary.uploader.destroy(public_id)
-                    logger.info(f"Vecchia immagine home ({public_id}) eliminata da Cloudinary.")
-                except Exception as e:
-                    logger.error(f"Errore eliminazione vecchia immagine home da Cloudinary: {e}")
-
-        # Salva il nuovo URL e aggiorna il database
         context.bot_data["home_picture_url"] = new_photo_url
-        save_bot_data(context.bot_data)
+        drop_cached_photo(context.bot_data, "home_picture_file_id")
+        save_bot_data(context.bot_data, "home_picture_url", "home_picture_file_id")
+
+        # La vecchia immagine si elimina da Cloudinary in background, a URL nuovo già salvato
+        if old_photo_url:
+            destroy_cloudinary_image_later(context, old_photo_url)
 
         await update.message.reply_text(
             "_✅ Immagine di benvenuto aggiornata con successo\\!_",
@@ -720,25 +1406,27 @@ async def back_to_limit_menu_callback(update: Update, context: ContextTypes.DEFA
     )
     return SET_DETAIL
 
+def reset_votes(bot_data: dict) -> None:
+    vote_store.clear()
+    bot_data["judges_popolare"] = set()
+    bot_data["judges_tecnica"] = set()
+    bot_data["judge_types"] = {}
+    scoreboard.reset()
+    sync_sessions(bot_data)
+    save_bot_data(bot_data, "votes_popolare", "votes_tecnica", "judges_popolare", "judges_tecnica", "judge_types", "open_rounds")
+
 async def reset_voting(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    owners_ids = context.bot_data.get("owners_ids", set())
-    if update.effective_chat.id not in owners_ids:
+    if not sessions.is_owner(update.effective_chat.id):
         await update.message.reply_text("Non sei autorizzato ad eseguire questo comando.")
         return MAIN_MENU
 
-    context.bot_data["votes_popolare"] = {}
-    context.bot_data["votes_tecnica"] = {}
-    context.bot_data["judges_popolare"] = set()
-    context.bot_data["judges_tecnica"] = set()
-    context.bot_data["judge_types"] = {}
-
-    save_bot_data(context.bot_data)
+    await state_tx.apply(reset_votes, context.bot_data)
     await update.message.reply_text("✅ I dati sono stati eliminati.")
     return MAIN_MENU
 
+@timed(handler_seconds, handler="artisti_command")
 async def artisti_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    owners_ids = context.bot_data.get("owners_ids", set())
-    if update.effective_chat.id not in owners_ids:
+    if not sessions.is_owner(update.effective_chat.id):
         await update.message.reply_text("Non sei autorizzato ad eseguire questo comando.")
         return MAIN_MENU
 
@@ -751,6 +1439,7 @@ async def artisti_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await update.message.reply_text("Seleziona l'azione da eseguire:", reply_markup=reply_markup)
     return ARTISTI_CHOICE
 
+@timed(handler_seconds, handler="artisti_choice_callback")
 async def artisti_choice_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
@@ -777,12 +1466,14 @@ async def artisti_choice_callback(update: Update, context: ContextTypes.DEFAULT_
         await query.edit_message_text("Operazione annullata.")
         return MAIN_MENU
 
+@timed(handler_seconds, handler="add_artist_name_handler")
 async def add_artist_name_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     nome = update.message.text.strip()
     context.user_data["new_artist"]["nome"] = nome
     await update.message.reply_text("_🔢 Inserisci l'*età* dell'artista\\:_", parse_mode=ParseMode.MARKDOWN_V2)
     return ARTISTI_ADD_AGE
 
+@timed(handler_seconds, handler="add_artist_age_handler")
 async def add_artist_age_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     eta_str = update.message.text.strip()
     try:
@@ -794,19 +1485,14 @@ async def add_artist_age_handler(update: Update, context: ContextTypes.DEFAULT_T
         await update.message.reply_text("L'età deve essere un numero intero. Riprova:")
         return ARTISTI_ADD_AGE
 
+@timed(handler_seconds, handler="add_artist_photo_handler")
 async def add_artist_photo_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if not update.message.photo:
         await update.message.reply_text("Per favore, invia una foto valida.")
         return ARTISTI_ADD_PHOTO
 
-    photo = update.message.photo[-1]
-    file = await context.bot.get_file(photo.file_id)
-    
     try:
-        upload_result = cloudinary.uploader.upload(file.file_path, folder="artist_photos")
-        photo_url = upload_result.get("secure_url")
-        if not photo_url:
-            raise ValueError("Cloudinary did not return a secure_url")
+        photo_url = await image_pipeline.ingest(context.bot, update.message.photo, "artist_photos")
         context.user_data["new_artist"]["foto"] = photo_url
         await update.message.reply_text("_🎵 Inserisci il *titolo della canzone*\\._", parse_mode=ParseMode.MARKDOWN_V2)
         return ARTISTI_ADD_SONG
@@ -815,6 +1501,7 @@ async def add_artist_photo_handler(update: Update, context: ContextTypes.DEFAULT
         await update.message.reply_text("Si è verificato un errore durante il caricamento dell'immagine. Riprova.")
         return ARTISTI_ADD_PHOTO
 
+@timed(handler_seconds, handler="add_artist_song_handler")
 async def add_artist_song_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     canzone = update.message.text.strip()
     context.user_data["new_artist"]["canzone"] = canzone
@@ -828,6 +1515,7 @@ async def add_artist_song_handler(update: Update, context: ContextTypes.DEFAULT_
     await update.message.reply_text("_Seleziona la categoria dell'artista\\:_", reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN_V2)
     return ARTISTI_ADD_CATEGORY
 
+@timed(handler_seconds, handler="add_artist_category_handler")
 async def add_artist_category_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
@@ -843,15 +1531,18 @@ async def add_artist_category_handler(update: Update, context: ContextTypes.DEFA
 
     artists[new_key] = context.user_data["new_artist"]
     context.bot_data["artists"] = artists
-    update_artists_file(artists)
+    # La chiave può riusare quella di un artista rimosso: via la scheda in cache
+    artist_cards.invalidate(new_key)
+    save_bot_data(context.bot_data, f"artists/{new_key}")
 
     await query.edit_message_text(
-        f"_✅ Artista *{escape_markdown(context.user_data['new_artist']['nome'])}* aggiunto con successo nella categoria *{escape_markdown(categoria)}*\\._",
+        f"_✅ Artista *{escape(context.user_data['new_artist']['nome'])}* aggiunto con successo nella categoria *{escape(categoria)}*\\._",
         parse_mode=ParseMode.MARKDOWN_V2
     )
     context.user_data.pop("new_artist", None)
     return MAIN_MENU
 
+@timed(handler_seconds, handler="remove_artist_callback")
 async def remove_artist_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
@@ -870,39 +1561,150 @@ async def remove_artist_callback(update: Update, context: ContextTypes.DEFAULT_T
             photo_url = artist_to_remove.get('foto')
 
             if photo_url:
-                public_id = get_public_id_from_url(photo_url)
-                if public_id:
-                    try:
-                        cloudinary.uploader.destroy(public_id)
-                        logger.info(f"Immagine {public_id} eliminata da Cloudinary.")
-                    except Exception as e:
-                        logger.error(f"Errore durante l'eliminazione dell'immagine {public_id} da Cloudinary: {e}")
+                destroy_cloudinary_image_later(context, photo_url)
 
+            # Con il record dell'artista sparisce anche il suo file_id in cache
             del artists[key]
-            update_artists_file(artists)
-            await query.edit_message_text(f"_❎ Artista *{escape_markdown(nome)}* rimosso con successo._", parse_mode=ParseMode.MARKDOWN_V2)
+            artist_cards.invalidate(key)
+            scoreboard.drop_artist(key)
+            # Anche i suoi voti: una chiave riusata non deve ereditarli
+            vote_store.drop_artist(key)
+            sessions.drop_round(key)
+            save_bot_data(
+                context.bot_data, f"artists/{key}", f"open_rounds/{key}", f"votes_popolare/{key}", f"votes_tecnica/{key}"
+            )
+            await query.edit_message_text(f"_❎ Artista *{escape(nome)}* rimosso con successo\\._", parse_mode=ParseMode.MARKDOWN_V2)
         else:
             await query.edit_message_text("Artista non trovato.")
     return MAIN_MENU
 
-def update_artists_file(artists: dict) -> None:
-    content = "artists = " + json.dumps(artists, indent=4, ensure_ascii=False)
+async def import_artists_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not sessions.is_owner(update.effective_chat.id):
+        await update.message.reply_text("Non sei autorizzato ad eseguire questo comando.")
+        return
+    context.user_data["artist_import"] = {}
+    await update.message.reply_text(
+        "_📦 Invia un archivio *ZIP* con il CSV \\(colonne nome, età, canzone, categoria e facoltativamente foto\\) "
+        "e le foto degli artisti, oppure prima il *CSV* e poi lo *ZIP* con le foto\\._",
+        parse_mode=ParseMode.MARKDOWN_V2
+    )
+
+def add_artists(bot_data: dict, rows: List[ImportRow]) -> List[str]:
+    """Aggiunge al catalogo gli artisti importati, salvati nello stesso flush; restituisce le chiavi."""
+    artists = bot_data.setdefault("artists", {})
+    keys = []
+    counter = 1
+    for row in rows:
+        while f"artist{counter}" in artists:
+            counter += 1
+        key = f"artist{counter}"
+        artists[key] = row.artist()
+        artist_cards.invalidate(key)
+        keys.append(key)
+    save_bot_data(bot_data, *(f"artists/{key}" for key in keys))
+    return keys
+
+@timed(handler_seconds, handler="import_artists_document")
+async def import_artists_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    pending = context.user_data.get("artist_import")
+    if pending is None or not sessions.is_owner(update.effective_chat.id):
+        return
+    document = update.message.document
+    if document.file_size and document.file_size > MAX_DOCUMENT_BYTES:
+        await update.message.reply_text("Il file supera i 20 MB consentiti dalla Bot API: dividi le foto in più archivi.")
+        return
+
+    file = await context.bot.get_file(document.file_id)
+    data = bytes(await file.download_as_bytearray())
     try:
-        with open("profili.py", "w", encoding="utf-8") as f:
-            f.write(content)
-    except Exception as e:
-        print(f"Errore nell'aggiornamento di profili.py: {e}")
+        if (document.file_name or "").lower().endswith(".csv"):
+            pending["csv"] = data
+            await update.message.reply_text("CSV ricevuto, ora invia lo ZIP con le foto.")
+            return
+        csv_data, photos = await asyncio.to_thread(read_archive, data)
+        csv_data = csv_data or pending.get("csv")
+        if csv_data is None:
+            raise LineupError("Nessun CSV: inseriscilo nell'archivio o invialo prima dello ZIP.")
+        existing = [artist.get("nome", "") for artist in context.bot_data.get("artists", {}).values()]
+        rows = parse_rows(csv_data, photos, existing)
+    except LineupError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+
+    # Tutte le righe vengono validate prima di caricare qualsiasi foto
+    if not all(row.ok for row in rows):
+        for message in report(rows, "Import annullato: correggi le righe segnate e invia di nuovo l'archivio."):
+            await update.message.reply_text(message)
+        return
+
+    context.user_data.pop("artist_import", None)
+    await update.message.reply_text(f"⏳ Caricamento di {len(rows)} foto in corso...")
+    await upload_photos(rows, photos, lambda photo: image_pipeline.ingest_data(photo, "artist_photos"), IMPORT_CONCURRENCY)
+    added = await state_tx.apply(add_artists, context.bot_data, [row for row in rows if row.ok])
+    for message in report(rows, f"Import completato: {len(added)} artisti aggiunti su {len(rows)}."):
+        await update.message.reply_text(message)
 
 async def telegram_webhook(request: web.Request) -> web.Response:
     app: Application = request.app["bot_app"]
-    data = await request.json()
-    update = Update.de_json(data, app.bot)
-    await app.process_update(update)
+    ingress: UpdateIngress = request.app["update_ingress"]
+    try:
+        data = await request.json()
+        # Filtro sul JSON grezzo: gli update scartati non vengono nemmeno deserializzati
+        reason = ingress_throttle.admit(data)
+        if reason is not None:
+            query = data.get("callback_query")
+            if query is not None and "id" in query:
+                # Senza risposta il client mostra la rotellina fino al timeout
+                app.create_task(answer_dropped_query(app, query["id"], reason))
+            return web.Response(status=200)
+        update = Update.de_json(data, app.bot)
+    except Exception as e:
+        logger.warning(f"Update non valido ricevuto dal webhook: {e}")
+        return web.Response(status=400)
+
+    # L'update viene solo accodato: risponde subito a Telegram, l'elaborazione è in background
+    status = await ingress.submit(update)
+    if status == "full":
+        # Backpressure: Telegram riconsegnerà l'update più tardi
+        return web.Response(status=503)
     return web.Response(status=200)
 
+async def answer_dropped_query(app: Application, query_id: str, reason: str) -> None:
+    text = "Troppi tentativi, riprova più tardi." if reason == "attesa" else "Troppe richieste, riprova tra qualche secondo."
+    try:
+        with send_priority(NOTIFICATION):
+            await app.bot.answer_callback_query(query_id, text=text)
+    except Exception as e:
+        logger.debug(f"Risposta al callback scartato {query_id} non inviata: {e}")
+
 async def health(request):
     return web.Response(text="OK")
 
+async def queue_stats(request):
+    # Profondità ed età della coda degli update, duplicati e rifiuti, update in elaborazione
+    stats = request.app["update_ingress"].stats()
+    processor: PerChatUpdateProcessor = request.app["bot_app"].update_processor
+    stats["processing"] = processor.processing
+    stats["active_chats"] = processor.active_chats
+    stats["throttle"] = ingress_throttle.stats()
+    return web.json_response(stats)
+
+async def metrics_endpoint(request):
+    return web.Response(text=metrics.render(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+@web.middleware
+async def webhook_metrics(request: web.Request, handler):
+    if request.path != WEBHOOK_PATH or request.method != "POST":
+        return await handler(request)
+    start = time.perf_counter()
+    response = await handler(request)
+    webhook_seconds.observe(time.perf_counter() - start, status=str(response.status))
+    return response
+
+async def io_stats(request):
+    # Saturazione del pool I/O: chiamate attive, in attesa e scadute per backend
+    return web.json_response(io_executor.stats())
+
 # Modifica la sezione di configurazione del webhook all'inizio del file
 WEBHOOK_URL = os.environ["WEBHOOK_URL"].rstrip("/")
 WEBHOOK_PATH = f"/{TOKEN}"
@@ -915,15 +1717,74 @@ logger.info(f"WEBHOOK_PATH: {WEBHOOK_PATH}")
 logger.info(f"FULL_WEBHOOK: {FULL_WEBHOOK}")
 
 async def on_startup(aio_app: web.Application):
-    bot_app = Application.builder().token(TOKEN).build()
+    """Prepara l'Application e avvia in background il caricamento dello stato e
+    la registrazione del webhook: il server HTTP inizia subito ad accettare gli
+    update, che restano in coda finché lo stato non è pronto."""
+    timer = StartupTimer(started=_PROCESS_STARTED)
+    timer.record("import moduli", _IMPORTS_DONE - _PROCESS_STARTED)
+
+    update_queue = TimedUpdateQueue(maxsize=UPDATE_QUEUE_SIZE, max_in_flight=UPDATE_IN_FLIGHT)
+    global state_persistence
+    # Chi sta ancora inserendo la password non viene salvato: dopo un riavvio rifà /start
+    state_persistence = BotStatePersistence(
+        mark_dirty=lambda *paths: save_bot_data(bot_app.bot_data, *paths),
+        volatile_states={PASSWORD},
+        update_interval=PERSIST_FLUSH_MS / 1000,
+    )
+    bot_app = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(TELEGRAM_API_URL)
+        .request(ResilientRequest(
+            bot_api_seconds, bot_api_errors, bot_api_retries, bot_api_shed, bot_api_breaker,
+            max_attempts=BOT_API_ATTEMPTS,
+            max_retry_after=BOT_API_MAX_RETRY_AFTER,
+            # Upload di foto e documenti e download dei file: risposte più lente
+            method_read_timeouts={
+                "sendPhoto": BOT_API_MEDIA_TIMEOUT, "sendDocument": BOT_API_MEDIA_TIMEOUT, "getFile": BOT_API_MEDIA_TIMEOUT,
+            },
+            keepalive_expiry=BOT_API_KEEPALIVE,
+            connection_pool_size=BOT_API_POOL_SIZE,
+            # I proprietari guidano la serata: nessuna quota sulle loro risposte
+            reply_gate=lambda chat_id: sessions.is_owner(chat_id) or ingress_throttle.allow_reply(chat_id),
+            read_timeout=BOT_API_TIMEOUT,
+            write_timeout=BOT_API_TIMEOUT,
+            connect_timeout=5,
+            # Durante il fan-out dei profili si attende una connessione libera invece di fallire
+            pool_timeout=BOT_API_TIMEOUT,
+            media_write_timeout=BOT_API_MEDIA_TIMEOUT,
+        ))
+        .update_queue(update_queue)
+        .persistence(state_persistence)
+        .concurrent_updates(PerChatUpdateProcessor(UPDATE_CONCURRENCY, UPDATE_IN_FLIGHT))
+        .build()
+    )
 
-    # caricare dati bot_data
-    data = load_bot_data()
-    if data:
-        bot_app.bot_data.update(data)
-    # esempi di default
-    bot_app.bot_data.setdefault("artists", {})  # Corretto da [] a {}
-    bot_app.bot_data.setdefault("owners_ids", set())
+    bot_data = bot_app.bot_data
+    metrics.gauge(
+        "sakura_judges", "Giudici registrati per giuria",
+        lambda: {(jury,): len(bot_data.get(f"judges_{jury}", ())) for jury in ("popolare", "tecnica")}, ["jury"],
+    )
+    metrics.gauge("sakura_owners", "Proprietari autenticati", lambda: {(): len(bot_data.get("owners_ids", ()))})
+    metrics.gauge("sakura_sessions", "Sessioni in memoria per tipo", lambda: {
+        ("membro",): len(sessions) - sessions.guests, ("ospite",): sessions.guests,
+    }, ["kind"])
+    metrics.gauge("sakura_sessions_evicted", "Sessioni senza ruolo scartate dall'avvio", lambda: {(): sessions.evicted})
+    sessions.on_evict = lambda chat_id: forget_chat(bot_app, chat_id)
+    metrics.gauge("sakura_bot_api_circuit_open", "1 se le notifiche verso la Bot API sono sospese", lambda: {
+        (): 0 if bot_api_breaker.state == "closed" else 1,
+    })
+    metrics.gauge("sakura_votes", "Voti registrati per giuria (schede complete o parziali)", lambda: {
+        ("popolare",): vote_store.count_popular(), ("tecnica",): vote_store.count_technical(),
+    }, ["jury"])
+
+    global dashboard
+    dashboard = LiveDashboard(
+        bot_app.bot, broadcaster,
+        render=lambda events: render_dashboard(bot_app.bot_data, events),
+        owners=lambda: bot_app.bot_data.get("owners_ids", set()),
+        min_interval=DASHBOARD_REFRESH_SECONDS,
+    )
 
     # ConversationHandler - correggi il warning
     conv = ConversationHandler(
@@ -934,6 +1795,7 @@ async def on_startup(aio_app: web.Application):
             MAIN_MENU: [
                 CallbackQueryHandler(owner_button_handler, pattern="^artist[0-9]+$"),
                 CallbackQueryHandler(owner_button_handler, pattern="^stop_voting$"),
+                CallbackQueryHandler(owner_button_handler, pattern="^close_artist[0-9]+$"),
             ],
             SET_OPTION: [
                 CallbackQueryHandler(set_option_callback, pattern="^(set_judges|set_passwords|set_home_picture)$"),
@@ -973,45 +1835,167 @@ async def on_startup(aio_app: web.Application):
             ],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
-        per_message=True,  # Cambiato da True a False per evitare il warning
+        # Giudici e procedure guidate riprendono da dove erano dopo un riavvio
+        name=CONVERSATION_NAME,
+        persistent=True,
+        # Con per_message=True i messaggi di testo (password e voti) non entrano mai nella conversazione
+        per_message=False,
         per_user=True,
         per_chat=True,
     )
 
-    bot_app.add_handler(CommandHandler('start', start))
+    # Ogni update aggiorna l'ultimo accesso della sessione e fa scadere quelle inattive
+    bot_app.add_handler(TypeHandler(Update, track_session), group=-1)
     bot_app.add_handler(CommandHandler('set', set_limit_command))  # Corretto
     bot_app.add_handler(CommandHandler('artisti', artisti_command))
+    bot_app.add_handler(CommandHandler('importa', import_artists_command))
+    # Schede di voto a bottoni: fuori dalla conversazione, valgono anche dopo un riavvio
+    bot_app.add_handler(CallbackQueryHandler(ballot_callback, pattern=BALLOT_PATTERN))
+    bot_app.add_handler(MessageHandler(filters.Document.ALL, import_artists_document))
     bot_app.add_handler(CommandHandler('votazioni', votazioni_command))
     bot_app.add_handler(CommandHandler('reset', reset_voting))
+    bot_app.add_handler(CommandHandler('classifica', standings_command))
+    bot_app.add_handler(CommandHandler('esporta', export_results_command))
+    bot_app.add_handler(CommandHandler('notifiche', event_notifications_command))
     bot_app.add_handler(CommandHandler('logout', logout))
     bot_app.add_handler(CommandHandler('cancel', cancel))
     bot_app.add_handler(conv, group=1)
+    bot_app.add_error_handler(on_error)
+
+    aio_app["bot_app"] = bot_app
+    aio_app["update_ingress"] = UpdateIngress(update_queue, dedup_window=UPDATE_DEDUP_WINDOW, full_wait=UPDATE_QUEUE_FULL_WAIT)
+    aio_app["warm_up"] = asyncio.create_task(warm_up(bot_app, timer))
 
-    await bot_app.initialize()
+async def warm_up(bot_app: Application, timer: StartupTimer) -> None:
+    # Stato e webhook sono indipendenti: si caricano in parallelo
+    try:
+        await asyncio.gather(load_state(bot_app, timer), register_webhook(bot_app, timer))
+    except Exception:
+        logger.exception("Avvio del bot fallito: gli update in coda non verranno elaborati")
+        # initialize() attende i dati della persistenza: non deve restare bloccata
+        state_persistence.restore()
+        raise
+    restore_logins(state_persistence.conversations.get(CONVERSATION_NAME, {}))
+
+    global state_writer
+    state_writer = WriteBehindWriter(
+        resolve=lambda path: resolve_state_path(bot_app.bot_data, path),
+        sink=lambda payload: write_bot_data(payload, bot_app.bot_data),
+        interval=PERSIST_FLUSH_MS / 1000,
+    )
+    state_writer.start()
+    if artists_pending_sync:
+        save_bot_data(bot_app.bot_data, "artists")
+    if shared_state is not None:
+        await subscribe_shared_state(bot_app)
+
+    # Solo ora parte l'elaborazione degli update arrivati nel frattempo
     await bot_app.start()
+    logger.info(timer.report())
+
+def restore_logins(conversations: Dict[tuple, object]) -> None:
+    """Dopo un riavvio resta autenticato chi era già oltre la password."""
+    for chat_id, _ in conversations:
+        session = sessions.get(chat_id)
+        if session is not None and session.member:
+            session.logged_in = True
+
+async def load_state(bot_app: Application, timer: StartupTimer) -> None:
+    global storage, artists_pending_sync
+    async with timer.phase("connessione backend"):
+        storage = await io_executor.run(
+            "storage",
+            create_storage,
+            STORAGE_BACKEND,
+            credentials_path=os.getenv("GOOGLE_APPLICATION_CREDENTIALS"),
+            database_url=os.getenv("FIREBASE_DATABASE_URL"),
+            sqlite_path=SQLITE_PATH,
+        )
+        if SHARED_STATE:
+            global shared_state
+            if storage.name == "firebase":
+                shared_state = SharedState()
+            else:
+                logger.warning(f"SHARED_STATE richiede il backend firebase, non {storage.name}: modalità a replica singola")
+    # caricare dati bot_data
+    async with timer.phase("caricamento stato"):
+        data = await load_bot_data()
+        # Conversazioni e user_data arrivano con la stessa lettura e passano a PTB in initialize()
+        state_persistence.restore(data.pop("conversations", None), data.pop("user_data", None))
+        if data:
+            bot_app.bot_data.update(data)
+        if not bot_app.bot_data.get("artists"):
+            # Backend senza catalogo: copia locale, altrimenti il catalogo iniziale di profili.py
+            artists = await io_executor.run("storage", artist_store.load) or load_legacy_profiles() or {}
+            bot_app.bot_data["artists"] = artists
+            # Solo se il backend ha risposto: un backend irraggiungibile non va sovrascritto
+            artists_pending_sync = bool(data and artists)
+        bot_app.bot_data.setdefault("owners_ids", set())
+        sync_sessions(bot_app.bot_data)
+        scoreboard.rebuild(vote_store)
+        # Turni rimasti aperti prima del riavvio
+        for artist_key, opened_at in stored_rounds(bot_app.bot_data.pop("open_rounds", None)):
+            reopen_round(bot_app.bot_data, artist_key, opened_at)
+
+async def subscribe_shared_state(bot_app: Application) -> None:
+    """Le modifiche delle altre repliche arrivano dal thread del listener e
+    vengono applicate nell'event loop, come gli update."""
+    loop = asyncio.get_running_loop()
+
+    def on_event(event_type: str, path: str, data) -> None:
+        loop.call_soon_threadsafe(apply_remote_event, bot_app.bot_data, event_type, path, data)
 
-    # Imposta il webhook con logging dettagliato
     try:
-        webhook_info = await bot_app.bot.get_webhook_info()
-        logger.info(f"Webhook info attuale: {webhook_info}")
-        
-        result = await bot_app.bot.set_webhook(FULL_WEBHOOK)
-        logger.info(f"Risultato set_webhook: {result}")
-        
-        # Verifica che il webhook sia stato impostato correttamente
-        new_webhook_info = await bot_app.bot.get_webhook_info()
-        logger.info(f"Nuovo webhook info: {new_webhook_info}")
-        
+        await io_executor.run("storage", shared_state.subscribe, on_event)
+        logger.info("Modalità condivisa: sottoscrizione alle modifiche delle altre repliche attiva")
     except Exception as e:
-        logger.error(f"Errore nell'impostazione del webhook: {e}")
+        logger.error(f"Sottoscrizione allo stato condiviso fallita, le altre repliche non saranno visibili: {e}")
 
-    aio_app["bot_app"] = bot_app
-    logger.info("Webhook impostato su: %s", FULL_WEBHOOK)
+async def register_webhook(bot_app: Application, timer: StartupTimer) -> None:
+    async with timer.phase("inizializzazione bot"):
+        await bot_app.initialize()
+
+    # Imposta il webhook solo se quello registrato non coincide già
+    async with timer.phase("registrazione webhook"):
+        try:
+            webhook_info = await bot_app.bot.get_webhook_info()
+            if webhook_info.url == FULL_WEBHOOK:
+                logger.info("Webhook già impostato su: %s", FULL_WEBHOOK)
+            else:
+                logger.info(f"Webhook info attuale: {webhook_info}")
+                result = await bot_app.bot.set_webhook(FULL_WEBHOOK)
+                logger.info(f"Risultato set_webhook: {result}")
+                logger.info("Webhook impostato su: %s", FULL_WEBHOOK)
+        except Exception as e:
+            logger.error(f"Errore nell'impostazione del webhook: {e}")
 
 async def on_cleanup(aio_app: web.Application):
     bot_app: Application = aio_app["bot_app"]
-    await bot_app.stop()
+    warm_up_task: asyncio.Task = aio_app["warm_up"]
+    if not warm_up_task.done():
+        warm_up_task.cancel()
+    try:
+        await warm_up_task
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.error(f"Errore durante l'avvio del bot: {e}")
+
+    # Prima si ferma il bot: shutdown() passa alla persistenza gli ultimi stati
+    # delle conversazioni, che il writer scrive subito dopo
+    if bot_app.running:
+        await bot_app.stop()
     await bot_app.shutdown()
+    # Scrive sul backend le ultime modifiche ancora in coda
+    if state_writer is not None:
+        await state_writer.stop()
+    if shared_state is not None:
+        await io_executor.run("storage", shared_state.close)
+    if storage is not None:
+        storage.close()
+    io_executor.shutdown()
+    image_pipeline.shutdown()
+    results_exporter.shutdown()
 
 
 def main():
@@ -1030,13 +2014,22 @@ def main():
     logger.info(f"WEBHOOK_URL: {webhook_url}")
     logger.info(f"WEBHOOK_PATH: {WEBHOOK_PATH}")
     logger.info(f"FULL_WEBHOOK: {FULL_WEBHOOK}")
-    
-    aio_app = web.Application()
+
+    port = int(os.environ.get("PORT", 10000))
+    logger.info(f"Avvio server su porta: {port}")
+    web.run_app(create_web_app(), host="0.0.0.0", port=port)
+
+def create_web_app() -> web.Application:
+    """Server aiohttp con webhook, health-check e statistiche (usato anche da loadtest.py)."""
+    aio_app = web.Application(middlewares=[webhook_metrics])
     aio_app.on_startup.append(on_startup)
     aio_app.on_cleanup.append(on_cleanup)
 
     # health-check (opzionale ma utile)
     aio_app.router.add_get("/", health)
+    aio_app.router.add_get("/io", io_stats)
+    aio_app.router.add_get("/queue", queue_stats)
+    aio_app.router.add_get("/metrics", metrics_endpoint)
 
     # monta l'unico POST che serve, su /<TOKEN>
     aio_app.router.add_post(WEBHOOK_PATH, telegram_webhook)
@@ -1044,10 +2037,7 @@ def main():
     aio_app.router.add_get(WEBHOOK_PATH, health)
 
     logger.info(f"Route POST configurata su: {WEBHOOK_PATH}")
-
-    port = int(os.environ.get("PORT", 10000))
-    logger.info(f"Avvio server su porta: {port}")
-    web.run_app(aio_app, host="0.0.0.0", port=port)
+    return aio_app
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,41 @@
+import logging
+from typing import Awaitable, Callable, Optional
+
+from telegram import Message
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+
+async def send_cached_photo(
+    send: Callable[[str], Awaitable[Message]],
+    record: dict,
+    url_key: str,
+    id_key: str,
+    on_change: Optional[Callable[[], None]] = None,
+) -> Message:
+    """Invia la foto di `record` usando il file_id Telegram se già noto,
+    altrimenti l'URL Cloudinary; dopo il primo invio riuscito salva il file_id
+    in `record[id_key]` così i destinatari successivi non lo riscaricano."""
+    file_id = record.get(id_key)
+    if file_id:
+        try:
+            return await send(file_id)
+        except BadRequest as e:
+            # file_id non più valido: si torna all'URL e lo si ricalcola
+            logger.warning(f"file_id non valido per {url_key}, uso l'URL: {e}")
+            record.pop(id_key, None)
+            if on_change:
+                on_change()
+
+    message = await send(record[url_key])
+    if message.photo and record.get(id_key) is None:
+        record[id_key] = message.photo[-1].file_id
+        if on_change:
+            on_change()
+    return message
+
+
+def drop_cached_photo(record: dict, id_key: str) -> bool:
+    """Rimuove il file_id memorizzato (foto sostituita); True se c'era."""
+    return record.pop(id_key, None) is not None
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Collection, Dict, Iterable, Optional, Set, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+
+def collapse_paths(paths: Iterable[str]) -> Set[str]:
+    """Rimuove i percorsi già coperti da un loro antenato (es. 'a/b' se c'è 'a')."""
+    unique = set(paths)
+    collapsed = set()
+    for path in unique:
+        parts = path.split("/")
+        if any("/".join(parts[:i]) in unique for i in range(1, len(parts))):
+            continue
+        collapsed.add(path)
+    return collapsed
+
+
+class WriteBehindWriter:
+    """Persistenza write-behind: accumula i percorsi modificati e li scrive
+    tutti insieme con un singolo update multi-path ogni `interval` secondi.
+
+    `resolve(path)` restituisce il valore da salvare per un percorso (None per
+    cancellarlo), `sink(payload)` è la coroutine che esegue la scrittura vera e propria.
+    """
+
+    def __init__(self, resolve: Callable[[str], Any], sink: Callable[[Dict[str, Any]], Awaitable[None]], interval: float = 0.5):
+        self.resolve = resolve
+        self.sink = sink
+        self.interval = interval
+        self._dirty: Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def mark_dirty(self, *paths: str) -> None:
+        self._dirty.update(paths)
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            # Lascia accumulare le modifiche del burst prima di scrivere
+            await asyncio.sleep(self.interval)
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            paths = collapse_paths(self._dirty)
+            self._dirty.clear()
+            payload = {path: self.resolve(path) for path in paths}
+            try:
+                await self.sink(payload)
+                logger.debug(f"Persistiti {len(payload)} percorsi modificati")
+            except Exception as e:
+                logger.error(f"Errore nel salvataggio dei dati, nuovo tentativo al prossimo flush: {e}")
+                self.mark_dirty(*paths)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+def conversation_key(key: Tuple[int, ...]) -> str:
+    """Chiave di conversazione (chat, utente) nel formato dei percorsi: '<chat>:<utente>'."""
+    return ":".join(str(part) for part in key)
+
+
+def _json_safe(data: dict) -> dict:
+    # Solo i valori serializzabili: i dati di passaggio (es. il CSV di /importa in
+    # attesa dello ZIP) restano in memoria e dopo un riavvio vanno rimandati
+    safe = {}
+    for key, value in data.items():
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        safe[str(key)] = value
+    return safe
+
+
+def _items(node) -> Iterable[Tuple[str, Any]]:
+    # Firebase restituisce come lista i nodi con chiavi numeriche consecutive
+    if isinstance(node, list):
+        return ((str(index), value) for index, value in enumerate(node) if value is not None)
+    return (node or {}).items()
+
+
+class BotStatePersistence(BasePersistence):
+    """Stati delle ConversationHandler e user_data salvati nello stesso backend
+    di bot_data, sotto 'conversations/<nome>/<chat>:<utente>' e 'user_data/<id>'.
+
+    Ogni modifica segnalata da PTB diventa un percorso per `mark_dirty` (il
+    writer write-behind la scrive al flush successivo); all'avvio tutto arriva
+    dalla lettura unica dello stato tramite `restore`. Gli stati in
+    `volatile_states` (es. l'attesa della password) non vengono salvati.
+    """
+
+    def __init__(self, mark_dirty: Callable[..., None], volatile_states: Collection[object] = (), update_interval: float = 1.0):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.mark_dirty = mark_dirty
+        self.volatile_states = set(volatile_states)
+        self.conversations: Dict[str, Dict[Tuple[int, ...], object]] = {}
+        self.user_data: Dict[int, dict] = {}
+        self._restored = asyncio.Event()
+
+    def restore(self, conversations=None, user_data=None) -> None:
+        """Dati letti all'avvio dal backend; va chiamato anche se la lettura fallisce."""
+        for name, states in _items(conversations):
+            self.conversations[name] = {
+                tuple(int(part) for part in key.split(":")): state for key, state in _items(states) if state is not None
+            }
+        for user_id, data in _items(user_data):
+            if isinstance(data, dict):
+                self.user_data[int(user_id)] = data
+        self._restored.set()
+        logger.info(
+            f"Ripristinati {sum(len(states) for states in self.conversations.values())} stati di conversazione "
+            f"e {len(self.user_data)} user_data"
+        )
+
+    def resolve(self, keys: list):
+        """Valore da salvare per un percorso sotto 'conversations' o 'user_data' (senza la testa)."""
+        head, rest = keys[0], keys[1:]
+        if head == "conversations":
+            if not rest:
+                return {name: self.resolve([head, name]) for name in self.conversations} or None
+            states = self.conversations.get(rest[0], {})
+            if len(rest) == 1:
+                return {conversation_key(key): state for key, state in states.items()} or None
+            return states.get(tuple(int(part) for part in rest[1].split(":")))
+        if not rest:
+            return {str(user_id): data for user_id, data in self.user_data.items()} or None
+        return self.user_data.get(int(rest[0]))
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        await self._restored.wait()
+        return {user_id: dict(data) for user_id, data in self.user_data.items()}
+
+    async def get_conversations(self, name: str) -> Dict[Tuple[int, ...], object]:
+        await self._restored.wait()
+        return dict(self.conversations.get(name, {}))
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]) -> None:
+        states = self.conversations.setdefault(name, {})
+        if new_state is None or new_state in self.volatile_states:
+            if states.pop(key, None) is None:
+                return
+        elif states.get(key) == new_state:
+            return
+        else:
+            states[key] = new_state
+        self.mark_dirty(f"conversations/{name}/{conversation_key(key)}")
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        data = _json_safe(data)
+        if data == self.user_data.get(user_id, {}):
+            return
+        if data:
+            self.user_data[user_id] = data
+        else:
+            self.user_data.pop(user_id, None)
+        self.mark_dirty(f"user_data/{user_id}")
+
+    async def drop_user_data(self, user_id: int) -> None:
+        if self.user_data.pop(user_id, None) is not None:
+            self.mark_dirty(f"user_data/{user_id}")
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        # Le scritture passano dal writer write-behind, che fa l'ultimo flush allo spegnimento
+        pass
+
+    # chat_data, bot_data e callback_data non passano da qui: bot_data ha già il suo salvataggio per percorsi
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
@@ -0,0 +1,215 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from telegram.helpers import escape_markdown
+
+MAX_MESSAGE_LENGTH = 4096
+
+
+@lru_cache(maxsize=4096)
+def escape(text: str) -> str:
+    """escape_markdown (MarkdownV2) con cache: nomi, canzoni e categorie si ripetono."""
+    return escape_markdown(text, version=2)
+
+
+@lru_cache(maxsize=4096)
+def user_link(user_id: int, first_name: str) -> str:
+    """Nome cliccabile di un utente, già escapato per MarkdownV2."""
+    return f"[{escape(first_name or '')}](tg://user?id={user_id})"
+
+
+def score(value: float) -> str:
+    # "7.50" -> "7\\.50" senza passare da escape_markdown
+    return f"{value:.2f}".replace(".", "\\.").replace("-", "\\-")
+
+
+class ArtistCards:
+    """Testi MarkdownV2 di ogni artista (nome, scheda, didascalia del profilo per
+    tipo di giuria) calcolati alla prima richiesta e riusati per tutti i
+    destinatari. Va invalidata quando un artista viene aggiunto o rimosso."""
+
+    def __init__(self, prompts: Dict[str, str]):
+        # Invito al voto in coda alla scheda, per tipo di giuria (già in MarkdownV2)
+        self.prompts = prompts
+        self._entries: Dict[str, Dict[str, str]] = {}
+
+    def _entry(self, artist_key: str, artist: dict) -> Dict[str, str]:
+        entry = self._entries.get(artist_key)
+        if entry is None:
+            name = escape(artist.get("nome", ""))
+            card = "\n".join((
+                f"*Nome:* {name}",
+                f"*Età:* {escape(str(artist.get('età', '')))}",
+                f"*Canzone:* {escape(artist.get('canzone', ''))}",
+            ))
+            entry = {"name": name, "card": card}
+            for jury_type, prompt in self.prompts.items():
+                entry[f"caption_{jury_type}"] = card + prompt
+            self._entries[artist_key] = entry
+        return entry
+
+    def name(self, artist_key: str, artist: dict) -> str:
+        return self._entry(artist_key, artist)["name"]
+
+    def card(self, artist_key: str, artist: dict) -> str:
+        return self._entry(artist_key, artist)["card"]
+
+    def caption(self, artist_key: str, artist: dict, jury_type: str) -> str:
+        return self._entry(artist_key, artist)[f"caption_{jury_type}"]
+
+    def invalidate(self, artist_key: Optional[str] = None) -> None:
+        if artist_key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(artist_key, None)
+
+
+# Marcatori MarkdownV2 che aprono e chiudono un'entità (i doppi prima dei singoli)
+_TOGGLES = ("||", "__", "*", "_", "~", "`")
+_MARKER_CHARS = "*_~|`"
+# Spazio lasciato a fine pezzo per richiudere le entità aperte
+_CLOSE_RESERVE = 16
+
+
+def _scan(text: str) -> Tuple[List[str], Optional[int]]:
+    """Entità MarkdownV2 rimaste aperte alla fine di `text` (in ordine di
+    apertura) e inizio dell'eventuale link non ancora chiuso."""
+    stack: List[str] = []
+    link_start: Optional[int] = None
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if stack and stack[-1] == "`":
+            # Nel codice conta solo la chiusura
+            if ch == "`":
+                stack.pop()
+            i += 1
+            continue
+        if link_start is not None and text.startswith("](", i):
+            j = i + 2
+            while j < len(text) and text[j] != ")":
+                j += 2 if text[j] == "\\" else 1
+            if j >= len(text):
+                break
+            link_start = None
+            i = j + 1
+            continue
+        if ch == "[":
+            link_start = i
+            i += 1
+            continue
+        marker = next((m for m in _TOGGLES if text.startswith(m, i)), None)
+        if marker is None:
+            i += 1
+            continue
+        if stack and stack[-1] == marker:
+            stack.pop()
+        else:
+            stack.append(marker)
+        i += len(marker)
+    return stack, link_start
+
+
+def _cut_ok(reopen: str, line: str, cut: int) -> bool:
+    """Vero se tagliare `line` in `cut` non separa un escape dal suo carattere,
+    non spezza un link o un marcatore doppio e non forma marcatori doppi con le
+    entità richiuse e riaperte (`reopen` sono quelle riaperte davanti alla riga)."""
+    opened, link_start = _scan(reopen + line[:cut])
+    if link_start is not None:
+        return False
+    backslashes = 0
+    while backslashes < cut and line[cut - 1 - backslashes] == "\\":
+        backslashes += 1
+    if backslashes % 2 or line[cut - 1] in _MARKER_CHARS and line[cut - 1] == line[cut]:
+        return False
+    if not opened:
+        return True
+    # Il pezzo dopo comincia dopo lo spazio saltato: conta quel carattere
+    following = line[cut + 1:cut + 2] if line[cut] == " " else line[cut]
+    return line[cut - 1] != opened[-1][0] and following != opened[-1][-1]
+
+
+def _safe_cut(reopen: str, line: str, cut: int, limit: int) -> int:
+    """Cerca il taglio valido più vicino prima di `cut`; se non ce n'è, il
+    primo dopo che stia ancora nel limite. Senza alternative resta `cut`."""
+    candidate = cut
+    while candidate > 0:
+        _, link_start = _scan(reopen + line[:candidate])
+        if link_start is not None and link_start >= len(reopen):
+            candidate = link_start - len(reopen)
+            continue
+        if _cut_ok(reopen, line, candidate):
+            return candidate
+        candidate -= 1
+    for candidate in range(cut + 1, len(line)):
+        opened = _scan(reopen + line[:candidate])[0]
+        if len(reopen) + candidate + sum(map(len, opened)) > limit:
+            break
+        if _cut_ok(reopen, line, candidate):
+            return candidate
+    return cut
+
+
+def _split_line(line: str, limit: int, markdown: bool) -> List[str]:
+    """Divide una riga più lunga del limite, preferibilmente su uno spazio."""
+    pieces: List[str] = []
+    reopen = ""
+    while len(reopen) + len(line) > limit:
+        room = limit - len(reopen) - (_CLOSE_RESERVE if markdown else 0)
+        cut = line.rfind(" ", room // 2, room)
+        if cut <= 0:
+            cut = room
+        if markdown:
+            cut = _safe_cut(reopen, line, cut, limit)
+        head = reopen + line[:cut]
+        opened = _scan(head)[0] if markdown else []
+        pieces.append(head + "".join(reversed(opened)))
+        reopen = "".join(opened)
+        line = line[cut + 1:] if line[cut] == " " else line[cut:]
+    pieces.append(reopen + line)
+    return pieces
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH, markdown: bool = True) -> List[str]:
+    """Divide un testo in messaggi entro il limite di Telegram, andando a capo
+    tra una riga e l'altra (le entità MarkdownV2 non attraversano le righe).
+
+    Una riga più lunga del limite si divide a sua volta senza separare un
+    escape dal suo carattere né spezzare un link; con `markdown` le entità
+    aperte si chiudono a fine pezzo e si riaprono all'inizio del successivo.
+    """
+    messages: List[str] = []
+    current = ""
+    for line in text.split("\n"):
+        for piece in _split_line(line, limit, markdown) if len(line) > limit else (line,):
+            if current and len(current) + len(piece) + 1 > limit:
+                messages.append(current)
+                current = ""
+            current = f"{current}\n{piece}" if current else piece
+    messages.append(current)
+    return messages
+
+
+def render_standings(
+    title: str,
+    ranking: Dict[str, List[Tuple[float, str, float, float]]],
+    artists: Dict[str, dict],
+    cards: ArtistCards,
+) -> str:
+    """Classifica per categoria in MarkdownV2, costruita con un'unica join."""
+    parts: List[str] = [title]
+    for categoria, entries in ranking.items():
+        if not entries:
+            continue
+        parts.append(f"\n*Categoria: {escape(categoria)}*")
+        parts.extend(
+            f"*{cards.name(artist_key, artists[artist_key])}: {score(overall)}*\n"
+            f"\\- Popolare: {score(pop_m)}\n"
+            f"\\- Tecnica: {score(tech_m)}\n"
+            for overall, artist_key, pop_m, tech_m in entries
+        )
+    return "\n".join(parts)
+
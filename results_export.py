@@ -0,0 +1,170 @@
+import asyncio
+import csv
+import io
+import logging
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+VOTE_COLUMNS = ("artista", "nome", "categoria", "giuria", "giudice", "ambito", "voto")
+RANKING_COLUMNS = ("categoria", "posizione", "artista", "nome", "media", "popolare", "tecnica")
+
+
+@dataclass
+class ExportFile:
+    filename: str
+    data: bytes
+    caption: str
+
+
+def results_snapshot(artists: Dict[str, dict], votes, ranking: Dict[str, List[Tuple[float, str, float, float]]]) -> dict:
+    """Copia dei risultati fatta di soli dict e liste, da passare al processo
+    che genera i file. Va costruita nel thread dell'event loop."""
+    popular = {artist_key: dict(votes.iter_popular(artist_key)) for artist_key in votes.artist_keys}
+    technical = {
+        artist_key: {judge_id: votes.technical_ballot(artist_key, judge_id) for judge_id, _ in votes.iter_technical(artist_key)}
+        for artist_key in votes.artist_keys
+    }
+    return {
+        "ambiti": list(votes.ambiti),
+        "artists": {key: {"nome": artist.get("nome", key), "categoria": artist.get("categoria", "")} for key, artist in artists.items()},
+        "popular": popular,
+        "technical": technical,
+        "ranking": {categoria: list(entries) for categoria, entries in ranking.items()},
+    }
+
+
+def _vote_rows(snapshot: dict) -> List[tuple]:
+    # Una riga per voto: i popolari senza ambito, i tecnici uno per ambito
+    artists = snapshot["artists"]
+    rows = []
+    for artist_key in artists.keys() | snapshot["popular"].keys() | snapshot["technical"].keys():
+        artist = artists.get(artist_key, {"nome": artist_key, "categoria": ""})
+        prefix = (artist_key, artist["nome"], artist["categoria"])
+        for judge_id, value in sorted(snapshot["popular"].get(artist_key, {}).items()):
+            rows.append(prefix + ("popolare", judge_id, "", value))
+        for judge_id, ballot in sorted(snapshot["technical"].get(artist_key, {}).items()):
+            for ambito in snapshot["ambiti"]:
+                if ambito in ballot:
+                    rows.append(prefix + ("tecnica", judge_id, ambito, ballot[ambito]))
+    return sorted(rows, key=lambda row: (row[2], row[1], row[3], row[4]))
+
+
+def _ranking_rows(snapshot: dict) -> List[tuple]:
+    artists = snapshot["artists"]
+    return [
+        (categoria, position, artist_key, artists[artist_key]["nome"], round(overall, 2), round(pop_m, 2), round(tech_m, 2))
+        for categoria, entries in snapshot["ranking"].items()
+        for position, (overall, artist_key, pop_m, tech_m) in enumerate(entries, start=1)
+    ]
+
+
+def build_csv(rows: List[tuple]) -> bytes:
+    # ';' e BOM: Excel in italiano apre il file senza passare dall'importazione guidata
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=";")
+    writer.writerow(VOTE_COLUMNS)
+    writer.writerows(rows)
+    return output.getvalue().encode("utf-8-sig")
+
+
+def build_xlsx(vote_rows: List[tuple], ranking_rows: List[tuple]) -> Optional[bytes]:
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        logger.warning("openpyxl non installato: esportazione XLSX saltata")
+        return None
+    workbook = Workbook()
+    votes_sheet = workbook.active
+    votes_sheet.title = "Voti"
+    ranking_sheet = workbook.create_sheet("Classifica")
+    for sheet, columns, rows in ((votes_sheet, VOTE_COLUMNS, vote_rows), (ranking_sheet, RANKING_COLUMNS, ranking_rows)):
+        sheet.append(columns)
+        for row in rows:
+            sheet.append(row)
+        sheet.freeze_panes = "A2"
+        sheet.auto_filter.ref = sheet.dimensions
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def build_chart(categoria: str, entries: List[Tuple[float, str, float, float]], artists: Dict[str, dict]) -> bytes:
+    """Classifica di una categoria come grafico a barre orizzontali (media
+    complessiva, popolare e tecnica), in PNG."""
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+
+    names = [artists[artist_key]["nome"] for _, artist_key, _, _ in entries][::-1]
+    positions = range(len(names))
+    height = 0.27
+    figure, axes = plt.subplots(figsize=(8, max(2.5, 0.55 * len(names) + 1.2)))
+    try:
+        for offset, index, label in ((height, 2, "Popolare"), (0, 0, "Media"), (-height, 3, "Tecnica")):
+            values = [entry[index] for entry in entries][::-1]
+            bars = axes.barh([p + offset for p in positions], values, height, label=label)
+            if index == 0:
+                axes.bar_label(bars, fmt="%.2f", padding=3, fontsize=8)
+        axes.set_yticks(list(positions), names)
+        axes.set_xlim(0, 10.5)
+        axes.set_xlabel("Voto medio")
+        axes.set_title(f"Classifica — {categoria}")
+        axes.legend(loc="lower right", fontsize=8)
+        figure.tight_layout()
+        output = io.BytesIO()
+        figure.savefig(output, format="png", dpi=120)
+        return output.getvalue()
+    finally:
+        plt.close(figure)
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", text.lower()).strip("_") or "categoria"
+
+
+def build_export(snapshot: dict) -> List[ExportFile]:
+    """Genera tutti i file dell'esportazione. Gira in un processo separato (CPU-bound)."""
+    vote_rows = _vote_rows(snapshot)
+    ranking_rows = _ranking_rows(snapshot)
+    files = [ExportFile("voti.csv", build_csv(vote_rows), f"Schede di voto: {len(vote_rows)} voti")]
+    xlsx = build_xlsx(vote_rows, ranking_rows)
+    if xlsx is not None:
+        files.append(ExportFile("risultati.xlsx", xlsx, "Voti e classifica in formato Excel"))
+    for categoria, entries in snapshot["ranking"].items():
+        if entries:
+            files.append(ExportFile(
+                f"classifica_{_slug(categoria)}.png", build_chart(categoria, entries, snapshot["artists"]), f"Classifica {categoria}",
+            ))
+    return files
+
+
+class ResultsExporter:
+    """Esportazione dei risultati (CSV e XLSX dei voti, grafici per categoria)
+    generata in un pool di processi, così l'event loop continua a servire i voti."""
+
+    def __init__(self, workers: int = 1):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # forkserver: i worker non ereditano thread e stato del processo del bot
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload([__name__])
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self._pool
+
+    async def export(self, snapshot: dict) -> List[ExportFile]:
+        loop = asyncio.get_running_loop()
+        files = await loop.run_in_executor(self._executor(), build_export, snapshot)
+        logger.info(f"Esportazione risultati: {len(files)} file, {sum(len(f.data) for f in files) // 1024} KB")
+        return files
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
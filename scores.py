@@ -0,0 +1,150 @@
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+from vote_store import VoteStore
+
+
+@dataclass
+class ArtistScore:
+    pop_sum: float = 0.0
+    pop_count: int = 0
+    # Per ogni giudice tecnico: (somma dei voti, numero di ambiti votati)
+    tech_judges: Dict[Hashable, Tuple[float, int]] = field(default_factory=dict)
+    # Somma delle medie dei singoli giudici tecnici
+    tech_means_sum: float = 0.0
+
+    @property
+    def avg_pop(self) -> float:
+        return self.pop_sum / self.pop_count if self.pop_count else 0.0
+
+    @property
+    def avg_tech(self) -> float:
+        return self.tech_means_sum / len(self.tech_judges) if self.tech_judges else 0.0
+
+    @property
+    def overall(self) -> float:
+        return (self.avg_pop + self.avg_tech) / 2
+
+
+def recompute_averages(votes: VoteStore, artist_key: str) -> Tuple[float, float]:
+    """Ricalcolo completo (media popolare, media tecnica) di un artista dai voti grezzi."""
+    pop_votes = [value for _, value in votes.iter_popular(artist_key)]
+    avg_pop = sum(pop_votes) / len(pop_votes) if pop_votes else 0.0
+
+    tech_list = [sum(scores) / len(scores) for _, scores in votes.iter_technical(artist_key)]
+    avg_tech = sum(tech_list) / len(tech_list) if tech_list else 0.0
+    return avg_pop, avg_tech
+
+
+@dataclass
+class VotingRound:
+    """Turno aperto per un artista: giudici attesi e quelli che non hanno ancora finito."""
+    expected: int
+    pending: Set[Hashable]
+    # Istante di apertura (epoch), ordina i turni anche tra più repliche
+    opened_at: float = 0.0
+
+    @property
+    def received(self) -> int:
+        return self.expected - len(self.pending)
+
+
+class ScoreBoard:
+    """Medie per artista aggiornate in O(1) a ogni voto.
+
+    Produce gli stessi valori del ricalcolo completo fatto sul VoteStore:
+    media semplice dei voti popolari e media
+    delle medie dei giudici tecnici.
+    """
+
+    def __init__(self, ambiti_count: int):
+        self.ambiti_count = ambiti_count
+        self.artists: Dict[str, ArtistScore] = {}
+        # Turni aperti contemporaneamente, in ordine di apertura
+        self.rounds: Dict[str, VotingRound] = {}
+
+    def _score(self, artist_key: str) -> ArtistScore:
+        score = self.artists.get(artist_key)
+        if score is None:
+            score = self.artists[artist_key] = ArtistScore()
+        return score
+
+    def record_popular(self, artist_key: str, judge_id: Hashable, value: float) -> None:
+        score = self._score(artist_key)
+        score.pop_sum += value
+        score.pop_count += 1
+        voting_round = self.rounds.get(artist_key)
+        if voting_round is not None:
+            voting_round.pending.discard(judge_id)
+
+    def record_technical(self, artist_key: str, judge_id: Hashable, value: float) -> None:
+        score = self._score(artist_key)
+        total, count = score.tech_judges.get(judge_id, (0.0, 0))
+        if count:
+            score.tech_means_sum -= total / count
+        total, count = total + value, count + 1
+        score.tech_judges[judge_id] = (total, count)
+        score.tech_means_sum += total / count
+        voting_round = self.rounds.get(artist_key)
+        if voting_round is not None and count >= self.ambiti_count:
+            voting_round.pending.discard(judge_id)
+
+    def open_round(self, artist_key: str, judges: Set[Hashable], done: Set[Hashable], opened_at: Optional[float] = None) -> VotingRound:
+        """Apre (o riapre) il turno di `artist_key`; `done` sono i giudici che
+        hanno già completato il voto per questo artista."""
+        judges = set(judges)
+        voting_round = VotingRound(expected=len(judges), pending=judges - set(done), opened_at=opened_at or time.time())
+        self.rounds[artist_key] = voting_round
+        if opened_at is not None:
+            self.rounds = dict(sorted(self.rounds.items(), key=lambda item: item[1].opened_at))
+        return voting_round
+
+    def close_round(self, artist_key: str) -> Optional[VotingRound]:
+        return self.rounds.pop(artist_key, None)
+
+    def drop_artist(self, artist_key: str) -> None:
+        self.artists.pop(artist_key, None)
+        self.rounds.pop(artist_key, None)
+
+    def reset(self) -> None:
+        self.artists.clear()
+        self.rounds.clear()
+
+    def rebuild(self, votes: VoteStore) -> None:
+        """Ricostruisce i totali dai voti grezzi (all'avvio, dopo il caricamento)."""
+        self.artists.clear()
+        for artist_key in votes.artist_keys:
+            self.rebuild_artist(votes, artist_key)
+
+    def rebuild_artist(self, votes: VoteStore, artist_key: str) -> None:
+        """Ricalcola i totali di un solo artista (es. dopo voti arrivati da un'altra replica)."""
+        self.artists.pop(artist_key, None)
+        for judge_id, value in votes.iter_popular(artist_key):
+            self.record_popular(artist_key, judge_id, value)
+        for judge_id, scores in votes.iter_technical(artist_key):
+            for value in scores:
+                self.record_technical(artist_key, judge_id, value)
+
+    def verify(self, votes: VoteStore) -> bool:
+        """Confronta i totali incrementali con un ricalcolo completo dai voti grezzi."""
+        empty = ArtistScore()
+        for artist_key in set(votes.artist_keys) | set(self.artists):
+            score = self.artists.get(artist_key, empty)
+            avg_pop, avg_tech = recompute_averages(votes, artist_key)
+            if not (math.isclose(score.avg_pop, avg_pop, abs_tol=1e-9) and math.isclose(score.avg_tech, avg_tech, abs_tol=1e-9)):
+                return False
+        return True
+
+    def standings(self, artists: Dict[str, dict]) -> Dict[str, List[Tuple[float, str, float, float]]]:
+        """Classifica per categoria: (media complessiva, chiave, media popolare, media tecnica)."""
+        ranking: Dict[str, List[Tuple[float, str, float, float]]] = {}
+        empty = ArtistScore()
+        for artist_key, artist in artists.items():
+            score = self.artists.get(artist_key, empty)
+            categoria = artist.get("categoria", "Giovani Promesse")
+            ranking.setdefault(categoria, []).append((score.overall, artist_key, score.avg_pop, score.avg_tech))
+        for entries in ranking.values():
+            entries.sort(key=lambda x: x[0], reverse=True)
+        return ranking
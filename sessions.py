@@ -0,0 +1,146 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+@dataclass
+class Session:
+    """Stato di una chat: ruolo, scheda in compilazione e ultimo accesso."""
+    chat_id: int
+    owner: bool = False
+    jury_type: Optional[str] = None  # "popolare", "tecnica" o None se non è un giudice
+    # Autenticato in questa sessione (dopo /logout il giudice tiene il posto ma rifà il login)
+    logged_in: bool = False
+    # Schede tecniche a bottoni non ancora confermate, per turno (artista)
+    drafts: Dict[str, List[Optional[float]]] = field(default_factory=dict)
+    failed_logins: int = 0
+    last_seen: float = field(default_factory=time.monotonic)
+
+    @property
+    def member(self) -> bool:
+        return self.owner or self.jury_type is not None
+
+
+class SessionRegistry:
+    """Sessioni di tutte le chat, indicizzate per chat id: ruolo e tipo di giuria
+    si leggono in O(1) da ogni handler.
+
+    Giudici e proprietari occupano un posto salvato nello stato e restano finché
+    non escono (sono al massimo i limiti delle giurie); dopo `ttl` secondi di
+    inattività perdono solo le bozze. Le sessioni senza ruolo (chi prova la
+    password) scadono dopo `ttl` secondi e non sono mai più di `max_guests`:
+    oltre si scarta la meno recente, così il pubblico che tenta password per
+    tutta la serata non fa crescere la memoria. `on_evict` riceve il chat id di
+    ogni sessione scartata, per liberare i dati collegati.
+    """
+
+    def __init__(self, ttl: float = 1800, max_guests: int = 10000, on_evict: Optional[Callable[[int], None]] = None):
+        self.ttl = ttl
+        self.max_guests = max_guests
+        self.on_evict = on_evict
+        self.evicted = 0
+        self._members: Dict[int, Session] = {}
+        # In ordine di ultimo accesso: le prime sono le più vecchie
+        self._guests: "OrderedDict[int, Session]" = OrderedDict()
+        self._next_sweep = 0.0
+
+    def __len__(self) -> int:
+        return len(self._members) + len(self._guests)
+
+    @property
+    def guests(self) -> int:
+        return len(self._guests)
+
+    def get(self, chat_id: int) -> Optional[Session]:
+        return self._members.get(chat_id) or self._guests.get(chat_id)
+
+    def touch(self, chat_id: int) -> Session:
+        """Sessione della chat (creata se manca) con l'ultimo accesso aggiornato."""
+        now = time.monotonic()
+        session = self._members.get(chat_id)
+        if session is None:
+            session = self._guests.get(chat_id)
+            if session is None:
+                session = self._guests[chat_id] = Session(chat_id)
+            else:
+                self._guests.move_to_end(chat_id)
+        session.last_seen = now
+        self.evict(now)
+        return session
+
+    def is_owner(self, chat_id: int) -> bool:
+        session = self._members.get(chat_id)
+        return session is not None and session.owner
+
+    def jury_type(self, chat_id: int) -> Optional[str]:
+        session = self._members.get(chat_id)
+        return session.jury_type if session is not None else None
+
+    def logged_in(self, chat_id: int) -> bool:
+        session = self.get(chat_id)
+        return session is not None and session.logged_in
+
+    def _promote(self, chat_id: int) -> Session:
+        session = self._members.get(chat_id)
+        if session is None:
+            session = self._guests.pop(chat_id, None) or Session(chat_id)
+            self._members[chat_id] = session
+        return session
+
+    def _demote(self, session: Session) -> None:
+        if session.member:
+            return
+        self._members.pop(session.chat_id, None)
+        session.logged_in = False
+        session.drafts.clear()
+        self._guests[session.chat_id] = session
+        self._guests.move_to_end(session.chat_id)
+
+    def set_jury(self, chat_id: int, jury_type: Optional[str]) -> None:
+        session = self._promote(chat_id)
+        session.jury_type = jury_type
+        self._demote(session)
+
+    def set_owner(self, chat_id: int, owner: bool) -> None:
+        session = self._promote(chat_id)
+        session.owner = owner
+        self._demote(session)
+
+    def sync_members(self, owners: Iterable[int], popolare: Iterable[int], tecnica: Iterable[int]) -> None:
+        """Allinea i ruoli ai posti salvati (all'avvio, dopo un reset o una
+        modifica arrivata da un'altra replica). La giuria tecnica prevale."""
+        owners = set(owners)
+        juries = {chat_id: "popolare" for chat_id in popolare}
+        juries.update((chat_id, "tecnica") for chat_id in tecnica)
+        for session in list(self._members.values()):
+            if session.chat_id not in owners and session.chat_id not in juries:
+                session.owner, session.jury_type = False, None
+                self._demote(session)
+        for chat_id in owners | juries.keys():
+            session = self._promote(chat_id)
+            session.owner = chat_id in owners
+            session.jury_type = juries.get(chat_id)
+
+    def drop_round(self, artist_key: str) -> None:
+        """Turno chiuso: le bozze per quell'artista non servono più."""
+        for session in self._members.values():
+            session.drafts.pop(artist_key, None)
+
+    def evict(self, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        deadline = now - self.ttl
+        while self._guests:
+            chat_id, session = next(iter(self._guests.items()))
+            if session.last_seen > deadline and len(self._guests) <= self.max_guests:
+                break
+            del self._guests[chat_id]
+            self.evicted += 1
+            if self.on_evict is not None:
+                self.on_evict(chat_id)
+        if now >= self._next_sweep:
+            # I membri sono pochi: basta un giro ogni tanto per le bozze abbandonate
+            self._next_sweep = now + min(self.ttl, 60)
+            for session in self._members.values():
+                if session.drafts and session.last_seen <= deadline:
+                    session.drafts.clear()
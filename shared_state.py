@@ -0,0 +1,93 @@
+import logging
+import threading
+from typing import Any, Callable, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SeatLimitReached(Exception):
+    """Transazione annullata: il gruppo ha già raggiunto il limite di posti."""
+
+
+def member_ids(value: Any) -> Set[int]:
+    """Id dei membri di un gruppo salvato come {id: true} (o come vecchia lista [id, ...])."""
+    if isinstance(value, dict):
+        return {int(key) for key, present in value.items() if present}
+    return {int(item) for item in value or [] if item is not None}
+
+
+def split_event(event_type: str, path: str, data: Any, heads: Iterable[str]) -> List[Tuple[List[str], Any]]:
+    """Scompone un evento del Realtime Database in una lista di put (chiavi del
+    percorso, nuovo valore). I patch multi-path hanno chiavi con '/'; il put
+    sulla radice (a ogni connessione) sostituisce tutti i nodi in `heads`."""
+    keys = [key for key in path.split("/") if key]
+    if event_type == "patch":
+        return [(keys + [key for key in sub_path.split("/") if key], value) for sub_path, value in (data or {}).items()]
+    if not keys:
+        data = data if isinstance(data, dict) else {}
+        return [([head], data.get(head)) for head in heads]
+    return [(keys, data)]
+
+
+class SharedState:
+    """Stato condiviso tra più repliche del bot sul Realtime Database.
+
+    - i posti (giudici per giuria, proprietari) si occupano con una transazione
+      sul nodo del gruppo ({id: true}), così il limite vale per tutte le repliche;
+    - ogni voto si scrive sul proprio percorso con una scrittura condizionale
+      "solo se assente": vince la prima replica, le altre ricevono il valore;
+    - una sottoscrizione al nodo radice riporta le modifiche delle altre repliche.
+
+    Richiede firebase_admin già inizializzato (lo fa FirebaseStorage). I metodi
+    sono bloccanti e vanno eseguiti tramite l'IOExecutor.
+    """
+
+    def __init__(self, root: str = "bot_data"):
+        from firebase_admin import db
+
+        self._ref = db.reference(root)
+        self._listener = None
+        self.conflicts = 0
+
+    def claim_seat(self, group: str, chat_id: int, limit: Optional[int]) -> bool:
+        def claim(current):
+            members = member_ids(current)
+            if chat_id not in members and limit and len(members) >= limit:
+                raise SeatLimitReached()
+            members.add(chat_id)
+            return {str(member): True for member in members}
+
+        try:
+            self._ref.child(group).transaction(claim)
+            return True
+        except SeatLimitReached:
+            return False
+
+    def write_once(self, path: str, value: Any) -> Tuple[bool, Any]:
+        """Scrive `value` in `path` solo se il percorso è vuoto; restituisce
+        (scritto, valore presente sul backend)."""
+        ref = self._ref.child(path)
+        current, etag = ref.get(etag=True)
+        while current is None:
+            written, current, etag = ref.set_if_unchanged(etag, value)
+            if written:
+                return True, value
+        self.conflicts += 1
+        return False, current
+
+    def subscribe(self, callback: Callable[[str, str, Any], None]) -> None:
+        """Apre lo stream degli eventi: `callback(tipo, percorso, dati)` viene
+        chiamata dal thread del listener per ogni put/patch."""
+        self._listener = self._ref.listen(lambda event: callback(event.event_type, event.path, event.data))
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Chiude lo stream. Il thread del listener si ferma solo al prossimo
+        evento o keep-alive del server: lo si attende al massimo `timeout` secondi."""
+        if self._listener is None:
+            return
+        listener, self._listener = self._listener, None
+        closer = threading.Thread(target=listener.close, daemon=True)
+        closer.start()
+        closer.join(timeout)
+        if closer.is_alive():
+            logger.warning("Stream dello stato condiviso non ancora chiuso, si prosegue")
@@ -0,0 +1,36 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Misura e registra nel log la durata di ogni fase dell'avvio.
+
+    Le fasi possono sovrapporsi (caricamento dello stato e registrazione del
+    webhook girano in parallelo): il report finale riporta sia le singole
+    durate sia il tempo totale dall'avvio del processo.
+    """
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases[name] = seconds
+        logger.info(f"Avvio - {name}: {seconds * 1000:.0f} ms")
+
+    @asynccontextmanager
+    async def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def report(self) -> str:
+        total = time.perf_counter() - self.started
+        phases = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases.items())
+        return f"Bot pronto in {total * 1000:.0f} ms ({phases})"
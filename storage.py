@@ -0,0 +1,332 @@
+import json
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StorageBackend(ABC):
+    """Interfaccia dei backend di persistenza.
+
+    Lo stato ha la stessa forma del nodo 'bot_data' su Firebase: giudici,
+    voti, artisti, impostazioni, proprietari e stati delle conversazioni. `update` riceve un dizionario
+    {percorso: valore} come quello prodotto dal writer write-behind, dove
+    un valore None cancella il percorso. Entrambi i metodi sono bloccanti e
+    vanno eseguiti tramite l'IOExecutor.
+    """
+
+    name = "storage"
+
+    @abstractmethod
+    def load(self) -> dict:
+        ...
+
+    @abstractmethod
+    def update(self, payload: Dict[str, Any]) -> None:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class FirebaseStorage(StorageBackend):
+    """Realtime Database di Firebase: un update multi-path per ogni flush."""
+
+    name = "firebase"
+
+    def __init__(self, credentials_path: Optional[str], database_url: str, root: str = "bot_data"):
+        import firebase_admin
+        from firebase_admin import credentials, db
+
+        if not firebase_admin._apps:
+            # Senza file di credenziali (es. emulatore o stub locale su http://) si usano quelle di default
+            cred = credentials.Certificate(credentials_path) if credentials_path else None
+            firebase_admin.initialize_app(cred, {
+                'databaseURL': database_url
+            })
+        self._ref = db.reference(root)
+
+    def load(self) -> dict:
+        return self._ref.get() or {}
+
+    def update(self, payload: Dict[str, Any]) -> None:
+        self._ref.update(payload)
+
+
+class SQLiteStorage(StorageBackend):
+    """Database SQLite locale in modalità WAL, una riga per voto/giudice/artista.
+
+    Ogni flush del writer diventa una sola transazione di upsert mirati, quindi
+    il costo di un voto non dipende dalla dimensione dello stato.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS judges (
+            chat_id INTEGER NOT NULL,
+            jury_type TEXT NOT NULL,
+            PRIMARY KEY (jury_type, chat_id)
+        );
+        CREATE TABLE IF NOT EXISTS owners (
+            chat_id INTEGER PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS artists (
+            key TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS votes_popolare (
+            artist TEXT NOT NULL,
+            judge INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (artist, judge)
+        );
+        CREATE TABLE IF NOT EXISTS votes_tecnica (
+            artist TEXT NOT NULL,
+            judge INTEGER NOT NULL,
+            ambito TEXT NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (artist, judge, ambito)
+        );
+        CREATE TABLE IF NOT EXISTS conversations (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            PRIMARY KEY (name, key)
+        );
+        CREATE TABLE IF NOT EXISTS user_data (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS votes_popolare_judge ON votes_popolare (judge);
+        CREATE INDEX IF NOT EXISTS votes_tecnica_judge ON votes_tecnica (judge);
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._writers: Dict[str, Callable[[List[str], Any], None]] = {
+            "votes_popolare": self._write_votes_popolare,
+            "votes_tecnica": self._write_votes_tecnica,
+            "judges_popolare": lambda rest, value: self._write_judges("popolare", rest, value),
+            "judges_tecnica": lambda rest, value: self._write_judges("tecnica", rest, value),
+            # judge_types è derivato dalla tabella judges
+            "judge_types": lambda rest, value: None,
+            "owners_ids": self._write_owners,
+            "artists": self._write_artists,
+            "conversations": self._write_conversations,
+            "user_data": self._write_user_data,
+        }
+
+    @staticmethod
+    def _set_nested(node: Any, keys: List[str], value: Any) -> Any:
+        """Restituisce `node` con il valore al percorso `keys` sostituito (None cancella)."""
+        if not keys:
+            return value
+        node = dict(node) if isinstance(node, dict) else {}
+        child = SQLiteStorage._set_nested(node.get(keys[0]), keys[1:], value)
+        if child is None:
+            node.pop(keys[0], None)
+        else:
+            node[keys[0]] = child
+        return node or None
+
+    def load(self) -> dict:
+        with self._lock:
+            cur = self._conn.cursor()
+            data: Dict[str, Any] = {key: json.loads(value) for key, value in cur.execute("SELECT key, value FROM settings")}
+
+            judges = {"popolare": [], "tecnica": []}
+            for chat_id, jury_type in cur.execute("SELECT chat_id, jury_type FROM judges"):
+                judges.setdefault(jury_type, []).append(chat_id)
+            data["judges_popolare"] = judges["popolare"]
+            data["judges_tecnica"] = judges["tecnica"]
+            data["judge_types"] = {chat_id: "tecnica" for chat_id in judges["tecnica"]}
+            data["owners_ids"] = [row[0] for row in cur.execute("SELECT chat_id FROM owners")]
+            data["artists"] = {key: json.loads(record) for key, record in cur.execute("SELECT key, data FROM artists")}
+
+            votes_popolare: Dict[str, Dict[int, float]] = {}
+            for artist, judge, score in cur.execute("SELECT artist, judge, score FROM votes_popolare"):
+                votes_popolare.setdefault(artist, {})[judge] = score
+            data["votes_popolare"] = votes_popolare
+
+            votes_tecnica: Dict[str, Dict[int, Dict[str, float]]] = {}
+            for artist, judge, ambito, score in cur.execute("SELECT artist, judge, ambito, score FROM votes_tecnica"):
+                votes_tecnica.setdefault(artist, {}).setdefault(judge, {})[ambito] = score
+            data["votes_tecnica"] = votes_tecnica
+
+            conversations: Dict[str, Dict[str, Any]] = {}
+            for name, key, state in cur.execute("SELECT name, key, state FROM conversations"):
+                conversations.setdefault(name, {})[key] = json.loads(state)
+            data["conversations"] = conversations
+            data["user_data"] = {user_id: json.loads(record) for user_id, record in cur.execute("SELECT user_id, data FROM user_data")}
+            return data
+
+    def update(self, payload: Dict[str, Any]) -> None:
+        with self._lock, self._conn:
+            for path, value in payload.items():
+                head, *rest = path.split("/")
+                writer = self._writers.get(head)
+                if writer is None:
+                    self._write_setting(head, rest, value)
+                else:
+                    writer(rest, value)
+
+    def _write_setting(self, key: str, rest: List[str], value: Any) -> None:
+        if rest:
+            row = self._conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+            value = self._set_nested(json.loads(row[0]) if row else None, rest, value)
+        if value is None:
+            self._conn.execute("DELETE FROM settings WHERE key = ?", (key,))
+        else:
+            self._conn.execute(
+                "INSERT INTO settings (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, json.dumps(value, ensure_ascii=False)),
+            )
+
+    def _write_votes_popolare(self, rest: List[str], value: Any) -> None:
+        if len(rest) == 2:
+            artist, judge = rest
+            if value is None:
+                self._conn.execute("DELETE FROM votes_popolare WHERE artist = ? AND judge = ?", (artist, int(judge)))
+            else:
+                self._conn.execute(
+                    "INSERT INTO votes_popolare (artist, judge, score) VALUES (?, ?, ?) "
+                    "ON CONFLICT(artist, judge) DO UPDATE SET score = excluded.score",
+                    (artist, int(judge), value),
+                )
+            return
+        if rest:
+            self._conn.execute("DELETE FROM votes_popolare WHERE artist = ?", (rest[0],))
+            value = {rest[0]: value or {}}
+        else:
+            self._conn.execute("DELETE FROM votes_popolare")
+        self._conn.executemany(
+            "INSERT INTO votes_popolare (artist, judge, score) VALUES (?, ?, ?)",
+            [(artist, int(judge), score) for artist, judges in (value or {}).items() for judge, score in judges.items()],
+        )
+
+    def _write_votes_tecnica(self, rest: List[str], value: Any) -> None:
+        if len(rest) == 3:
+            artist, judge, ambito = rest
+            self._conn.execute("DELETE FROM votes_tecnica WHERE artist = ? AND judge = ? AND ambito = ?", (artist, int(judge), ambito))
+            value = {artist: {judge: {ambito: value}}} if value is not None else {}
+        elif len(rest) == 2:
+            artist, judge = rest
+            self._conn.execute("DELETE FROM votes_tecnica WHERE artist = ? AND judge = ?", (artist, int(judge)))
+            value = {artist: {judge: value or {}}}
+        elif len(rest) == 1:
+            self._conn.execute("DELETE FROM votes_tecnica WHERE artist = ?", (rest[0],))
+            value = {rest[0]: value or {}}
+        else:
+            self._conn.execute("DELETE FROM votes_tecnica")
+        self._conn.executemany(
+            "INSERT INTO votes_tecnica (artist, judge, ambito, score) VALUES (?, ?, ?, ?)",
+            [
+                (artist, int(judge), ambito, score)
+                for artist, judges in (value or {}).items()
+                for judge, aspects in judges.items()
+                for ambito, score in aspects.items()
+            ],
+        )
+
+    def _write_judges(self, jury_type: str, rest: List[str], value: Any) -> None:
+        if rest:
+            # Un solo membro: 'judges_<giuria>/<chat_id>' -> true/None
+            if value:
+                self._conn.execute("INSERT OR IGNORE INTO judges (chat_id, jury_type) VALUES (?, ?)", (int(rest[0]), jury_type))
+            else:
+                self._conn.execute("DELETE FROM judges WHERE jury_type = ? AND chat_id = ?", (jury_type, int(rest[0])))
+            return
+        self._conn.execute("DELETE FROM judges WHERE jury_type = ?", (jury_type,))
+        self._conn.executemany(
+            "INSERT INTO judges (chat_id, jury_type) VALUES (?, ?)",
+            [(int(chat_id), jury_type) for chat_id in value or []],
+        )
+
+    def _write_owners(self, rest: List[str], value: Any) -> None:
+        if rest:
+            if value:
+                self._conn.execute("INSERT OR IGNORE INTO owners (chat_id) VALUES (?)", (int(rest[0]),))
+            else:
+                self._conn.execute("DELETE FROM owners WHERE chat_id = ?", (int(rest[0]),))
+            return
+        self._conn.execute("DELETE FROM owners")
+        self._conn.executemany("INSERT INTO owners (chat_id) VALUES (?)", [(int(chat_id),) for chat_id in value or []])
+
+    def _write_artists(self, rest: List[str], value: Any) -> None:
+        if not rest:
+            self._conn.execute("DELETE FROM artists")
+            for key, record in (value or {}).items():
+                self._write_artists([key], record)
+            return
+        key = rest[0]
+        if len(rest) > 1:
+            row = self._conn.execute("SELECT data FROM artists WHERE key = ?", (key,)).fetchone()
+            value = self._set_nested(json.loads(row[0]) if row else None, rest[1:], value)
+        if value is None:
+            self._conn.execute("DELETE FROM artists WHERE key = ?", (key,))
+        else:
+            self._conn.execute(
+                "INSERT INTO artists (key, data) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+                (key, json.dumps(value, ensure_ascii=False)),
+            )
+
+    def _write_conversations(self, rest: List[str], value: Any) -> None:
+        if len(rest) == 2:
+            name, key = rest
+            if value is None:
+                self._conn.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, key))
+            else:
+                self._conn.execute(
+                    "INSERT INTO conversations (name, key, state) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name, key) DO UPDATE SET state = excluded.state",
+                    (name, key, json.dumps(value)),
+                )
+            return
+        if rest:
+            self._conn.execute("DELETE FROM conversations WHERE name = ?", (rest[0],))
+            value = {rest[0]: value or {}}
+        else:
+            self._conn.execute("DELETE FROM conversations")
+        self._conn.executemany(
+            "INSERT INTO conversations (name, key, state) VALUES (?, ?, ?)",
+            [(name, key, json.dumps(state)) for name, states in (value or {}).items() for key, state in states.items()],
+        )
+
+    def _write_user_data(self, rest: List[str], value: Any) -> None:
+        if not rest:
+            self._conn.execute("DELETE FROM user_data")
+            for user_id, record in (value or {}).items():
+                self._write_user_data([user_id], record)
+            return
+        if value is None:
+            self._conn.execute("DELETE FROM user_data WHERE user_id = ?", (int(rest[0]),))
+        else:
+            self._conn.execute(
+                "INSERT INTO user_data (user_id, data) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                (int(rest[0]), json.dumps(value, ensure_ascii=False)),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_storage(backend: str, **options) -> StorageBackend:
+    """Crea il backend indicato da STORAGE_BACKEND ("firebase" o "sqlite")."""
+    if backend == "firebase":
+        return FirebaseStorage(options["credentials_path"], options["database_url"])
+    if backend == "sqlite":
+        return SQLiteStorage(options["sqlite_path"])
+    raise ValueError(f"Backend di persistenza sconosciuto: {backend}")
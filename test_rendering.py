@@ -0,0 +1,27 @@
+"""Test di regressione per la divisione dei messaggi MarkdownV2."""
+from rendering import _scan, split_message, user_link
+
+
+def _check(text, limit):
+    chunks = split_message(text, limit)
+    for chunk in chunks:
+        assert len(chunk) <= limit
+        assert _scan(chunk) == ([], None), chunk
+    return chunks
+
+
+def test_cut_does_not_land_inside_link():
+    text = " ".join(f"*{user_link(100000 + i, 'Giudice')}*" for i in range(125))
+    assert len(_check(text, 4096)) > 1
+
+
+def test_leading_space_strip_does_not_double_marker():
+    text = "*bold _it_ " + user_link(5, "Mario") + "* tail * tail * tail " * 3
+    for chunk in _check(text, 60):
+        assert "**" not in chunk
+
+
+def test_escapes_and_nested_entities():
+    text = " ".join(f"_voto\\_{i}\\. *{user_link(i, 'Giudice')}* ||spoiler {i}||" for i in range(80))
+    for limit in (60, 97, 200, 4096):
+        _check(text, limit)
@@ -1,10 +1,9 @@
 from telegram import Update
-from telegram.helpers import escape_markdown 
+from rendering import user_link
 
 def get_benvenuto_popolare_text(update: Update) -> str:
     user = update.effective_user
-    escaped_first_name = escape_markdown(user.first_name, version=2)
-    nickname_clickable = f"[{escaped_first_name}](tg://user?id={user.id})"
+    nickname_clickable = user_link(user.id, user.first_name)
     text = (
         f"_*Benvenuto nel portale della Giuria Popolare, {nickname_clickable}\\!*_\n\n"
         "_Qui avrai la possibilità di esprimere le tue preferenze sugli artisti con un voto che va da 1 a 10\\._\n\n"
@@ -14,8 +13,7 @@ def get_benvenuto_popolare_text(update: Update) -> str:
 
 def get_benvenuto_tecnica_text(update: Update) -> str:
     user = update.effective_user
-    escaped_first_name = escape_markdown(user.first_name, version=2)
-    nickname_clickable = f"[{escaped_first_name}](tg://user?id={user.id})"
+    nickname_clickable = user_link(user.id, user.first_name)
     text = (
         f"_*Benvenuto nel portale della Giuria Tecnica, {nickname_clickable}\\!*_\n\n"
         "Siamo entusiasti di averti qui con noi\\. La tua voce conta e il tuo contributo è fondamentale "
@@ -26,16 +24,19 @@ def get_benvenuto_tecnica_text(update: Update) -> str:
 
 def get_benvenuto_prop_text(update: Update) -> str:
     user = update.effective_user
-    escaped_first_name = escape_markdown(user.first_name, version=2)
-    nickname_clickable = f"[{escaped_first_name}](tg://user?id={user.id})"
+    nickname_clickable = user_link(user.id, user.first_name)
     text = (
         f"_*Benvenuto {nickname_clickable}\\!*_\n\n"
         "Da qui potrai gestire tutto ciò che riguarda le votazioni del Festival, ti spiego in breve i vari comandi a tua disposizione\\:\n\n"
         "_\\- /set, questo comando ti permette di impostare il numero massimo di giudici che possono effettuare l'accesso\\._\n"
         "_Inoltre potrai cambiare, a tuo piacimento, le password per effettuare il login\\._\n"
         "_\\- /artisti, da qui avrai la possibilità di aggiungere o rimuovere gli artisti che verranno poi votati dalla giuria\\._\n"
+        "_\\- /importa, carica tutta la scaletta in una volta sola da un archivio ZIP con un CSV \\(nome, età, canzone, categoria\\) e le foto\\._\n"
         "_\\- /votazioni, quando tutto sarà pronto usa questo comando per far comparire la tastiera con tutti gli artisti, premendo su un nome_ " 
-        "_darai inizio alle votazioni per quel singolo artista\\._\n\n"
+        "_darai inizio alle votazioni per quel singolo artista\\._\n"
+        "_\\- /classifica, mostra in qualsiasi momento la classifica provvisoria e quanti giudici devono ancora votare\\._\n"
+        "_\\- /esporta, ricevi le schede di voto di ogni giudice in CSV ed Excel e i grafici della classifica per categoria\\._\n"
+        "_\\- /notifiche, oltre alla dashboard live ricevi un messaggio per ogni login e voto \\(premi di nuovo per disattivare\\)\\._\n\n"
         "*Spero sia tutto chiaro, detto ciò, in bocca al lupo e buon festival\\!*"
     )
     return text
@@ -0,0 +1,127 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from broadcast import TokenBucket
+from metrics import Counter
+
+# Contenuti dei messaggi che almeno un handler elabora (comandi compresi nel testo)
+CONSUMED_CONTENT = ("text", "photo", "document")
+
+
+def consumed_chat(data: dict) -> Optional[int]:
+    """Chat di un update grezzo (JSON del webhook) che qualche handler elabora;
+    None per i tipi che nessun handler consuma (modifiche, reazioni, sticker...)."""
+    message = data.get("message")
+    if message is not None:
+        if any(key in message for key in CONSUMED_CONTENT):
+            return (message.get("chat") or {}).get("id")
+        return None
+    query = data.get("callback_query")
+    if query is not None:
+        chat = (query.get("message") or {}).get("chat") or query.get("from") or {}
+        return chat.get("id")
+    return None
+
+
+@dataclass
+class ChatAllowance:
+    bucket: TokenBucket
+    blocked_until: float = 0.0
+    window_started: float = 0.0
+    replies: int = 0
+
+
+class IngressThrottle:
+    """Filtro davanti alla coda degli update, sul JSON grezzo (prima della
+    deserializzazione), così una chat rumorosa costa quasi nulla.
+
+    - gli update che nessun handler consuma vengono scartati subito;
+    - ogni chat ha un token bucket (`rate` update al secondo, burst `burst`),
+      tranne quelle per cui `exempt` è vero (proprietari e giudici autenticati);
+    - dopo `free_attempts` password sbagliate la chat resta in attesa per
+      `cooldown` secondi, che raddoppiano a ogni nuovo errore fino a `max_cooldown`;
+    - al massimo `reply_limit` risposte per chat ogni `reply_window` secondi.
+
+    Le chat seguite sono al massimo `max_chats`: oltre si scarta la meno recente.
+    """
+
+    def __init__(
+        self,
+        dropped: Counter,
+        rate: float = 1.0,
+        burst: float = 20,
+        free_attempts: int = 3,
+        cooldown: float = 10.0,
+        max_cooldown: float = 900.0,
+        reply_limit: int = 30,
+        reply_window: float = 60.0,
+        max_chats: int = 50000,
+        exempt: Optional[Callable[[int], bool]] = None,
+    ):
+        self.dropped = dropped
+        self.rate = rate
+        self.burst = burst
+        self.free_attempts = free_attempts
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.reply_limit = reply_limit
+        self.reply_window = reply_window
+        self.max_chats = max_chats
+        self.exempt = exempt
+        self._chats: "OrderedDict[int, ChatAllowance]" = OrderedDict()
+
+    def _allowance(self, chat_id: int) -> ChatAllowance:
+        allowance = self._chats.get(chat_id)
+        if allowance is None:
+            allowance = self._chats[chat_id] = ChatAllowance(TokenBucket(self.rate, self.burst))
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return allowance
+
+    def admit(self, data: dict) -> Optional[str]:
+        """None se l'update va elaborato, altrimenti il motivo dello scarto."""
+        chat_id = consumed_chat(data)
+        if chat_id is None:
+            reason = "tipo"
+        elif self.exempt is not None and self.exempt(chat_id):
+            return None
+        else:
+            allowance = self._allowance(chat_id)
+            if time.monotonic() < allowance.blocked_until:
+                reason = "attesa"
+            elif not allowance.bucket.try_acquire():
+                reason = "limite"
+            else:
+                return None
+        self.dropped.inc(reason=reason)
+        return reason
+
+    def login_failed(self, chat_id: int, failures: int) -> float:
+        """Registra l'ennesima password sbagliata; restituisce l'attesa imposta (0 se nessuna)."""
+        if failures < self.free_attempts:
+            return 0.0
+        seconds = min(self.cooldown * 2 ** min(failures - self.free_attempts, 16), self.max_cooldown)
+        self._allowance(chat_id).blocked_until = time.monotonic() + seconds
+        return seconds
+
+    def allow_reply(self, chat_id: int) -> bool:
+        allowance = self._allowance(chat_id)
+        now = time.monotonic()
+        if now - allowance.window_started >= self.reply_window:
+            allowance.window_started = now
+            allowance.replies = 0
+        if allowance.replies >= self.reply_limit:
+            return False
+        allowance.replies += 1
+        return True
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "chats": len(self._chats),
+            "waiting": sum(1 for allowance in self._chats.values() if allowance.blocked_until > now),
+        }
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Set
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+
+class TimedUpdateQueue(asyncio.Queue):
+    """asyncio.Queue che ricorda quando ogni elemento è stato accodato, per
+    poter misurare l'età dell'update più vecchio in attesa.
+
+    Con l'elaborazione concorrente l'Application crea un task per ogni update
+    appena lo estrae: `max_in_flight` limita gli update estratti e non ancora
+    completati (task_done), così gli altri restano qui e il limite della coda,
+    il 503 e le metriche di profondità ed età valgono davvero.
+    """
+
+    def __init__(self, maxsize: int = 0, max_in_flight: int = 0):
+        super().__init__(maxsize)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._slot_free = asyncio.Event()
+
+    async def get(self):
+        # Un solo consumatore (il fetcher dell'Application): basta un evento
+        while self.max_in_flight and self.in_flight >= self.max_in_flight:
+            self._slot_free.clear()
+            await self._slot_free.wait()
+        item = await super().get()
+        self.in_flight += 1
+        return item
+
+    def task_done(self):
+        super().task_done()
+        # Allo spegnimento l'Application svuota la coda con get_nowait: niente da liberare
+        if self.in_flight > 0:
+            self.in_flight -= 1
+            self._slot_free.set()
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self._enqueued_at: Deque[float] = deque()
+
+    def _put(self, item):
+        super()._put(item)
+        self._enqueued_at.append(time.monotonic())
+
+    def _get(self):
+        self._enqueued_at.popleft()
+        return super()._get()
+
+    @property
+    def oldest_age(self) -> float:
+        return time.monotonic() - self._enqueued_at[0] if self._enqueued_at else 0.0
+
+
+class UpdateIngress:
+    """Accetta gli update del webhook: scarta i duplicati (finestra scorrevole
+    di update_id) e li accoda nella update_queue dell'Application, che li
+    elabora in background. Se la coda resta piena oltre `full_wait` secondi
+    l'update viene rifiutato, così Telegram lo riconsegna più tardi."""
+
+    def __init__(self, queue: TimedUpdateQueue, dedup_window: int = 10000, full_wait: float = 1.0):
+        self.queue = queue
+        self.dedup_window = dedup_window
+        self.full_wait = full_wait
+        self._seen: Set[int] = set()
+        self._seen_order: Deque[int] = deque()
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+
+    def _remember(self, update_id: int) -> None:
+        self._seen.add(update_id)
+        self._seen_order.append(update_id)
+        if len(self._seen_order) > self.dedup_window:
+            self._seen.discard(self._seen_order.popleft())
+
+    async def submit(self, update: Update) -> str:
+        """Restituisce "queued", "duplicate" oppure "full"."""
+        if update.update_id in self._seen:
+            self.duplicates += 1
+            return "duplicate"
+        # Segnato subito come visto: una riconsegna concorrente non va accodata due volte
+        self._remember(update.update_id)
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self.queue.put(update), self.full_wait)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                self._seen.discard(update.update_id)
+                logger.warning(f"Coda update piena ({self.queue.qsize()}): update {update.update_id} rifiutato")
+                return "full"
+        self.accepted += 1
+        return "queued"
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.queue.qsize(),
+            "maxsize": self.queue.maxsize,
+            "in_flight": self.queue.in_flight,
+            "oldest_age": round(self.queue.oldest_age, 3),
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,256 @@
+import math
+from array import array
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+NAN = float("nan")
+
+
+class JudgeRows:
+    """Tabella giudice -> riga di una giuria: le righe si assegnano in ordine di
+    primo voto e non cambiano finché la tabella non viene svuotata."""
+
+    def __init__(self):
+        self.judge_ids: List[int] = []
+        self._rows: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.judge_ids)
+
+    def get(self, judge_id: int, create: bool) -> Optional[int]:
+        row = self._rows.get(judge_id)
+        if row is None and create:
+            row = self._rows[judge_id] = len(self.judge_ids)
+            self.judge_ids.append(judge_id)
+        return row
+
+    def clear(self) -> None:
+        self.judge_ids.clear()
+        self._rows.clear()
+
+
+class VoteStore:
+    """Voti in forma compatta: una tabella giudice -> riga per ciascuna giuria
+    e, per ogni artista, un array di double indicizzato per riga del giudice
+    (popolare) o per riga * numero di ambiti + ambito (tecnica). NaN = voto
+    mancante. Le tabelle sono separate, così gli array tecnici crescono solo
+    con i giudici tecnici.
+
+    Le chiavi sono canoniche fin dall'ingresso (id giudice int, ambito come
+    indice in `ambiti`); `encode_path`/`load` convertono da e verso la forma
+    salvata sul backend ({artista: {id: voto}} e {artista: {id: {ambito: voto}}},
+    con '/' sostituito da '_' nei nomi degli ambiti).
+    """
+
+    def __init__(self, ambiti: List[str]):
+        self.ambiti = list(ambiti)
+        self._ambito_index: Dict[str, int] = {}
+        for i, name in enumerate(self.ambiti):
+            self._ambito_index[name] = i
+            self._ambito_index[self.stored_ambito(name)] = i
+        self.popular_rows = JudgeRows()
+        self.technical_rows = JudgeRows()
+        self.popular: Dict[str, array] = {}
+        self.technical: Dict[str, array] = {}
+
+    # --- chiavi canoniche -------------------------------------------------
+
+    @staticmethod
+    def canonical_judge(judge_id: Hashable) -> int:
+        return int(judge_id)
+
+    @staticmethod
+    def stored_ambito(name: str) -> str:
+        # Firebase non accetta '/' nelle chiavi
+        return name.replace('/', '_')
+
+    def ambito_index(self, name: str) -> int:
+        return self._ambito_index[name]
+
+    def _popular_row(self, judge_id: Hashable, create: bool) -> Optional[int]:
+        return self.popular_rows.get(self.canonical_judge(judge_id), create)
+
+    def _technical_row(self, judge_id: Hashable, create: bool) -> Optional[int]:
+        return self.technical_rows.get(self.canonical_judge(judge_id), create)
+
+    @staticmethod
+    def _grow(values: array, size: int) -> None:
+        if len(values) < size:
+            values.extend([NAN] * (size - len(values)))
+
+    # --- lettura/scrittura ------------------------------------------------
+
+    def get_popular(self, artist_key: str, judge_id: Hashable) -> Optional[float]:
+        row = self._popular_row(judge_id, create=False)
+        values = self.popular.get(artist_key)
+        if row is None or values is None or row >= len(values) or math.isnan(values[row]):
+            return None
+        return values[row]
+
+    def set_popular(self, artist_key: str, judge_id: Hashable, value: Optional[float]) -> None:
+        row = self._popular_row(judge_id, create=True)
+        values = self.popular.setdefault(artist_key, array('d'))
+        self._grow(values, row + 1)
+        values[row] = NAN if value is None else value
+
+    def get_technical(self, artist_key: str, judge_id: Hashable, ambito: int) -> Optional[float]:
+        row = self._technical_row(judge_id, create=False)
+        values = self.technical.get(artist_key)
+        index = None if row is None else row * len(self.ambiti) + ambito
+        if index is None or values is None or index >= len(values) or math.isnan(values[index]):
+            return None
+        return values[index]
+
+    def set_technical(self, artist_key: str, judge_id: Hashable, ambito: int, value: Optional[float]) -> None:
+        row = self._technical_row(judge_id, create=True)
+        width = len(self.ambiti)
+        values = self.technical.setdefault(artist_key, array('d'))
+        self._grow(values, (row + 1) * width)
+        values[row * width + ambito] = NAN if value is None else value
+
+    def technical_ballot(self, artist_key: str, judge_id: Hashable) -> Dict[str, float]:
+        """Voti tecnici di un giudice per un artista, con i nomi degli ambiti."""
+        ballot = {}
+        for i, name in enumerate(self.ambiti):
+            value = self.get_technical(artist_key, judge_id, i)
+            if value is not None:
+                ballot[name] = value
+        return ballot
+
+    def iter_popular(self, artist_key: str) -> Iterator[Tuple[int, float]]:
+        for row, value in enumerate(self.popular.get(artist_key, ())):
+            if not math.isnan(value):
+                yield self.popular_rows.judge_ids[row], value
+
+    def iter_technical(self, artist_key: str) -> Iterator[Tuple[int, List[float]]]:
+        """Per ogni giudice tecnico che ha votato: (id, voti presenti in ordine di ambito)."""
+        values = self.technical.get(artist_key)
+        if values is None:
+            return
+        width = len(self.ambiti)
+        for row in range(len(values) // width):
+            scores = [v for v in values[row * width:(row + 1) * width] if not math.isnan(v)]
+            if scores:
+                yield self.technical_rows.judge_ids[row], scores
+
+    def count_popular(self) -> int:
+        return sum(1 for values in self.popular.values() for value in values if not math.isnan(value))
+
+    def count_technical(self) -> int:
+        """Numero di schede tecniche (giudice, artista) con almeno un voto."""
+        return sum(1 for artist_key in self.technical for _ in self.iter_technical(artist_key))
+
+    @property
+    def artist_keys(self) -> List[str]:
+        return list(dict.fromkeys([*self.popular, *self.technical]))
+
+    def drop_artist(self, artist_key: str) -> None:
+        self.popular.pop(artist_key, None)
+        self.technical.pop(artist_key, None)
+
+    def clear(self) -> None:
+        self.popular_rows.clear()
+        self.technical_rows.clear()
+        self.popular.clear()
+        self.technical.clear()
+
+    # --- codec da/verso la forma salvata ------------------------------------
+
+    def _encode_popular_artist(self, artist_key: str) -> Dict[str, float]:
+        return {str(judge_id): value for judge_id, value in self.iter_popular(artist_key)}
+
+    def _encode_ballot(self, artist_key: str, judge_id: Hashable) -> Optional[Dict[str, float]]:
+        ballot = {self.stored_ambito(name): value for name, value in self.technical_ballot(artist_key, judge_id).items()}
+        return ballot or None
+
+    def _encode_technical_artist(self, artist_key: str) -> Dict[str, Dict[str, float]]:
+        encoded = {}
+        for judge_id in self.technical_rows.judge_ids:
+            ballot = self._encode_ballot(artist_key, judge_id)
+            if ballot:
+                encoded[str(judge_id)] = ballot
+        return encoded
+
+    def encode_path(self, head: str, rest: List[str]) -> Any:
+        """Valore da salvare per 'votes_popolare[/artista[/giudice]]' o
+        'votes_tecnica[/artista[/giudice[/ambito]]]' (None = cancella)."""
+        if head == "votes_popolare":
+            if not rest:
+                return {artist: self._encode_popular_artist(artist) for artist in self.popular}
+            if len(rest) == 1:
+                return self._encode_popular_artist(rest[0]) or None
+            return self.get_popular(rest[0], rest[1])
+        if not rest:
+            return {artist: self._encode_technical_artist(artist) for artist in self.technical}
+        if len(rest) == 1:
+            return self._encode_technical_artist(rest[0]) or None
+        if len(rest) == 2:
+            return self._encode_ballot(rest[0], rest[1])
+        return self.get_technical(rest[0], rest[1], self.ambito_index(rest[2]))
+
+    def technical_path(self, artist_key: str, judge_id: Hashable, ambito: int) -> str:
+        """Percorso salvato di un singolo voto tecnico."""
+        return f"votes_tecnica/{artist_key}/{self.canonical_judge(judge_id)}/{self.stored_ambito(self.ambiti[ambito])}"
+
+    def _clear_path(self, head: str, rest: List[str]) -> None:
+        if head == "votes_popolare":
+            if not rest:
+                self.popular.clear()
+            elif len(rest) == 1:
+                self.popular.pop(rest[0], None)
+            elif self._popular_row(rest[1], create=False) is not None:
+                self.set_popular(rest[0], rest[1], None)
+            return
+        if not rest:
+            self.technical.clear()
+        elif len(rest) == 1:
+            self.technical.pop(rest[0], None)
+        elif self._technical_row(rest[1], create=False) is not None:
+            ambiti = range(len(self.ambiti)) if len(rest) == 2 else [self.ambito_index(rest[2])]
+            for ambito in ambiti:
+                self.set_technical(rest[0], rest[1], ambito, None)
+
+    def replace_path(self, head: str, rest: List[str], value: Any) -> Set[str]:
+        """Sostituisce i voti sotto `head/rest` con `value` nella forma salvata
+        (None = cancella), come un put ricevuto dal backend; restituisce gli
+        artisti i cui voti sono cambiati."""
+        if _prune(self.encode_path(head, rest)) == _prune(value):
+            return set()
+        before = set(self.popular if head == "votes_popolare" else self.technical)
+        self._clear_path(head, rest)
+        # Riporta il valore alla forma completa {artista: ...} e lo ricarica
+        for key in reversed(rest):
+            value = {key: value} if value is not None else None
+        if head == "votes_popolare":
+            self._load_popular(value)
+        else:
+            self._load_technical(value)
+        if rest:
+            return {rest[0]}
+        return before | set(self.popular if head == "votes_popolare" else self.technical)
+
+    def _load_popular(self, votes_popolare: Optional[dict]) -> None:
+        for artist_key, judges in (votes_popolare or {}).items():
+            for judge_id, value in (judges or {}).items():
+                if value is not None:
+                    self.set_popular(artist_key, judge_id, float(value))
+
+    def _load_technical(self, votes_tecnica: Optional[dict]) -> None:
+        for artist_key, judges in (votes_tecnica or {}).items():
+            for judge_id, aspects in (judges or {}).items():
+                for name, value in (aspects or {}).items():
+                    if value is not None:
+                        self.set_technical(artist_key, judge_id, self.ambito_index(name), float(value))
+
+    def load(self, votes_popolare: Optional[dict], votes_tecnica: Optional[dict]) -> None:
+        """Sostituisce il contenuto con i voti letti dal backend."""
+        self.clear()
+        self._load_popular(votes_popolare)
+        self._load_technical(votes_tecnica)
+
+
+def _prune(value: Any) -> Any:
+    """Forma normalizzata per i confronti: senza nodi vuoti, chiavi stringa e voti float."""
+    if isinstance(value, dict):
+        pruned = {str(key): _prune(child) for key, child in value.items()}
+        return {key: child for key, child in pruned.items() if child is not None} or None
+    return None if value is None else float(value)